@@ -31,6 +31,10 @@ def create_app(config_class=None):
     # Register blueprints
     register_blueprints(app)
 
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
+
     # Register error handlers
     register_error_handlers(app)
 
@@ -64,7 +68,19 @@ def configure_app(app, config_class):
         SQLALCHEMY_ENGINE_OPTIONS={
             'pool_pre_ping': True,
             'pool_recycle': 300,
-        }
+        },
+        UPLOAD_FOLDER=os.getenv('UPLOAD_FOLDER'),
+        UPLOAD_WORKERS=int(os.getenv('UPLOAD_WORKERS', '2')),
+        CONTACT_VALIDATION_WORKERS=int(os.getenv('CONTACT_VALIDATION_WORKERS', '0')),  # used only with deliverability checks
+        INGEST_COMMIT_EVERY=int(os.getenv('INGEST_COMMIT_EVERY', '500')),
+        INGEST_COMMIT_THRESHOLD=int(os.getenv('INGEST_COMMIT_THRESHOLD', '5000')),
+        INGEST_STREAMING_MIN_BYTES=int(os.getenv('INGEST_STREAMING_MIN_BYTES', str(1024 * 1024))),
+        BATCH_PARSE_PROCESSES=int(os.getenv('BATCH_PARSE_PROCESSES', '0')) or None,
+        METRICS_TOKEN=os.getenv('METRICS_TOKEN'),
+        ANALYTICS_CACHE_BACKEND=os.getenv('ANALYTICS_CACHE_BACKEND', 'lru'),  # 'lru', 'sqlite' or 'none'
+        ANALYTICS_CACHE_PATH=os.getenv('ANALYTICS_CACHE_PATH'),
+        ANALYTICS_CACHE_MAX_BYTES=int(os.getenv('ANALYTICS_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+        ANALYTICS_ENGINE=os.getenv('ANALYTICS_ENGINE', 'sql')  # 'sql' or 'columnar'
     )
 
     # Load additional configuration if provided
@@ -136,12 +152,14 @@ def register_blueprints(app):
     from app.views.dashboard import dashboard_bp
     from app.views.upload import upload_bp
     from app.views.payment import payment_bp
+    from app.views.metrics import metrics_bp
 
     # Main application blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(upload_bp, url_prefix='/upload')
     app.register_blueprint(payment_bp, url_prefix='/payment')
+    app.register_blueprint(metrics_bp)
 
 
 def register_error_handlers(app):
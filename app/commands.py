@@ -0,0 +1,20 @@
+# app/commands.py
+import click
+from app.models import db, School
+from app.services.aggregates import backfill_school_aggregates
+
+
+def register_commands(app):
+    """Register the flask CLI maintenance commands"""
+
+    @app.cli.command('backfill-aggregates')
+    @click.option('--school-id', type=int, help='Only this school (default: every school)')
+    def backfill_aggregates(school_id):
+        """Build aggregates, student summaries and trend rollups missing for older exams"""
+        if school_id:
+            school_ids = [school_id]
+        else:
+            school_ids = [school for school, in db.session.query(School.id).order_by(School.id)]
+        for school in school_ids:
+            backfill_school_aggregates(school)
+        click.echo(f"Backfilled aggregates for {len(school_ids)} school(s)")
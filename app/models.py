@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db, login_manager
 from flask_login import UserMixin
@@ -5,7 +6,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import phonenumbers
 from email_validator import validate_email, EmailNotValidError
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, true
 
 
 @login_manager.user_loader
@@ -86,6 +87,7 @@ class School(db.Model):
     is_active = db.Column(db.Boolean, default=False)
     contact_email = db.Column(db.String(120))
     contact_phone = db.Column(db.String(20))
+    data_version = db.Column(db.Integer, default=0, nullable=False)  # bumped by every upload to invalidate cached analytics
 
     # Relationships
     users = db.relationship('User', back_populates='school')
@@ -221,6 +223,8 @@ class Exam(db.Model):
     academic_year = db.Column(db.String(10))
     template_version = db.Column(db.String(20))
     upload_format = db.Column(db.String(50))
+    # False while a chunked upload is still writing results; analytics skip such exams
+    is_complete = db.Column(db.Boolean, default=True, nullable=False, server_default=true())
 
     # Relationships
     school = db.relationship('School', back_populates='exams')
@@ -231,6 +235,10 @@ class Exam(db.Model):
                              secondary='exam_results',
                              back_populates='exams',
                              viewonly=True)
+    student_summaries = db.relationship('ExamStudentSummary', back_populates='exam',
+                                        cascade='all, delete-orphan')
+    result_aggregates = db.relationship('ResultAggregate', back_populates='exam',
+                                        cascade='all, delete-orphan')
 
     def get_subject_ids(self):
         """Returns list of subject IDs for this exam"""
@@ -252,6 +260,10 @@ class Exam(db.Model):
 
 class ExamResult(db.Model):
     __tablename__ = 'exam_results'
+    __table_args__ = (
+        # Per-subject marks of an exam, for sorting student tables by a subject
+        db.Index('ix_exam_results_exam_subject_student', 'exam_id', 'subject_id', 'student_id', 'marks'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), index=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), index=True)
@@ -259,7 +271,8 @@ class ExamResult(db.Model):
     marks = db.Column(db.Float)
     grade = db.Column(db.String(2))
     comments = db.Column(db.Text)
-    position = db.Column(db.Integer)
+    position = db.Column(db.Integer)  # subject/paper rank within the class, ties share a rank
+    stream_position = db.Column(db.Integer)  # subject/paper rank within the stream
     paper_number = db.Column(db.Integer)
     remark = db.Column(db.String(50))
 
@@ -274,6 +287,109 @@ class ExamResult(db.Model):
         return (self.marks / max_score) * 100 if max_score else 0
 
 
+class ExamStudentSummary(db.Model):
+    """Per-student exam totals and overall positions, rebuilt by the ranking stage after each upload"""
+    __tablename__ = 'exam_student_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('exam_id', 'student_id', name='uq_exam_student_summary'),
+        # Keyset pagination of class and stream tables by total or mean marks
+        db.Index('ix_exam_student_summaries_class_total', 'exam_id', 'academic_class_id', 'total_marks', 'student_id'),
+        db.Index('ix_exam_student_summaries_class_mean', 'exam_id', 'academic_class_id', 'mean_marks', 'student_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), index=True)
+    academic_class_id = db.Column(db.Integer, db.ForeignKey('academic_classes.id'))
+    total_marks = db.Column(db.Float)
+    result_count = db.Column(db.Integer)
+    mean_marks = db.Column(db.Float)
+    class_position = db.Column(db.Integer)  # rank by total marks within the class, ties share a rank
+    stream_position = db.Column(db.Integer)  # rank by total marks within the stream
+
+    exam = db.relationship('Exam', back_populates='student_summaries')
+    student = db.relationship('Student')
+    academic_class = db.relationship('AcademicClass')
+
+
+class ResultAggregate(db.Model):
+    """
+    Mark statistics per (exam, class stream, subject), rebuilt for an exam whenever it is
+    ingested so analytics never rescan exam_results. Means, pass rates and variances are
+    derived from the sums, so rows can be rolled up across exams, classes and subjects.
+    """
+    __tablename__ = 'result_aggregates'
+    __table_args__ = (
+        db.UniqueConstraint('exam_id', 'academic_class_id', 'subject_id', name='uq_result_aggregate'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), index=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), index=True)
+    academic_class_id = db.Column(db.Integer, db.ForeignKey('academic_classes.id'))
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'))
+    result_count = db.Column(db.Integer, default=0)
+    student_count = db.Column(db.Integer, default=0)  # distinct students within this exam
+    marks_sum = db.Column(db.Float, default=0)
+    marks_sum_sq = db.Column(db.Float, default=0)
+    marks_max = db.Column(db.Float)
+    pass_count = db.Column(db.Integer, default=0)
+    grade_counts = db.Column(db.Text)  # JSON encoded {grade: count}
+    mark_histogram = db.Column(db.Text)  # JSON encoded counts per one-mark bin, see services/sketches.py
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    exam = db.relationship('Exam', back_populates='result_aggregates')
+    academic_class = db.relationship('AcademicClass')
+    subject = db.relationship('Subject')
+
+    @property
+    def mean(self):
+        return self.marks_sum / self.result_count if self.result_count else None
+
+    @property
+    def pass_rate(self):
+        return self.pass_count * 100 / self.result_count if self.result_count else None
+
+    @property
+    def variance(self):
+        if not self.result_count:
+            return None
+        mean = self.marks_sum / self.result_count
+        return max(self.marks_sum_sq / self.result_count - mean * mean, 0)
+
+    @property
+    def grades(self):
+        return json.loads(self.grade_counts) if self.grade_counts else {}
+
+
+class TrendRollup(db.Model):
+    """
+    A school's mark totals per calendar month or school term, summed from the result
+    aggregates after each upload so trend charts read a handful of rows per school.
+    """
+    __tablename__ = 'trend_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('school_id', 'period_type', 'period', name='uq_trend_rollup'),
+        db.Index('ix_trend_rollups_school_period_start', 'school_id', 'period_type', 'period_start'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'))
+    period_type = db.Column(db.String(10))  # 'month', 'term'
+    period = db.Column(db.String(20))  # '2024-03' for months, '2024 Term 1' for terms
+    period_start = db.Column(db.DateTime)  # first day of the month, earliest exam date of the term
+    exam_count = db.Column(db.Integer, default=0)
+    result_count = db.Column(db.Integer, default=0)
+    marks_sum = db.Column(db.Float, default=0)
+    pass_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def mean(self):
+        return self.marks_sum / self.result_count if self.result_count else None
+
+    @property
+    def pass_rate(self):
+        return self.pass_count * 100 / self.result_count if self.result_count else None
+
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
@@ -289,4 +405,55 @@ class Payment(db.Model):
     payer_phone = db.Column(db.String(20))
 
     # Relationships
-    school = db.relationship('School', back_populates='payments')
\ No newline at end of file
+    school = db.relationship('School', back_populates='payments')
+
+class UploadJob(db.Model):
+    __tablename__ = 'upload_jobs'
+    id = db.Column(db.String(36), primary_key=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), index=True)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'))
+    filename = db.Column(db.String(255))
+    file_path = db.Column(db.String(512))
+    state = db.Column(db.String(20), default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    students_total = db.Column(db.Integer)
+    students_processed = db.Column(db.Integer, default=0)
+    message = db.Column(db.Text)
+    errors = db.Column(db.Text)  # JSON encoded list of row errors
+    summary = db.Column(db.Text)  # JSON encoded per-workbook results of a batch upload
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Serializable job status for polling clients"""
+        return {
+            'id': self.id,
+            'state': self.state,
+            'filename': self.filename,
+            'exam_id': self.exam_id,
+            'progress': {
+                'students_processed': self.students_processed or 0,
+                'students_total': self.students_total
+            },
+            'message': self.message,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'summary': json.loads(self.summary) if self.summary else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class IngestCheckpoint(db.Model):
+    __tablename__ = 'ingest_checkpoints'
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), index=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'))
+    source_digest = db.Column(db.String(64), index=True)  # SHA-256 of the uploaded file
+    students_committed = db.Column(db.Integer, default=0)  # students handled, in file order
+    status = db.Column(db.String(20), default='in_progress')  # 'in_progress', 'failed', 'complete'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    exam = db.relationship('Exam')
@@ -0,0 +1,211 @@
+# app/services/aggregates.py
+import json
+import logging
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import func, case, delete, insert, distinct, exists
+from app.models import db, Exam, ExamResult, ExamStudentSummary, ResultAggregate, Student, TrendRollup
+from app.services.sketches import HISTOGRAM_BINS, MarkDistribution, histogram_bin
+
+logger = logging.getLogger(__name__)
+
+# Marks at or above this count as a pass in every aggregate
+PASS_MARK = 50
+
+
+def refresh_exam_aggregates(exam_id):
+    """
+    Rebuild the ResultAggregate rows of one exam from its results, in the caller's
+    transaction. Cost depends only on the size of this exam.
+    Returns the number of aggregate rows written.
+    """
+    school_id = db.session.query(Exam.school_id).filter(Exam.id == exam_id).scalar()
+    group = (Student.academic_class_id, ExamResult.subject_id)
+
+    stats = (db.session.query(
+        *group,
+        func.count(ExamResult.marks),
+        func.count(distinct(ExamResult.student_id)),
+        func.sum(ExamResult.marks),
+        func.sum(ExamResult.marks * ExamResult.marks),
+        func.max(ExamResult.marks),
+        func.sum(case((ExamResult.marks >= PASS_MARK, 1), else_=0))
+    )
+             .select_from(ExamResult)
+             .join(Student, ExamResult.student_id == Student.id)
+             .filter(ExamResult.exam_id == exam_id, ExamResult.marks.isnot(None))
+             .group_by(*group)
+             .all())
+
+    grades = {}
+    grade_rows = (db.session.query(*group, ExamResult.grade, func.count(ExamResult.id))
+                  .select_from(ExamResult)
+                  .join(Student, ExamResult.student_id == Student.id)
+                  .filter(ExamResult.exam_id == exam_id, ExamResult.marks.isnot(None))
+                  .group_by(*group, ExamResult.grade))
+    for class_id, subject_id, grade, count in grade_rows:
+        grades.setdefault((class_id, subject_id), {})[grade] = count
+
+    histograms = {}
+    mark_bin = histogram_bin(ExamResult.marks)
+    bin_rows = (db.session.query(*group, mark_bin, func.count(ExamResult.id))
+                .select_from(ExamResult)
+                .join(Student, ExamResult.student_id == Student.id)
+                .filter(ExamResult.exam_id == exam_id, ExamResult.marks.isnot(None))
+                .group_by(*group, mark_bin))
+    for class_id, subject_id, index, count in bin_rows:
+        histograms.setdefault((class_id, subject_id), [0] * HISTOGRAM_BINS)[index] = count
+
+    rows = [{
+        'school_id': school_id,
+        'exam_id': exam_id,
+        'academic_class_id': class_id,
+        'subject_id': subject_id,
+        'result_count': result_count,
+        'student_count': student_count,
+        'marks_sum': marks_sum or 0,
+        'marks_sum_sq': marks_sum_sq or 0,
+        'marks_max': marks_max,
+        'pass_count': pass_count or 0,
+        'grade_counts': json.dumps(grades.get((class_id, subject_id), {})),
+        'mark_histogram': json.dumps(histograms.get((class_id, subject_id), [0] * HISTOGRAM_BINS))
+    } for class_id, subject_id, result_count, student_count, marks_sum, marks_sum_sq, marks_max, pass_count in stats]
+
+    db.session.execute(delete(ResultAggregate).where(ResultAggregate.exam_id == exam_id))
+    if rows:
+        db.session.execute(insert(ResultAggregate), rows)
+
+    logger.debug(f"Refreshed {len(rows)} result aggregates for exam ID: {exam_id}")
+    return len(rows)
+
+
+def withdraw_exam_aggregates(exam_id):
+    """
+    Delete the aggregates and student summaries of an exam that is being rewritten,
+    in the caller's transaction, so analytics stop reporting its previous results.
+    """
+    db.session.execute(delete(ResultAggregate).where(ResultAggregate.exam_id == exam_id))
+    db.session.execute(delete(ExamStudentSummary).where(ExamStudentSummary.exam_id == exam_id))
+
+
+def backfill_school_aggregates(school_id):
+    """
+    Build aggregates, student summaries and trend rollups for exams ingested before
+    they existed. Run once per school with `flask backfill-aggregates`, not from
+    request handlers: concurrent runs would race to write the same rows.
+    """
+    from app.services.ranking import rank_exam
+    from app.services.trends import refresh_school_trends
+
+    has_results = exists().where(ExamResult.exam_id == Exam.id)
+    # Aggregates written before mark histograms existed are rebuilt too; exams
+    # still being uploaded (or left behind by a failed upload) are not
+    missing_aggregates = db.session.query(Exam.id).filter(
+        Exam.school_id == school_id,
+        Exam.is_complete.is_(True),
+        has_results,
+        ~exists().where(ResultAggregate.exam_id == Exam.id, ResultAggregate.mark_histogram.isnot(None))
+    ).all()
+    missing_summaries = db.session.query(Exam.id).filter(
+        Exam.school_id == school_id,
+        Exam.is_complete.is_(True),
+        has_results,
+        ~exists().where(ExamStudentSummary.exam_id == Exam.id)
+    ).all()
+
+    missing_trends = not db.session.query(exists().where(TrendRollup.school_id == school_id)).scalar()
+
+    for exam_id, in missing_aggregates:
+        refresh_exam_aggregates(exam_id)
+    for exam_id, in missing_summaries:
+        rank_exam(exam_id)
+    if missing_aggregates or missing_trends:
+        refresh_school_trends(school_id)
+
+    if missing_aggregates or missing_summaries or missing_trends:
+        db.session.commit()
+        logger.info(f"Backfilled aggregates for {len(missing_aggregates)} and summaries for "
+                    f"{len(missing_summaries)} exams in school ID: {school_id}")
+
+
+def latest_exam_id(school_id):
+    """The school's most recent complete exam that has results, or None"""
+    return (db.session.query(Exam.id)
+            .filter(Exam.school_id == school_id, Exam.is_complete.is_(True),
+                    exists().where(ExamResult.exam_id == Exam.id))
+            .order_by(Exam.exam_date.desc().nulls_last(), Exam.id.desc())
+            .limit(1)
+            .scalar())
+
+
+def aggregate_query(*entities, school_id, exam_id=None):
+    """Query over a school's aggregate rows, optionally limited to one exam"""
+    query = db.session.query(*entities).select_from(ResultAggregate).filter(ResultAggregate.school_id == school_id)
+    if exam_id:
+        query = query.filter(ResultAggregate.exam_id == exam_id)
+    return query
+
+
+def mean_column():
+    """Mean mark of the aggregate rows in a group"""
+    return (func.sum(ResultAggregate.marks_sum) / func.nullif(func.sum(ResultAggregate.result_count), 0)).label('mean')
+
+
+def pass_rate_column():
+    """Percentage of passing marks in a group"""
+    return (func.sum(ResultAggregate.pass_count) * 100.0 /
+            func.nullif(func.sum(ResultAggregate.result_count), 0)).label('pass_rate')
+
+
+def round_stat(value, digits=1):
+    """
+    Round a mean or percentage half up on its shortest decimal form, so SQL results
+    (floats on SQLite, Decimals on PostgreSQL) and NumPy results round alike
+    """
+    return float(Decimal(repr(float(value))).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP))
+
+
+def student_count_query(*group, school_id, exam_id=None):
+    """Distinct students with results, from the per-student exam summaries"""
+    query = (db.session.query(*group, func.count(distinct(ExamStudentSummary.student_id)))
+             .select_from(ExamStudentSummary)
+             .join(Exam, ExamStudentSummary.exam_id == Exam.id)
+             .filter(Exam.school_id == school_id))
+    if exam_id:
+        query = query.filter(ExamStudentSummary.exam_id == exam_id)
+    return query
+
+
+def grade_distribution(school_id, exam_id=None):
+    """Merge the grade histograms of a school's aggregate rows"""
+    totals = Counter()
+    for grade_counts, in aggregate_query(ResultAggregate.grade_counts, school_id=school_id, exam_id=exam_id):
+        totals.update(json.loads(grade_counts or '{}'))
+    return dict(totals)
+
+
+def mark_distributions(*group, school_id, exam_id=None, join=None):
+    """
+    Merge a school's aggregate rows into one MarkDistribution per value of the
+    group columns (the whole school when no columns are given). join is an
+    optional (entity, onclause) the group columns come from.
+    """
+    query = aggregate_query(
+        *group,
+        ResultAggregate.mark_histogram,
+        ResultAggregate.result_count,
+        ResultAggregate.marks_sum,
+        ResultAggregate.marks_sum_sq,
+        ResultAggregate.marks_max,
+        school_id=school_id,
+        exam_id=exam_id
+    )
+    if join is not None:
+        query = query.join(*join)
+
+    distributions = {}
+    for row in query:
+        key = tuple(row[:len(group)])
+        distribution = distributions.setdefault(key, MarkDistribution())
+        distribution.merge(MarkDistribution.from_aggregate(row))
+    return distributions
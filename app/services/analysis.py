@@ -1,35 +1,44 @@
 # app/services/analysis.py
 from app import db
-from app.models import Exam, ExamResult, School, Subject, Student, User, AcademicClass
+from app.models import (
+    Exam, ExamResult, School, Subject, Student, User, AcademicClass, ResultAggregate, ExamStudentSummary,
+    teacher_subjects
+)
+from app.services.aggregates import (
+    aggregate_query, grade_distribution, latest_exam_id, mark_distributions,
+    mean_column, pass_rate_column, round_stat, student_count_query
+)
+from app.services.cache import cached_analytics
+from app.services.trends import term_period, trend_series
 from collections import defaultdict
 from datetime import datetime
-from sqlalchemy import func, case, and_, distinct, or_
+from sqlalchemy import func, case, and_, distinct, or_, select, tuple_
 import statistics
 import json
+from flask import current_app
 
 
 def update_school_performance(school_id):
     """
-    Recalculates and updates overall performance metrics for a school using SQL queries
+    Recalculates and updates overall performance metrics for a school from the
+    per-exam result aggregates
     Returns: Dictionary with performance metrics
     """
     try:
-        # Get overall statistics using SQL with explicit joins
-        stats = (db.session.query(
-            func.avg(ExamResult.marks).label('mean_score'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate'),
-            func.count(distinct(ExamResult.student_id)).label('total_students'),
-            func.count(distinct(ExamResult.subject_id)).label('total_subjects'),
-            func.count(distinct(ExamResult.exam_id)).label('total_exams')
-        )
-                 .select_from(ExamResult)
-                 .join(Exam, ExamResult.exam_id == Exam.id)
-                 .filter(Exam.school_id == school_id)
-                 .first())
+        # Get overall statistics from the aggregate rows
+        stats = aggregate_query(
+            mean_column().label('mean_score'),
+            pass_rate_column(),
+            func.count(distinct(ResultAggregate.subject_id)).label('total_subjects'),
+            func.count(distinct(ResultAggregate.exam_id)).label('total_exams'),
+            school_id=school_id
+        ).first()
 
         if not stats or stats.mean_score is None:
             return None
 
+        total_students = student_count_query(school_id=school_id).scalar()
+
         # Update school record
         school = School.query.get(school_id)
         if school:
@@ -38,40 +47,40 @@ def update_school_performance(school_id):
             school.performance_last_updated = datetime.now()
             db.session.commit()
 
-        # Get subject-wise statistics with explicit joins
-        subject_stats = (db.session.query(
+        # Get subject-wise statistics from the aggregates
+        subject_stats = (aggregate_query(
             Subject.name,
-            func.avg(ExamResult.marks).label('mean'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate'),
-            func.count(ExamResult.id).label('count')
+            mean_column(),
+            pass_rate_column(),
+            func.sum(ResultAggregate.result_count).label('count'),
+            school_id=school_id
         )
-                         .select_from(ExamResult)
-                         .join(Subject, ExamResult.subject_id == Subject.id)
-                         .join(Exam, ExamResult.exam_id == Exam.id)
-                         .filter(Exam.school_id == school_id)
+                         .join(Subject, ResultAggregate.subject_id == Subject.id)
                          .group_by(Subject.name)
                          .all())
 
-        # Get class-wise statistics with explicit joins
-        class_stats = (db.session.query(
+        # Get class-wise statistics from the aggregates
+        class_stats = (aggregate_query(
             AcademicClass.name,
-            func.avg(ExamResult.marks).label('mean'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate'),
-            func.count(distinct(ExamResult.student_id)).label('count')
+            mean_column(),
+            pass_rate_column(),
+            school_id=school_id
         )
-                       .select_from(ExamResult)
-                       .join(Student, ExamResult.student_id == Student.id)
-                       .join(AcademicClass, Student.academic_class_id == AcademicClass.id)
-                       .join(Exam, ExamResult.exam_id == Exam.id)
-                       .filter(Exam.school_id == school_id)
+                       .join(AcademicClass, ResultAggregate.academic_class_id == AcademicClass.id)
                        .group_by(AcademicClass.name)
                        .all())
+        students_per_class = dict(
+            student_count_query(AcademicClass.name, school_id=school_id)
+            .join(AcademicClass, ExamStudentSummary.academic_class_id == AcademicClass.id)
+            .group_by(AcademicClass.name)
+            .all()
+        )
 
         return {
             'overall': {
                 'mean': round(stats.mean_score, 2),
                 'pass_rate': round(stats.pass_rate, 2),
-                'total_students': stats.total_students,
+                'total_students': total_students,
                 'total_subjects': stats.total_subjects,
                 'total_exams': stats.total_exams
             },
@@ -86,7 +95,7 @@ def update_school_performance(school_id):
                 c.name: {
                     'mean': round(c.mean, 2),
                     'pass_rate': round(c.pass_rate, 2),
-                    'count': c.count
+                    'count': students_per_class.get(c.name, 0)
                 } for c in class_stats
             }
         }
@@ -96,10 +105,25 @@ def update_school_performance(school_id):
         raise e
 
 
+@cached_analytics('school_performance')
 def get_school_performance(school_id, exam_id=None):
-    """Generate performance analytics using optimized SQL queries with explicit joins"""
+    """Generate performance analytics with the engine selected by ANALYTICS_ENGINE ('sql' or 'columnar')"""
+    if current_app.config.get('ANALYTICS_ENGINE') == 'columnar':
+        from app.services.columnar import get_school_performance_columnar
+        return get_school_performance_columnar(school_id, exam_id)
+    return get_school_performance_sql(school_id, exam_id)
+
+
+def get_school_performance_sql(school_id, exam_id=None):
+    """
+    Generate performance analytics. School, subject, class and teacher statistics are
+    read from the per-exam result aggregates; only the per-student rows touch exam_results,
+    and those cover one exam: exam_id, or else the school's latest exam.
+    """
     try:
-        # Base query with explicit join conditions
+        # Per-student rows and their class/stream rollup read a single exam, so their
+        # cost does not grow with the school's exam history
+        students_exam_id = exam_id or latest_exam_id(school_id)
         query = (db.session.query(
             ExamResult,
             Student,
@@ -112,59 +136,27 @@ def get_school_performance(school_id, exam_id=None):
                  .join(Student, ExamResult.student_id == Student.id)
                  .join(Subject, ExamResult.subject_id == Subject.id)
                  .join(AcademicClass, Student.academic_class_id == AcademicClass.id)
-                 .filter(Exam.school_id == school_id))
-
-        if exam_id:
-            query = query.filter(ExamResult.exam_id == exam_id)
-
-        # Get overall metrics with single query
-        overall = query.with_entities(
-            func.avg(ExamResult.marks).label('mean'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate'),
-            func.count(distinct(ExamResult.student_id)).label('total_students'),
-            func.count(ExamResult.id).label('total_results')
+                 .filter(Exam.school_id == school_id, ExamResult.exam_id == students_exam_id))
+
+        # Get overall metrics from the aggregates
+        overall = aggregate_query(
+            mean_column(),
+            pass_rate_column(),
+            func.sum(ResultAggregate.result_count).label('total_results'),
+            school_id=school_id,
+            exam_id=exam_id
         ).first()
 
         if not overall or overall.mean is None:
             return None
 
+        total_students = student_count_query(school_id=school_id, exam_id=exam_id).scalar()
+
         # Get grade distribution
-        grade_dist = query.with_entities(
-            ExamResult.grade,
-            func.count(ExamResult.id)
-        ).group_by(ExamResult.grade).all()
+        grade_dist = grade_distribution(school_id, exam_id)
 
-        # Get all students with their scores and stream information
-        students_query = (db.session.query(
-            Student,
-            AcademicClass
-        )
-                          .join(AcademicClass, Student.academic_class_id == AcademicClass.id)
-                          .filter(Student.school_id == school_id))
-
-        all_students = []
-        for student, academic_class in students_query.all():
-            results = ExamResult.query.filter_by(student_id=student.id)
-            if exam_id:
-                results = results.filter_by(exam_id=exam_id)
-            results = results.join(Subject).all()
-
-            if not results:
-                continue
-
-            scores = {r.subject.name: r.marks for r in results}
-            total = sum(scores.values())
-            avg = total / len(scores) if scores else 0
-
-            all_students.append({
-                'id': student.id,
-                'name': student.name,
-                'class_name': academic_class.name,
-                'stream': getattr(academic_class, 'stream', None),
-                'total_score': total,
-                'avg_score': avg,
-                'scores': scores
-            })
+        # Get all students with their scores and stream information from one result set
+        all_students = build_student_scores(query)
 
         # Sort students by total score descending
         all_students.sort(key=lambda x: x['total_score'], reverse=True)
@@ -172,126 +164,133 @@ def get_school_performance(school_id, exam_id=None):
         # Get top/bottom students from the all_students list
         top_students = [{
             'name': s['name'],
-            'avg_score': round(s['avg_score'], 1),
-            'total_score': round(s['total_score'], 1),
+            'avg_score': round_stat(s['avg_score']),
+            'total_score': round_stat(s['total_score']),
             'grade': get_grade_from_score(s['avg_score'])
         } for s in all_students[:5]]
 
         bottom_students = [{
             'name': s['name'],
-            'avg_score': round(s['avg_score'], 1),
-            'total_score': round(s['total_score'], 1),
+            'avg_score': round_stat(s['avg_score']),
+            'total_score': round_stat(s['total_score']),
             'grade': get_grade_from_score(s['avg_score'])
         } for s in all_students[-5:]]
 
-        # Get teacher performance with explicit joins
-        teacher_perf = (db.session.query(
+        # Get teacher performance from the aggregates of the subjects they teach
+        teacher_perf = (aggregate_query(
             User.username,
-            func.count(distinct(Subject.id)).label('subject_count'),
-            func.avg(ExamResult.marks).label('avg_score'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate')
+            func.count(distinct(ResultAggregate.subject_id)).label('subject_count'),
+            mean_column().label('avg_score'),
+            pass_rate_column(),
+            school_id=school_id
         )
-                        .select_from(ExamResult)
-                        .join(Subject, ExamResult.subject_id == Subject.id)
-                        .join(Exam, ExamResult.exam_id == Exam.id)
-                        .join(Subject.teachers)  # This uses the many-to-many relationship directly
-                        .filter(Exam.school_id == school_id)
+                        .join(teacher_subjects, teacher_subjects.c.subject_id == ResultAggregate.subject_id)
+                        .join(User, teacher_subjects.c.teacher_id == User.id)
                         .group_by(User.id, User.username)
+                        .order_by(User.id)
                         .all())
 
         # Get performance by subject and class
-        by_subject = query.with_entities(
+        # Subject student counts add up per-exam counts when no exam is selected
+        by_subject = (aggregate_query(
             Subject.name,
-            func.avg(ExamResult.marks).label('mean'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate'),
-            func.count(distinct(ExamResult.student_id)).label('total_students'),
-            func.max(ExamResult.marks).label('top_student')
-        ).group_by(Subject.name).all()
+            mean_column(),
+            pass_rate_column(),
+            func.sum(ResultAggregate.student_count).label('total_students'),
+            func.max(ResultAggregate.marks_max).label('top_student'),
+            school_id=school_id,
+            exam_id=exam_id
+        )
+                      .join(Subject, ResultAggregate.subject_id == Subject.id)
+                      .group_by(Subject.name)
+                      .all())
 
-        by_class = query.with_entities(
+        by_class = (aggregate_query(
             AcademicClass.name,
-            func.avg(ExamResult.marks).label('mean'),
-            (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate'),
-            func.count(distinct(ExamResult.student_id)).label('total_students')
-        ).group_by(AcademicClass.name).all()
+            mean_column(),
+            pass_rate_column(),
+            school_id=school_id,
+            exam_id=exam_id
+        )
+                    .join(AcademicClass, ResultAggregate.academic_class_id == AcademicClass.id)
+                    .group_by(AcademicClass.name)
+                    .all())
+        students_per_class = dict(
+            student_count_query(AcademicClass.name, school_id=school_id, exam_id=exam_id)
+            .join(AcademicClass, ExamStudentSummary.academic_class_id == AcademicClass.id)
+            .group_by(AcademicClass.name)
+            .all()
+        )
 
-        # Get detailed class performance with streams
-        classes = (db.session.query(AcademicClass)
+        # Get detailed class performance with streams, rolled up in one pass
+        rollup = get_class_stream_rollup(query, all_students)
+        classes = (db.session.query(AcademicClass.name)
                    .filter(AcademicClass.school_id == school_id)
                    .order_by(AcademicClass.name)
                    .all())
 
+        students_by_class = defaultdict(list)
+        students_by_stream = defaultdict(list)
+        for student in all_students:
+            students_by_class[student['class_name']].append(student)
+            students_by_stream[(student['class_name'], student['stream'])].append(student)
+
         by_class_detailed = {}
-        for class_obj in classes:
-            # Get students in this class
-            class_students = [s for s in all_students if s['class_name'] == class_obj.name]
-
-            # Calculate class metrics
-            if class_students:
-                class_avg = sum(s['avg_score'] for s in class_students) / len(class_students)
-                class_pass_rate = (sum(1 for s in class_students if s['avg_score'] >= 50) / len(class_students)) * 100
-            else:
-                class_avg = 0
-                class_pass_rate = 0
-
-            # Check if class has streams
-            streams = set(s['stream'] for s in class_students if s.get('stream'))
-
-            stream_performance = {}
-            if streams:
-                for stream in streams:
-                    stream_students = [s for s in class_students if s.get('stream') == stream]
-                    if stream_students:
-                        stream_avg = sum(s['avg_score'] for s in stream_students) / len(stream_students)
-                        stream_pass_rate = (sum(1 for s in stream_students if s['avg_score'] >= 50) / len(
-                            stream_students)) * 100
-
-                        stream_performance[stream] = {
-                            'students': stream_students,
-                            'mean': stream_avg,
-                            'pass_rate': stream_pass_rate
-                        }
-
-            by_class_detailed[class_obj.name] = {
-                'students': class_students,
-                'mean': class_avg,
-                'pass_rate': class_pass_rate,
-                'streams': stream_performance if streams else None
+        for class_name, in classes:
+            class_stats = rollup['classes'].get(class_name, {'mean': 0, 'pass_rate': 0})
+
+            # Only named streams are broken out
+            stream_performance = {
+                stream: {
+                    'students': students_by_stream[(class_name, stream)],
+                    'mean': round_stat(stats['mean']),
+                    'pass_rate': round_stat(stats['pass_rate'])
+                } for stream, stats in rollup['streams'].get(class_name, {}).items() if stream
+            }
+
+            by_class_detailed[class_name] = {
+                'students': students_by_class.get(class_name, []),
+                'mean': round_stat(class_stats['mean']),
+                'pass_rate': round_stat(class_stats['pass_rate']),
+                'streams': stream_performance or None
             }
 
         return {
             'overall': {
-                'mean': round(overall.mean, 1),
-                'pass_rate': round(overall.pass_rate, 1),
-                'total_students': overall.total_students,
-                'active_students': overall.total_students,
+                'mean': round_stat(overall.mean),
+                'pass_rate': round_stat(overall.pass_rate),
+                'total_students': total_students,
+                'active_students': total_students,
                 'total_subjects': len(by_subject),
                 'core_subjects': len(by_subject),
-                'total_results': overall.total_results
+                'total_results': overall.total_results,
+                'student_mean': round_stat(rollup['school']['mean']),
+                'student_pass_rate': round_stat(rollup['school']['pass_rate'])
             },
             'by_subject': {
                 s.name: {
-                    'mean': round(s.mean, 1),
-                    'pass_rate': round(s.pass_rate, 1),
+                    'mean': round_stat(s.mean),
+                    'pass_rate': round_stat(s.pass_rate),
                     'total_students': s.total_students,
-                    'top_student': round(s.top_student, 1)
+                    'top_student': round_stat(s.top_student)
                 } for s in by_subject
             },
             'by_class': {
                 c.name: {
-                    'mean': round(c.mean, 1),
-                    'pass_rate': round(c.pass_rate, 1),
-                    'total_students': c.total_students
+                    'mean': round_stat(c.mean),
+                    'pass_rate': round_stat(c.pass_rate),
+                    'total_students': students_per_class.get(c.name, 0)
                 } for c in by_class
             },
             'by_class_detailed': by_class_detailed,
-            'grade_distribution': dict(grade_dist),
+            'grade_distribution': grade_dist,
             'teacher_performance': [{
                 'name': t.username,
                 'subject_count': t.subject_count,
-                'avg_score': round(t.avg_score, 1),
-                'pass_rate': round(t.pass_rate, 1)
+                'avg_score': round_stat(t.avg_score),
+                'pass_rate': round_stat(t.pass_rate)
             } for t in teacher_perf],
+            'students_exam_id': students_exam_id,
             'all_students': all_students,
             'top_students': top_students,
             'bottom_students': bottom_students,
@@ -303,6 +302,126 @@ def get_school_performance(school_id, exam_id=None):
         raise e
 
 
+def build_student_scores(query):
+    """
+    Build the per-student score rows (class, stream and marks by subject) from one
+    streamed result set of the joined results query, instead of a query per student.
+    When a subject appears more than once, the most recently stored mark wins.
+    """
+    rows = (query.with_entities(
+        Student.id,
+        Student.name,
+        AcademicClass.name,
+        AcademicClass.stream,
+        Subject.name,
+        ExamResult.marks
+    )
+            .order_by(Student.id, ExamResult.id)
+            .yield_per(5000))
+
+    all_students = []
+    current = None
+    for student_id, student_name, class_name, stream, subject_name, marks in rows:
+        if current is None or current['id'] != student_id:
+            current = {
+                'id': student_id,
+                'name': student_name,
+                'class_name': class_name,
+                'stream': stream,
+                'scores': {}
+            }
+            all_students.append(current)
+        current['scores'][subject_name] = marks
+
+    for student in all_students:
+        scores = student['scores']
+        student['total_score'] = sum(scores.values())
+        student['avg_score'] = student['total_score'] / len(scores) if scores else 0
+
+    return all_students
+
+
+def get_class_stream_rollup(query, all_students):
+    """
+    Mean and pass rate of student averages per (class, stream), per class and for the
+    school. PostgreSQL computes all three levels in one GROUPING SETS query over the
+    joined results query; other backends fold the all_students rows in one hashing pass.
+    Returns {'school': stats, 'classes': {class: stats}, 'streams': {class: {stream: stats}}}
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return _grouping_sets_rollup(query)
+    return _student_rollup(all_students)
+
+
+def _student_rollup(all_students):
+    totals = defaultdict(lambda: [0.0, 0, 0])
+    for student in all_students:
+        for key in ((), (student['class_name'],), (student['class_name'], student['stream'])):
+            total = totals[key]
+            total[0] += student['avg_score']
+            total[1] += 1 if student['avg_score'] >= 50 else 0
+            total[2] += 1
+
+    rollup = {'school': {'mean': 0, 'pass_rate': 0, 'count': 0}, 'classes': {}, 'streams': defaultdict(dict)}
+    for key, (score_sum, passes, count) in totals.items():
+        _store_rollup(rollup, key, score_sum / count, passes * 100 / count, count)
+    return rollup
+
+
+def _grouping_sets_rollup(query):
+    # Latest mark per student and subject name, as in build_student_scores
+    latest = query.with_entities(
+        Student.id.label('student_id'),
+        AcademicClass.name.label('class_name'),
+        AcademicClass.stream.label('stream'),
+        ExamResult.marks.label('marks'),
+        func.row_number().over(
+            partition_by=(Student.id, Subject.name),
+            order_by=ExamResult.id.desc()
+        ).label('rank')
+    ).subquery()
+    students = (select(
+        latest.c.class_name,
+        latest.c.stream,
+        func.avg(latest.c.marks).label('avg_score')
+    )
+                .where(latest.c.rank == 1)
+                .group_by(latest.c.student_id, latest.c.class_name, latest.c.stream)
+                .subquery())
+
+    rows = db.session.execute(
+        select(
+            students.c.class_name,
+            students.c.stream,
+            func.grouping(students.c.class_name).label('all_classes'),
+            func.grouping(students.c.stream).label('all_streams'),
+            func.avg(students.c.avg_score).label('mean'),
+            (func.avg(case((students.c.avg_score >= 50, 1), else_=0)) * 100).label('pass_rate'),
+            func.count().label('count')
+        ).group_by(func.grouping_sets(
+            tuple_(students.c.class_name, students.c.stream),
+            tuple_(students.c.class_name),
+            tuple_()
+        ))
+    )
+
+    rollup = {'school': {'mean': 0, 'pass_rate': 0, 'count': 0}, 'classes': {}, 'streams': defaultdict(dict)}
+    for row in rows:
+        key = () if row.all_classes else (row.class_name,) if row.all_streams else (row.class_name, row.stream)
+        _store_rollup(rollup, key, float(row.mean), float(row.pass_rate), row.count)
+    return rollup
+
+
+def _store_rollup(rollup, key, mean, pass_rate, count):
+    stats = {'mean': mean, 'pass_rate': pass_rate, 'count': count}
+    if not key:
+        rollup['school'] = stats
+    elif len(key) == 1:
+        rollup['classes'][key[0]] = stats
+    else:
+        rollup['streams'][key[0]][key[1]] = stats
+
+
 def get_grade_from_score(score):
     """Helper function to convert score to letter grade"""
     if score >= 80:
@@ -317,20 +436,10 @@ def get_grade_from_score(score):
         return 'E'
 
 
-def get_performance_trends(school_id, months=6):
-    """Get historical performance trends with explicit joins"""
-    trend_data = (db.session.query(
-        func.to_char(Exam.exam_date, 'YYYY-MM').label('month'),
-        func.avg(ExamResult.marks).label('mean_score'),
-        (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate')
-    )
-                  .select_from(ExamResult)
-                  .join(Exam, ExamResult.exam_id == Exam.id)
-                  .filter(Exam.school_id == school_id)
-                  .group_by(func.to_char(Exam.exam_date, 'YYYY-MM'))
-                  .order_by(func.to_char(Exam.exam_date, 'YYYY-MM').desc())
-                  .limit(months)
-                  .all())
+@cached_analytics('performance_trends')
+def get_performance_trends(school_id, months=6, period='month'):
+    """Get historical performance trends from the precomputed month or term rollups"""
+    trend_data = trend_series(school_id, period_type=period, limit=months)
 
     if not trend_data:
         return {
@@ -341,19 +450,47 @@ def get_performance_trends(school_id, months=6):
             'pass_rates': []
         }
 
-    # Calculate trends
-    mean_trend = calculate_trend([t.mean_score for t in trend_data])
-    pass_rate_trend = calculate_trend([t.pass_rate for t in trend_data])
+    # Calculate trends, newest first
+    mean_trend = calculate_trend([t['mean'] for t in reversed(trend_data)])
+    pass_rate_trend = calculate_trend([t['pass_rate'] for t in reversed(trend_data)])
 
     return {
         'mean_trend': mean_trend,
         'pass_rate_trend': pass_rate_trend,
-        'exam_periods': [t.month for t in reversed(trend_data)],
-        'mean_scores': [round(t.mean_score, 1) for t in reversed(trend_data)],
-        'pass_rates': [round(t.pass_rate, 1) for t in reversed(trend_data)]
+        'exam_periods': [t['period'] for t in trend_data],
+        'mean_scores': [round(t['mean'], 1) for t in trend_data],
+        'pass_rates': [round(t['pass_rate'], 1) for t in trend_data]
     }
 
 
+# Mark distribution groupings: (group columns, join onto the aggregates, key label)
+DISTRIBUTION_GROUPS = {
+    'school': ((), None, lambda: 'School'),
+    'subject': ((Subject.name,), (Subject, ResultAggregate.subject_id == Subject.id), lambda name: name),
+    'class': ((AcademicClass.name, AcademicClass.stream),
+              (AcademicClass, ResultAggregate.academic_class_id == AcademicClass.id),
+              lambda name, stream: f"{name} {stream}" if stream else name),
+    'exam': ((Exam.name, Exam.academic_year, Exam.semester), (Exam, ResultAggregate.exam_id == Exam.id),
+             lambda name, year, semester: f"{name} ({term_period(year, semester) or 'no term'})"),
+    'term': ((Exam.academic_year, Exam.semester), (Exam, ResultAggregate.exam_id == Exam.id),
+             lambda year, semester: term_period(year, semester) or 'No term')
+}
+
+
+@cached_analytics('mark_distributions')
+def get_mark_distributions(school_id, exam_id=None, by='subject'):
+    """
+    Median, quartiles, standard deviation and grade-boundary percentiles per group,
+    merged from the mark histograms of the aggregate rows
+    """
+    if by not in DISTRIBUTION_GROUPS:
+        raise ValueError(f"Unknown distribution grouping: {by}")
+
+    group, join, label = DISTRIBUTION_GROUPS[by]
+    distributions = mark_distributions(*group, school_id=school_id, exam_id=exam_id, join=join)
+    return {label(*key): distribution.summary() for key, distribution in distributions.items()}
+
+
 def calculate_trend(values):
     """Calculate percentage change between last two values"""
     if len(values) < 2:
@@ -365,67 +502,97 @@ def calculate_trend(values):
     return round(((current - previous) / previous) * 100, 1)
 
 
-def get_student_performance(student_id, limit=5):
-    """Generate performance analytics for a single student"""
-    results = ExamResult.query.filter_by(student_id=student_id) \
-        .options(
-        db.joinedload(ExamResult.subject),
-        db.joinedload(ExamResult.exam)
-    ) \
-        .order_by(ExamResult.exam_date.desc()) \
-        .limit(limit) \
-        .all()
+@cached_analytics('student_performance')
+def get_student_performance(school_id, student_id, limit=5):
+    """Generate performance analytics for a single student from the school's exams"""
+    return get_students_performance([student_id], limit=limit, school_id=school_id).get(student_id)
 
-    if not results:
-        return None
 
-    # Enhanced performance calculation
+def get_students_performance(student_ids, limit=5, school_id=None):
+    """
+    Performance analytics for several students at once, keyed by student id.
+    Two queries regardless of how many students or results: each student's latest
+    results, then the exam-wide average of every (exam, subject) they appear in.
+    With school_id only that school's exams count. Students without results map to None.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    performances = dict.fromkeys(student_ids)
+    if not student_ids:
+        return performances
+
+    filters = [ExamResult.student_id.in_(student_ids), ExamResult.marks.isnot(None), Exam.is_complete.is_(True)]
+    if school_id is not None:
+        filters.append(Exam.school_id == school_id)
+    recency = func.row_number().over(
+        partition_by=ExamResult.student_id,
+        order_by=(Exam.exam_date.desc(), ExamResult.id.desc())
+    )
+    latest = (select(
+        ExamResult.student_id, ExamResult.exam_id, ExamResult.subject_id, ExamResult.marks, ExamResult.grade,
+        Exam.name.label('exam_name'), Exam.exam_date, Subject.name.label('subject_name'),
+        recency.label('recency')
+    )
+              .join(Exam, ExamResult.exam_id == Exam.id)
+              .join(Subject, ExamResult.subject_id == Subject.id)
+              .where(*filters)
+              .subquery())
+    rows = db.session.execute(
+        select(latest).where(latest.c.recency <= limit).order_by(latest.c.student_id, latest.c.recency)
+    ).all()
+    if not rows:
+        return performances
+
+    pairs = {(row.exam_id, row.subject_id) for row in rows}
+    class_avgs = dict(((exam_id, subject_id), avg) for exam_id, subject_id, avg in db.session.query(
+        ExamResult.exam_id, ExamResult.subject_id, func.avg(ExamResult.marks)
+    ).filter(
+        tuple_(ExamResult.exam_id, ExamResult.subject_id).in_(pairs)
+    ).group_by(ExamResult.exam_id, ExamResult.subject_id))
+
+    by_student = defaultdict(list)
+    for row in rows:
+        by_student[row.student_id].append(row)
+
+    for student_id, results in by_student.items():
+        performances[student_id] = _student_performance(results, class_avgs)
+    return performances
+
+
+def _student_performance(results, class_avgs):
+    """Build one student's analytics from their results, newest first"""
     marks = [r.marks for r in results]
-    mean = statistics.mean(marks) if marks else 0
-    recent_exams = {r.exam.name for r in results}
-
-    # Improved subject performance tracking
     subject_performance = {}
     exam_trend = {}
 
     for result in results:
-        # Subject performance
-        if result.subject.name not in subject_performance:
-            subject_performance[result.subject.name] = {
+        # Results arrive newest first, so the first one per subject is the latest
+        if result.subject_name not in subject_performance:
+            subject_performance[result.subject_name] = {
                 'latest_mark': result.marks,
                 'latest_grade': result.grade,
                 'exam_count': 1,
                 'mark_trend': [result.marks]
             }
         else:
-            subj = subject_performance[result.subject.name]
+            subj = subject_performance[result.subject_name]
             subj['exam_count'] += 1
             subj['mark_trend'].append(result.marks)
-            if result.exam_date > ExamResult.query \
-                    .filter_by(student_id=student_id, subject_id=result.subject_id) \
-                    .order_by(ExamResult.exam_date.desc()) \
-                    .first().exam_date:
-                subj['latest_mark'] = result.marks
-                subj['latest_grade'] = result.grade
-
-        # Exam trend
-        if result.exam.name not in exam_trend:
-            exam_trend[result.exam.name] = {
-                'date': result.exam.exam_date.isoformat(),
+
+        if result.exam_name not in exam_trend:
+            exam_trend[result.exam_name] = {
+                'date': result.exam_date.isoformat() if result.exam_date else None,
                 'subjects': {}
             }
-        exam_trend[result.exam.name]['subjects'][result.subject.name] = {
+        exam_trend[result.exam_name]['subjects'][result.subject_name] = {
             'marks': result.marks,
             'grade': result.grade,
-            'class_avg': db.session.query(func.avg(ExamResult.marks))
-                         .filter_by(exam_id=result.exam_id, subject_id=result.subject_id)
-                         .scalar() or 0
+            'class_avg': class_avgs.get((result.exam_id, result.subject_id)) or 0
         }
 
     return {
         'overall': {
-            'mean_score': mean,
-            'exam_count': len(recent_exams),
+            'mean_score': statistics.mean(marks),
+            'exam_count': len({r.exam_name for r in results}),
             'improvement': calculate_improvement(marks) if len(marks) > 1 else 0
         },
         'by_subject': subject_performance,
@@ -441,32 +608,98 @@ def calculate_improvement(marks):
 
 
 def get_teacher_performance(teacher_id):
-    """Generate performance analytics for a teacher's subjects"""
-    results = ExamResult.query.join(ExamResult.subject) \
-        .filter(Subject.teacher_id == teacher_id) \
-        .options(db.joinedload(ExamResult.subject)) \
+    """
+    Generate performance analytics for a teacher's subjects from the result
+    aggregates of the teacher's school, with a per-exam breakdown
+    """
+    school_id = db.session.query(User.school_id).filter(User.id == teacher_id).scalar()
+    if school_id is None:
+        return None
+
+    # One row per (exam, subject) taught; everything below is summed from these
+    rows = aggregate_query(
+        Exam.id.label('exam_id'),
+        Exam.name.label('exam_name'),
+        Exam.exam_date,
+        Subject.name.label('subject_name'),
+        func.sum(ResultAggregate.marks_sum).label('marks_sum'),
+        func.sum(ResultAggregate.pass_count).label('pass_count'),
+        func.sum(ResultAggregate.result_count).label('count'),
+        school_id=school_id
+    ).join(teacher_subjects, teacher_subjects.c.subject_id == ResultAggregate.subject_id) \
+        .join(Subject, ResultAggregate.subject_id == Subject.id) \
+        .join(Exam, ResultAggregate.exam_id == Exam.id) \
+        .filter(teacher_subjects.c.teacher_id == teacher_id) \
+        .group_by(Exam.id, Exam.name, Exam.exam_date, Subject.name) \
+        .order_by(Exam.exam_date, Exam.id, Subject.name) \
         .all()
 
-    if not results:
+    if not rows:
         return None
 
-    subject_stats = defaultdict(lambda: {'marks': [], 'count': 0})
-    for result in results:
-        subject_stats[result.subject.name]['marks'].append(result.marks)
-        subject_stats[result.subject.name]['count'] += 1
+    # Students of the classes whose subjects the teacher takes, from the per-student summaries
+    taught_classes = select(Subject.academic_class_id) \
+        .join(teacher_subjects, teacher_subjects.c.subject_id == Subject.id) \
+        .where(teacher_subjects.c.teacher_id == teacher_id)
+    total_students = student_count_query(school_id=school_id) \
+        .filter(ExamStudentSummary.academic_class_id.in_(taught_classes)) \
+        .scalar()
+
+    overall = _MarkTotals()
+    by_subject = defaultdict(_MarkTotals)
+    by_exam = {}
+    for row in rows:
+        overall.add(row)
+        by_subject[row.subject_name].add(row)
+        exam = by_exam.setdefault(row.exam_id, {
+            'name': row.exam_name,
+            'date': row.exam_date.isoformat() if row.exam_date else None,
+            'totals': _MarkTotals(),
+            'subjects': defaultdict(_MarkTotals)
+        })
+        exam['totals'].add(row)
+        exam['subjects'][row.subject_name].add(row)
 
     return {
         'overall': {
-            'mean_score': statistics.mean([r.marks for r in results]),
-            'total_students': len({r.student_id for r in results}),
-            'total_exams': len({r.exam_id for r in results})
+            'mean_score': overall.mean,
+            'total_students': total_students,
+            'total_exams': len(by_exam)
         },
-        'by_subject': {
-            name: {
-                'mean': statistics.mean(data['marks']),
-                'pass_rate': (len([m for m in data['marks'] if m >= 50]) / len(data['marks'])) * 100,
-                'count': data['count']
+        'by_subject': {name: totals.as_dict() for name, totals in by_subject.items()},
+        'by_exam': [
+            {
+                'exam_id': exam_id,
+                'name': exam['name'],
+                'date': exam['date'],
+                **exam['totals'].as_dict(),
+                'subjects': {name: totals.as_dict() for name, totals in exam['subjects'].items()}
             }
-            for name, data in subject_stats.items()
+            for exam_id, exam in by_exam.items()
+        ]
+    }
+
+
+class _MarkTotals:
+    """Running sums of aggregate rows, from which means and pass rates are derived"""
+
+    def __init__(self):
+        self.marks_sum = 0
+        self.pass_count = 0
+        self.count = 0
+
+    def add(self, row):
+        self.marks_sum += row.marks_sum or 0
+        self.pass_count += row.pass_count or 0
+        self.count += row.count or 0
+
+    @property
+    def mean(self):
+        return self.marks_sum / self.count if self.count else 0
+
+    def as_dict(self):
+        return {
+            'mean': self.mean,
+            'pass_rate': (self.pass_count / self.count) * 100 if self.count else 0,
+            'count': self.count
         }
-    }
\ No newline at end of file
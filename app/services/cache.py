@@ -0,0 +1,307 @@
+# app/services/cache.py
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app, has_request_context, request
+from sqlalchemy import func
+from app.models import db, School
+from app.services.instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64MB
+
+_MISSING = object()
+
+
+class LRUCacheBackend:
+    """In-process store that evicts least recently used entries beyond max_bytes of pickled values"""
+    name = 'lru'
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            self._entries.move_to_end(key)
+            return pickle.loads(entry)
+
+    def set(self, key, value):
+        """Store a value; returns the number of entries evicted to make room"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return 0
+
+        evicted = 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, oldest = self._entries.popitem(last=False)
+                self._size -= len(oldest)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+class SQLiteCacheBackend:
+    """
+    Store shared by every worker process on a host, kept in a SQLite file.
+    Least recently read entries are evicted beyond max_bytes.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS analytics_cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_analytics_cache_accessed_at ON analytics_cache (accessed_at)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection committed on success; workers never share a handle"""
+        connection = sqlite3.connect(self.path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute('SELECT value FROM analytics_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return _MISSING
+            connection.execute('UPDATE analytics_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        """Store a value; returns the number of entries evicted to make room"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return 0
+
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO analytics_cache (key, value, size, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, sqlite3.Binary(data), len(data), time.time())
+            )
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM analytics_cache').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            stale = []
+            for stale_key, size in connection.execute(
+                    'SELECT key, size FROM analytics_cache WHERE key != ? ORDER BY accessed_at', (key,)):
+                if total <= self.max_bytes:
+                    break
+                stale.append((stale_key,))
+                total -= size
+            connection.executemany('DELETE FROM analytics_cache WHERE key = ?', stale)
+        return len(stale)
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM analytics_cache')
+
+    def stats(self):
+        with self._connect() as connection:
+            entries, size = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analytics_cache'
+            ).fetchone()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'path': self.path}
+
+
+class AnalyticsCache:
+    """
+    Caches analytics results per school. Keys embed the school's data_version, which
+    every upload bumps, so stale entries are never read and age out of the backend.
+    Misses are single-flight per key within the process: when a version bump makes
+    several requests (or dashboard sections) miss together, one computes the value
+    and the others wait for it.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._requests = registry.counter('analytics_cache_requests_total', 'Analytics cache lookups by result')
+        self._evictions = registry.counter('analytics_cache_evictions_total', 'Analytics cache entries evicted')
+        self._counts = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, namespace, school_id, key_args, compute, refresh=False):
+        """Return the cached value for this school's current data version, computing it on a miss"""
+        key = f"{namespace}:{school_id}:v{get_data_version(school_id)}:{key_args!r}"
+        if not refresh:
+            value = self._safe(self.backend.get, key)
+            if value is not _MISSING:
+                self._count(namespace, 'hit')
+                return value
+
+        with self._single_flight(key):
+            # A concurrent miss on this key may have stored the value while we waited
+            value = _MISSING if refresh else self._safe(self.backend.get, key)
+            self._count(namespace, 'miss' if value is _MISSING else 'hit')
+            if value is not _MISSING:
+                return value
+
+            value = compute()
+            evicted = self._safe(self.backend.set, key, value) or 0
+            if evicted:
+                self._evictions.inc((('backend', self.backend.name),), evicted)
+            return value
+
+    @contextmanager
+    def _single_flight(self, key):
+        """Hold the per-key lock, creating it for the first caller and dropping it after the last"""
+        with self._lock:
+            flight = self._flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0]:
+                yield
+        finally:
+            with self._lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self._flights[key]
+
+    def _safe(self, operation, *args):
+        """A failing cache store degrades to recomputing, never to a failed page"""
+        try:
+            return operation(*args)
+        except Exception as e:
+            logger.warning(f"Analytics cache {operation.__name__} failed: {str(e)}")
+            return _MISSING if operation.__name__ == 'get' else 0
+
+    def _count(self, namespace, result):
+        self._requests.inc((('backend', self.backend.name), ('namespace', namespace), ('result', result)))
+        with self._lock:
+            counts = self._counts.setdefault(namespace, {'hit': 0, 'miss': 0})
+            counts[result] += 1
+
+    def stats(self):
+        """Hit and miss counts per namespace, plus backend occupancy"""
+        with self._lock:
+            counts = {namespace: dict(values) for namespace, values in self._counts.items()}
+        return {'backend': self.backend.name, 'namespaces': counts, **self._safe_stats()}
+
+    def _safe_stats(self):
+        try:
+            return self.backend.stats()
+        except Exception as e:
+            logger.warning(f"Analytics cache stats failed: {str(e)}")
+            return {}
+
+
+def _request_versions():
+    """Data versions already read during the current request, or None outside one"""
+    if not has_request_context():
+        return None
+    return request.environ.setdefault('analytics.data_versions', {})
+
+
+def get_data_version(school_id):
+    """
+    The school's data version, read once per request: a page's cached sections (and
+    its ETag) then share a single query, and the request sees one consistent version.
+    """
+    versions = _request_versions()
+    if versions is not None and school_id in versions:
+        return versions[school_id]
+
+    version = db.session.query(School.data_version).filter(School.id == school_id).scalar() or 0
+    if versions is not None:
+        versions[school_id] = version
+    return version
+
+
+def bump_data_version(school_id):
+    """Invalidate a school's cached analytics; runs in the caller's transaction"""
+    School.query.filter(School.id == school_id).update(
+        {School.data_version: func.coalesce(School.data_version, 0) + 1},
+        synchronize_session=False
+    )
+    versions = _request_versions()
+    if versions is not None:
+        versions.pop(school_id, None)
+
+
+def get_cache():
+    """The app's analytics cache, built from config on first use; None when disabled"""
+    app = current_app._get_current_object()
+    if 'analytics_cache' not in app.extensions:
+        backend_name = app.config.get('ANALYTICS_CACHE_BACKEND', 'lru')
+        max_bytes = app.config.get('ANALYTICS_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES
+        if backend_name == 'sqlite':
+            path = app.config.get('ANALYTICS_CACHE_PATH') or os.path.join(app.instance_path, 'analytics_cache.db')
+            backend = SQLiteCacheBackend(path, max_bytes)
+        elif backend_name == 'lru':
+            backend = LRUCacheBackend(max_bytes)
+        elif backend_name in (None, '', 'none'):
+            backend = None
+        else:
+            raise ValueError(f"Unknown analytics cache backend: {backend_name}")
+        app.extensions['analytics_cache'] = AnalyticsCache(backend) if backend else None
+    return app.extensions['analytics_cache']
+
+
+def school_scope(school_id, *args, **kwargs):
+    return school_id
+
+
+def cached_analytics(namespace, scope=school_scope):
+    """
+    Cache an analytics function per school data version. scope maps the call's
+    arguments to its school id. Callers may pass force_refresh=True to recompute
+    and overwrite the cached value.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, force_refresh=False, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+
+            school_id = scope(*args, **kwargs)
+            if school_id is None:
+                return func(*args, **kwargs)
+
+            return cache.get_or_compute(
+                namespace, school_id, (args, sorted(kwargs.items())),
+                lambda: func(*args, **kwargs),
+                refresh=force_refresh
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,327 @@
+# app/services/columnar.py
+import numpy as np
+from sqlalchemy import select
+from app.models import db, Exam, ExamResult, Student, Subject, AcademicClass, User, teacher_subjects
+from app.services.aggregates import PASS_MARK, latest_exam_id, round_stat
+
+
+class SchoolResults:
+    """
+    One school's results loaded once into parallel NumPy arrays. Text columns are
+    factorized into integer codes (with the original values kept in *_values lists)
+    so every grouping is a bincount over codes.
+    """
+
+    def __init__(self, school_id):
+        self.school_id = school_id
+
+        # Core execution returns plain tuples; names are joined in per id, not per row
+        connection = db.session.connection()
+        rows = connection.execute(
+            select(
+                ExamResult.exam_id,
+                ExamResult.student_id,
+                ExamResult.subject_id,
+                ExamResult.marks,
+                ExamResult.grade
+            )
+            .join(Exam, ExamResult.exam_id == Exam.id)
+            .where(Exam.school_id == school_id, Exam.is_complete.is_(True), ExamResult.marks.isnot(None))
+            .order_by(ExamResult.id)
+        ).all()
+        students = {row[0]: row[1:] for row in connection.execute(
+            select(Student.id, Student.name, AcademicClass.name, AcademicClass.stream)
+            .join(AcademicClass, Student.academic_class_id == AcademicClass.id)
+            .where(AcademicClass.school_id == school_id)
+        )}
+        subjects = dict(connection.execute(
+            select(Subject.id, Subject.name)
+            .join(AcademicClass, Subject.academic_class_id == AcademicClass.id)
+            .where(AcademicClass.school_id == school_id)
+        ).all())
+
+        columns = list(zip(*rows)) or [()] * 5
+        student_ids = np.array(columns[1], dtype=np.int64)
+        subject_ids = np.array(columns[2], dtype=np.int64)
+        known = (np.isin(student_ids, np.fromiter(students, dtype=np.int64, count=len(students))) &
+                 np.isin(subject_ids, np.fromiter(subjects, dtype=np.int64, count=len(subjects))))
+
+        self.size = int(known.sum())
+        self.exam_id = np.array(columns[0], dtype=np.int64)[known]
+        self.marks = np.array(columns[3], dtype=np.float64)[known]
+        self.student, self.student_ids = _factorize_ids(student_ids[known])
+        self.subject_id, self.subject_ids = _factorize_ids(subject_ids[known])
+        self.grade, self.grade_values = _factorize_text(np.array(columns[4], dtype=object)[known])
+
+        # Per-student and per-subject attributes, one entry per code
+        self.student_names = [students[i][0] for i in self.student_ids]
+        self.student_class, self.class_values = _factorize([students[i][1] for i in self.student_ids])
+        self.student_stream, self.stream_values = _factorize([students[i][2] for i in self.student_ids])
+        # Subjects are per class, so several subject ids share a name
+        self.subject_name_of_id, self.subject_names = _factorize([subjects[i] for i in self.subject_ids])
+
+    def select(self, exam_id=None):
+        """Boolean mask of the rows belonging to one exam, or all rows"""
+        if exam_id:
+            return self.exam_id == exam_id
+        return np.ones(self.size, dtype=bool)
+
+
+def group_stats(codes, size, marks):
+    """(count, sum, passes, max) per group code"""
+    count = np.bincount(codes, minlength=size)
+    total = np.bincount(codes, weights=marks, minlength=size)
+    passes = np.bincount(codes, weights=marks >= PASS_MARK, minlength=size)
+    top = np.full(size, -np.inf)
+    np.maximum.at(top, codes, marks)
+    return count, total, passes, top
+
+
+def distinct_count(codes, size, members, member_size):
+    """Number of distinct members per group code"""
+    pairs = np.unique(codes.astype(np.int64) * member_size + members)
+    return np.bincount(pairs // member_size, minlength=size)
+
+
+def get_school_performance_columnar(school_id, exam_id=None, data=None):
+    """
+    Columnar counterpart of analysis.get_school_performance: same output dict, computed
+    from one load of the school's results with vectorized group-by reductions.
+    Per-student rows cover exam_id, or else the school's latest exam.
+    """
+    from app.services.analysis import get_grade_from_score, get_performance_trends
+
+    data = data or SchoolResults(school_id)
+    mask = data.select(exam_id)
+    if not mask.any():
+        return None
+
+    marks = data.marks[mask]
+    student = data.student[mask]
+    subject_id = data.subject_id[mask]
+    exam_ids = data.exam_id[mask]
+    n_students = len(data.student_ids)
+    n_subjects, n_classes = len(data.subject_names), len(data.class_values)
+
+    # By subject name; student counts are per exam, matching the aggregate tables
+    subject = data.subject_name_of_id[subject_id]
+    count, total, passes, top = group_stats(subject, n_subjects, marks)
+    _, exam_codes = np.unique(exam_ids, return_inverse=True)
+    exam_students = exam_codes.astype(np.int64) * n_students + student
+    subject_students = distinct_count(subject, n_subjects, exam_students, int(exam_students.max()) + 1)
+    by_subject = {
+        data.subject_names[i]: {
+            'mean': round_stat(float(total[i] / count[i])),
+            'pass_rate': round_stat(float(passes[i] * 100 / count[i])),
+            'total_students': int(subject_students[i]),
+            'top_student': round_stat(float(top[i]))
+        } for i in np.flatnonzero(count)
+    }
+
+    # By class name
+    class_ = data.student_class[student]
+    count, total, passes, _ = group_stats(class_, n_classes, marks)
+    class_students = distinct_count(class_, n_classes, student, n_students)
+    by_class = {
+        data.class_values[i]: {
+            'mean': round_stat(float(total[i] / count[i])),
+            'pass_rate': round_stat(float(passes[i] * 100 / count[i])),
+            'total_students': int(class_students[i])
+        } for i in np.flatnonzero(count)
+    }
+
+    grade_counts = np.bincount(data.grade[mask], minlength=len(data.grade_values))
+    grade_distribution = {data.grade_values[i]: int(grade_counts[i]) for i in np.flatnonzero(grade_counts)}
+
+    students_exam_id = exam_id or latest_exam_id(school_id)
+    all_students, student_codes = _student_scores(data, data.select(students_exam_id))
+    by_class_detailed = _class_details(data, all_students, student_codes)
+    averages = np.array([student['avg_score'] for student in all_students])
+
+    top_students = [{
+        'name': s['name'],
+        'avg_score': round_stat(s['avg_score']),
+        'total_score': round_stat(s['total_score']),
+        'grade': get_grade_from_score(s['avg_score'])
+    } for s in all_students[:5]]
+
+    bottom_students = [{
+        'name': s['name'],
+        'avg_score': round_stat(s['avg_score']),
+        'total_score': round_stat(s['total_score']),
+        'grade': get_grade_from_score(s['avg_score'])
+    } for s in all_students[-5:]]
+
+    return {
+        'overall': {
+            'mean': round_stat(float(marks.sum() / len(marks))),
+            'pass_rate': round_stat(float(np.count_nonzero(marks >= PASS_MARK) * 100 / len(marks))),
+            'total_students': len(np.unique(student)),
+            'active_students': len(np.unique(student)),
+            'total_subjects': len(by_subject),
+            'core_subjects': len(by_subject),
+            'total_results': int(mask.sum()),
+            'student_mean': round_stat(float(averages.sum() / len(averages))),
+            'student_pass_rate': round_stat(float(np.count_nonzero(averages >= PASS_MARK) * 100 / len(averages)))
+        },
+        'by_subject': by_subject,
+        'by_class': by_class,
+        'by_class_detailed': by_class_detailed,
+        'grade_distribution': grade_distribution,
+        'teacher_performance': _teacher_performance(data),
+        'students_exam_id': students_exam_id,
+        'all_students': all_students,
+        'top_students': top_students,
+        'bottom_students': bottom_students,
+        'trends': get_performance_trends(school_id)
+    }
+
+
+def _student_scores(data, mask):
+    """
+    Per-student score rows sorted by total, with their student codes; the latest stored
+    mark per subject name wins
+    """
+    n_subjects = len(data.subject_names)
+    rows = np.flatnonzero(mask)
+    keys = data.student[rows].astype(np.int64) * n_subjects + data.subject_name_of_id[data.subject_id[rows]]
+
+    # Rows are in storage order, so the first hit in the reversed keys is the latest mark
+    keys, last = np.unique(keys[::-1], return_index=True)
+    latest = data.marks[rows[::-1][last]]
+    student, subject = keys // n_subjects, keys % n_subjects
+
+    n_students = len(data.student_ids)
+    totals = np.bincount(student, weights=latest, minlength=n_students)
+    counts = np.bincount(student, minlength=n_students)
+    starts = np.searchsorted(student, np.arange(n_students + 1))
+
+    # Stable sort, so equal totals keep student order like the SQL path
+    present = np.flatnonzero(counts)
+    order = present[np.argsort(-totals[present], kind='stable')]
+
+    all_students = []
+    for i in order:
+        span = slice(starts[i], starts[i + 1])
+        all_students.append({
+            'id': data.student_ids[i],
+            'name': data.student_names[i],
+            'class_name': data.class_values[data.student_class[i]],
+            'stream': data.stream_values[data.student_stream[i]],
+            'scores': {data.subject_names[s]: float(m) for s, m in zip(subject[span], latest[span])},
+            'total_score': float(totals[i]),
+            'avg_score': float(totals[i] / counts[i])
+        })
+
+    return all_students, order
+
+
+def _class_details(data, all_students, student_codes):
+    """by_class_detailed: per class and stream means and pass rates over student averages"""
+    class_names = [name for name, in db.session.query(AcademicClass.name)
+                   .filter(AcademicClass.school_id == data.school_id)
+                   .order_by(AcademicClass.name)]
+
+    n_classes, n_streams = len(data.class_values), len(data.stream_values)
+    class_ = data.student_class[student_codes]
+    stream = data.student_stream[student_codes]
+    averages = np.array([s['avg_score'] for s in all_students], dtype=np.float64)
+
+    count, total, passes, _ = group_stats(class_, n_classes, averages)
+    pair = class_ * n_streams + stream
+    pair_count, pair_total, pair_passes, _ = group_stats(pair, n_classes * n_streams, averages)
+
+    students_by_class = {}
+    students_by_pair = {}
+    for student, c, p in zip(all_students, class_, pair):
+        students_by_class.setdefault(c, []).append(student)
+        students_by_pair.setdefault(p, []).append(student)
+
+    class_codes = {name: code for code, name in enumerate(data.class_values)}
+    by_class_detailed = {}
+    for name in class_names:
+        c = class_codes.get(name)
+        if c is None or not count[c]:
+            by_class_detailed[name] = {'students': [], 'mean': 0, 'pass_rate': 0, 'streams': None}
+            continue
+
+        streams = {}
+        for s, stream_name in enumerate(data.stream_values):
+            p = c * n_streams + s
+            if stream_name and pair_count[p]:
+                streams[stream_name] = {
+                    'students': students_by_pair[p],
+                    'mean': round_stat(float(pair_total[p] / pair_count[p])),
+                    'pass_rate': round_stat(float(pair_passes[p] * 100 / pair_count[p]))
+                }
+
+        by_class_detailed[name] = {
+            'students': students_by_class[c],
+            'mean': round_stat(float(total[c] / count[c])),
+            'pass_rate': round_stat(float(passes[c] * 100 / count[c])),
+            'streams': streams or None
+        }
+    return by_class_detailed
+
+
+def _teacher_performance(data):
+    """Teacher statistics over every exam of the school, like the SQL path"""
+    assignments = (db.session.query(User.id, User.username, teacher_subjects.c.subject_id)
+                   .join(teacher_subjects, teacher_subjects.c.teacher_id == User.id)
+                   .join(Subject, teacher_subjects.c.subject_id == Subject.id)
+                   .join(AcademicClass, Subject.academic_class_id == AcademicClass.id)
+                   .filter(AcademicClass.school_id == data.school_id)
+                   .order_by(User.id)
+                   .all())
+    if not assignments:
+        return []
+
+    n_subject_ids = len(data.subject_ids)
+    count, total, passes, _ = group_stats(data.subject_id, n_subject_ids, data.marks)
+    subject_codes = {subject_id: code for code, subject_id in enumerate(data.subject_ids)}
+
+    teachers = {}
+    for teacher_id, username, subject_id in assignments:
+        code = subject_codes.get(subject_id)
+        if code is None:
+            continue
+        teacher = teachers.setdefault(teacher_id, {'name': username, 'codes': []})
+        teacher['codes'].append(code)
+
+    performance = []
+    for teacher in teachers.values():
+        codes = np.array(teacher['codes'])
+        results = count[codes].sum()
+        performance.append({
+            'name': teacher['name'],
+            'subject_count': len(codes),
+            'avg_score': round_stat(float(total[codes].sum() / results)),
+            'pass_rate': round_stat(float(passes[codes].sum() * 100 / results))
+        })
+    return performance
+
+
+def _factorize(values):
+    """Integer codes for a sequence of hashable values, and the distinct values in code order"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64,
+                        count=len(values))
+    return codes, list(index)
+
+
+def _factorize_ids(ids):
+    """Vectorized _factorize for integer ids; codes follow ascending id order"""
+    values, codes = np.unique(ids, return_inverse=True)
+    return codes.astype(np.int64), values.tolist()
+
+
+def _factorize_text(values):
+    """Vectorized _factorize for short text such as grades; None is kept as its own value"""
+    missing = values == None  # noqa: E711 - elementwise comparison
+    text = np.where(missing, '', values).astype(str)
+    distinct, codes = np.unique(text, return_inverse=True)
+    labels = distinct.tolist()
+    if missing.any():
+        codes = np.where(missing, len(labels), codes)
+        labels.append(None)
+    return codes.astype(np.int64), labels
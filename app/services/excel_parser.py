@@ -1,6 +1,14 @@
+import hashlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import phonenumbers
+import email_validator
 from email_validator import validate_email, EmailNotValidError
 from flask import current_app
 from flask_login import current_user
@@ -14,10 +22,23 @@ from app.models import (
     AcademicClass,
     StudentContact,
     School,
-    User
+    User,
+    IngestCheckpoint,
+    ExamStudentSummary,
+    ResultAggregate,
+    UploadJob
 )
 from app.services.grading import calculate_grade
+from app.services.instrumentation import StageTimer, count_statement
+from app.services.ranking import rank_exam
+from app.services.aggregates import refresh_exam_aggregates, withdraw_exam_aggregates
+from app.services.cache import bump_data_version
+from app.services.trends import refresh_school_trends
+from app.services.workbook import open_workbook, FrameWorkbook
+from sqlalchemy import insert, update, inspect
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -29,37 +50,90 @@ REQUIRED_SHEETS = {
     'Student Results': ['AdmissionNo', 'StudentName', 'Class']
 }
 
+# Columns written by the bulk result insert path, in COPY order
+RESULT_COLUMNS = [
+    'exam_id', 'student_id', 'subject_id', 'marks', 'grade',
+    'paper_number', 'remark', 'position'
+]
+BULK_INSERT_BATCH_SIZE = 5000
 
-def process_exam_upload(file_stream):
+# Student Results rows parsed and written per chunk in streaming mode
+STREAM_CHUNK_SIZE = 2000
+
+# Students ingested between progress callbacks
+PROGRESS_INTERVAL = 200
+
+# Seconds without checkpoint progress after which an incomplete exam counts as abandoned
+ABANDONED_UPLOAD_AGE = 30 * 60
+
+# Contact validation: memoized distinct values; emails go to a thread pool only when
+# deliverability checks make validation wait on DNS
+CONTACT_EMAIL_FIELDS = ['parent1_email', 'parent2_email', 'school_email']
+CONTACT_PHONE_FIELDS = ['parent1_whatsapp', 'parent2_whatsapp']
+CONTACT_CACHE_SIZE = 4096
+PARALLEL_VALIDATION_THRESHOLD = 50
+
+# Seconds that dry-run lookup maps stay cached per school
+LOOKUP_CACHE_TTL = 300
+
+# Non-subject columns of the Student Results sheet
+RESULT_META_COLUMNS = ['AdmissionNo', 'StudentName', 'Class', 'Stream', 'CommRefID', 'Remarks']
+
+
+def process_exam_upload(file_stream, school_id=None, uploader_id=None, **parser_options):
     """
-    Process exam uploads with improved error handling and dynamic school assignment
+    Process exam uploads with improved error handling and dynamic school assignment.
+    school_id and uploader_id default to the logged-in user; background jobs pass them
+    explicitly. Extra keyword arguments are forwarded to ExamParser.parse_excel, except
+    progress_callback which is handed to the parser itself.
     Returns dict with processed data statistics
     """
     try:
-        if not current_user.is_authenticated:
-            raise ValueError("User must be logged in to upload exams")
+        if school_id is None or uploader_id is None:
+            if not current_user.is_authenticated:
+                raise ValueError("User must be logged in to upload exams")
+
+            if not current_user.school_id:
+                raise ValueError("User is not associated with any school")
 
-        if not current_user.school_id:
-            raise ValueError("User is not associated with any school")
+            school_id = current_user.school_id
+            uploader_id = current_user.id
 
-        parser = ExamParser()
+        parser = ExamParser(
+            progress_callback=parser_options.pop('progress_callback', None),
+            contact_workers=current_app.config.get('CONTACT_VALIDATION_WORKERS')
+        )
         success, message = parser.parse_excel(
             file_stream=file_stream,
-            school_id=current_user.school_id,
-            uploader_id=current_user.id
+            school_id=school_id,
+            uploader_id=uploader_id,
+            **parser_options
         )
 
+        if parser_options.get('dry_run'):
+            return {
+                'status': 'success' if success else 'error',
+                'dry_run': True,
+                'message': message,
+                'report': parser.validation_report,
+                'timings': parser.timings
+            }
+
         if not success:
             raise ValueError(message)
 
         return {
             'status': 'success',
-            'students': Student.query.filter_by(school_id=current_user.school_id).count(),
+            'students': Student.query.filter_by(school_id=school_id).count(),
             'results': ExamResult.query.join(Exam).filter(
-                Exam.school_id == current_user.school_id
+                Exam.school_id == school_id
             ).count(),
             'message': message,
-            'exam_id': parser.current_exam.id if parser.current_exam else None
+            'exam_id': parser.current_exam.id if parser.current_exam else None,
+            'students_processed': parser.students_processed,
+            'changes': parser.change_summary,
+            'row_errors': parser.row_errors,
+            'timings': parser.timings
         }
 
     except Exception as e:
@@ -71,68 +145,435 @@ def process_exam_upload(file_stream):
 
 
 class ExamParser:
-    def __init__(self):
+    def __init__(self, bulk_insert=True, progress_callback=None, contact_workers=None):
         self.school_id = None
         self.uploader_id = None
         self.current_exam = None
         self.current_school = None
+        self.bulk_insert = bulk_insert
+        self.progress_callback = progress_callback
+        self.contact_workers = contact_workers
+        self.upload_format = 'excel'
+        self.students_total = None
+        self.students_processed = 0
+        self._pending_results = []
+        self._pending_updates = []
+        self._existing_results = None
+        self.upsert = False
+        self.change_summary = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        self.commit_every = None
+        self.commit_threshold = 0
+        self.batch_exams = None
+        self.checkpoint = None
+        self._source_digest = None
+        self._student_position = 0
+        self._resume_from = 0
+        self._protected_student_ids = set()
+        self._students = {}
+        self._classes = {}
+        self._subjects = {}
+        self.row_errors = []
+        self.contact_errors = []
+        self.validation_report = None
+        self.timer = StageTimer()
+        self.timings = None
 
-    def parse_excel(self, file_stream, school_id, uploader_id):
-        """Main method to parse the complete Excel template"""
+    def parse_excel(self, file_stream, school_id, uploader_id, streaming=False, chunk_size=STREAM_CHUNK_SIZE,
+                    upsert=False, commit_every=None, commit_threshold=0, resume=False, batch_exams=None,
+                    dry_run=False):
+        """
+        Main method to parse the complete Excel template, or a ZIP bundle of
+        CSV/Parquet files holding the same four sheets.
+        With streaming=True the Student Results sheet is read chunk_size rows at
+        a time (openpyxl's read-only iterator for workbooks) and ingested per chunk.
+        With upsert=True a re-upload of an existing exam (same name, academic year,
+        semester and school) only writes inserted, changed and deleted results.
+        With commit_every=N, uploads of more than commit_threshold students commit
+        every N students and record an IngestCheckpoint; the exam stays incomplete,
+        and out of analytics, until the final commit. Smaller uploads commit once.
+        resume=True continues a failed or interrupted upload of the same file from
+        its last committed chunk instead of starting over.
+        batch_exams is a dict shared by the workbooks of one batch upload: each
+        workbook's results are appended to the batch's exam of the same name, academic
+        year and semester, results missing from a workbook are kept, and the exam stays
+        incomplete until finalize_exams ranks it once the whole batch is in.
+        Otherwise class and stream positions and the exam's result aggregates are rebuilt, and the
+        school's data version bumped to invalidate cached analytics, before the final commit.
+        With dry_run=True nothing is written: the file is validated and resolved
+        against cached lookups and the findings are left in self.validation_report.
+        Per-stage wall/CPU time, row and SQL statement counts are left in self.timings.
+        """
         self.school_id = school_id
         self.uploader_id = uploader_id
+        self.row_errors = []
+        self.contact_errors = []
+        self.validation_report = None
+        self.students_total = None
+        self.students_processed = 0
+        self.upsert = upsert
+        self._existing_results = None
+        self.change_summary = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        self.commit_every = commit_every
+        self.commit_threshold = commit_threshold or 0
+        self.batch_exams = batch_exams
+        self.checkpoint = None
+        self._source_digest = None
+        self._student_position = 0
+        self._resume_from = 0
+        self._protected_student_ids = set()
+        self.timer = StageTimer()
+        self.timings = None
+        workbook = None
+        session = db.session()
+        expire_on_commit = session.expire_on_commit
 
         try:
-            # Validate school exists
-            self.current_school = School.query.get(self.school_id)
-            if not self.current_school:
+            # Validate school exists; dry runs find it in the cached lookups
+            if dry_run:
+                lookups = get_lookup_cache(self.school_id)
+                school_found = lookups is not None
+            else:
+                self.current_school = School.query.get(self.school_id)
+                school_found = self.current_school is not None
+            if not school_found:
                 raise ValueError(f"School with ID {self.school_id} does not exist")
 
-            xls = pd.ExcelFile(file_stream)
-            self._validate_sheet_structure(xls)
+            if not dry_run:
+                with self.timer.stage('load_lookups') as stage:
+                    self._load_lookups()
+                    stage['rows'] = len(self._students)
+
+            with self.timer.stage('open_workbook'):
+                self._source_digest = file_digest(file_stream) if commit_every and not dry_run else None
+                workbook = open_workbook(file_stream, streaming=streaming)
+                self.upload_format = workbook.format
+                self._validate_sheet_structure(workbook)
 
-            exam_data = self._parse_metadata_sheet(xls)
-            contacts_data = self._parse_contacts_sheet(xls)
-            subjects_config = self._parse_subjects_sheet(xls)
-            results = self._parse_results_sheet(xls, subjects_config)
+            with self.timer.stage('parse_metadata', rows=1):
+                exam_data = self._parse_metadata_sheet(workbook)
+            with self.timer.stage('parse_contacts') as stage:
+                contacts_data = self._parse_contacts_sheet(workbook)
+                stage['rows'] = len(contacts_data)
+            with self.timer.stage('parse_subjects') as stage:
+                subjects_config = self._parse_subjects_sheet(workbook)
+                stage['rows'] = len(subjects_config)
+            if streaming:
+                result_chunks = self._iter_results_chunks(workbook, subjects_config, chunk_size)
+            else:
+                result_chunks = [self._parse_results_sheet(workbook, subjects_config)]
+                self.students_total = len(result_chunks[0])
 
-            self.current_exam = self._create_exam_record(exam_data)
+            if dry_run:
+                with self.timer.stage('validate'):
+                    return self._dry_run(exam_data, result_chunks, lookups)
+
+            with self.timer.stage('create_exam'):
+                if commit_every:
+                    # Lookup maps must stay usable across the intermediate commits
+                    session.expire_on_commit = False
+                    if resume:
+                        self._resume_checkpoint()
+                if not self.checkpoint:
+                    self.current_exam = self._create_exam_record(exam_data)
+                if batch_exams is not None:
+                    self._mark_incomplete()
 
             processed_students = 0
-            for admission_no, data in results.items():
-                try:
-                    self._process_student_record(
-                        admission_no,
-                        data,
-                        contacts_data.get(admission_no, {})
-                    )
-                    processed_students += 1
-                except Exception as e:
-                    logger.warning(f"Skipped student {admission_no}: {str(e)}")
-                    continue
+            parsed_students = 0
+            for results in result_chunks:
+                parsed_students += len(results)
+                processed_students += self._ingest_results(results, contacts_data)
 
-            db.session.commit()
+            if not parsed_students:
+                raise ValueError("No valid student results found in the sheet")
+
+            if self.students_total is None:
+                self.students_total = parsed_students
+                self._report_progress()
+
+            if batch_exams is None:
+                if self._existing_results is not None:
+                    with self.timer.stage('delete_missing'):
+                        self._delete_missing_results()
+
+                with self.timer.stage('rank_positions') as stage:
+                    stage['rows'] = rank_exam(self.current_exam.id)
+
+                with self.timer.stage('refresh_aggregates') as stage:
+                    stage['rows'] = refresh_exam_aggregates(self.current_exam.id)
+
+                with self.timer.stage('refresh_trends') as stage:
+                    stage['rows'] = refresh_school_trends(self.school_id)
+                bump_data_version(self.school_id)
+
+            if self.checkpoint:
+                self.checkpoint.students_committed = self._student_position
+                self.checkpoint.status = 'complete'
+                self.current_exam.is_complete = True
+
+            with self.timer.stage('commit'):
+                db.session.commit()
+            if batch_exams is not None:
+                batch_exams[exam_identity(exam_data)] = self.current_exam.id
+            clear_lookup_cache(self.school_id)
             logger.info(
                 f"Successfully uploaded exam results for {processed_students} students "
-                f"to exam ID: {self.current_exam.id} in school ID: {self.school_id}"
+                f"to exam ID: {self.current_exam.id} in school ID: {self.school_id} "
+                f"({self._format_change_summary()})"
             )
+            if self._existing_results is not None:
+                return True, (f"Processed {processed_students} student records successfully: "
+                              f"{self._format_change_summary()}")
             return True, f"Processed {processed_students} student records successfully"
 
         except Exception as e:
+            self._pending_results = []
+            self._pending_updates = []
             db.session.rollback()
             logger.error(f"Excel parsing failed: {str(e)}", exc_info=True)
+            if dry_run:
+                self.validation_report = {'valid': False, 'message': str(e)}
+            if self.checkpoint and inspect(self.checkpoint).persistent:
+                self._fail_checkpoint()
+            if self.checkpoint and self.checkpoint.students_committed:
+                return False, (f"Error processing file: {str(e)}. "
+                               f"{self.checkpoint.students_committed} students were committed; "
+                               f"re-upload the same file to resume")
             return False, f"Error processing file: {str(e)}"
 
-    def _validate_sheet_structure(self, xls):
+        finally:
+            session.expire_on_commit = expire_on_commit
+            if workbook is not None:
+                workbook.close()
+            self._record_timings('dry_run' if dry_run else 'ingest')
+
+    def _record_timings(self, pipeline):
+        """Publish this run's stage timings as a structured log record and as metrics"""
+        self.timings = self.timer.as_dict()
+        self.timer.observe(pipeline)
+        logger.info(
+            f"{pipeline} stage timings for school ID: {self.school_id}: {json.dumps(self.timings['stages'])}",
+            extra={'pipeline': pipeline, 'school_id': self.school_id, 'timings': self.timings}
+        )
+
+    def _resume_checkpoint(self):
+        """Pick up a failed or interrupted chunked upload of the same file, if there is one"""
+        checkpoint = IngestCheckpoint.query.filter(
+            IngestCheckpoint.school_id == self.school_id,
+            IngestCheckpoint.source_digest == self._source_digest,
+            IngestCheckpoint.status.in_(['in_progress', 'failed'])
+        ).order_by(IngestCheckpoint.id.desc()).first()
+        if not checkpoint or not checkpoint.exam:
+            return
+
+        self.checkpoint = checkpoint
+        self.checkpoint.status = 'in_progress'
+        self.current_exam = checkpoint.exam
+        self._resume_from = checkpoint.students_committed or 0
+        if self.upsert:
+            self._load_existing_results(self.current_exam)
+        logger.info(
+            f"Resuming upload into exam ID: {self.current_exam.id} "
+            f"after {self._resume_from} committed students"
+        )
+
+    def _start_checkpoint(self):
+        """
+        Switch an upload that outgrew commit_threshold to chunked commits: the exam is
+        marked incomplete and a checkpoint records how far the committed chunks reach
+        """
+        self._mark_incomplete()
+        self.checkpoint = IngestCheckpoint(
+            exam_id=self.current_exam.id,
+            school_id=self.school_id,
+            source_digest=self._source_digest
+        )
+        db.session.add(self.checkpoint)
+        logger.info(f"Committing exam ID: {self.current_exam.id} in chunks of {self.commit_every} students")
+
+    def _mark_incomplete(self):
+        """Take the exam out of analytics while its results are written across several commits"""
+        if not self.current_exam.is_complete:
+            return
+        self.current_exam.is_complete = False
+        if self._existing_results is not None:
+            # A re-uploaded exam's stored analytics no longer match its results
+            withdraw_exam_aggregates(self.current_exam.id)
+            refresh_school_trends(self.school_id)
+            bump_data_version(self.school_id)
+
+    def _fail_checkpoint(self):
+        """Record that a chunked upload stopped; its exam stays incomplete until resumed or discarded"""
+        try:
+            self.checkpoint.status = 'failed'
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Could not mark checkpoint ID: {self.checkpoint.id} as failed: {str(e)}")
+
+    def _commit_chunk(self):
+        """Write and commit the students handled so far and advance the checkpoint"""
+        if not self.checkpoint:
+            self._start_checkpoint()
+        self._flush_pending_results()
+        self.checkpoint.students_committed = self._student_position
+        with self.timer.stage('commit'):
+            db.session.commit()
+        logger.debug(f"Committed {self._student_position} students for exam ID: {self.current_exam.id}")
+
+    def _dry_run(self, exam_data, result_chunks, lookups):
+        """
+        Validate and resolve parsed sheets against the school's cached lookups without
+        writing anything; returns (valid, message)
+        """
+        exam_errors = self._validate_exam_data(exam_data)
+        existing_exam = None
+        if not exam_errors:
+            existing_exam = lookups['exams'].get(exam_identity(exam_data))
+
+        students = set()
+        new_students, new_classes, new_subjects = set(), set(), set()
+        result_count = 0
+        student_errors = []
+        for results in result_chunks:
+            for admission_no, data in results.items():
+                students.add(admission_no)
+                class_id = lookups['students'].get(admission_no)
+                if class_id is None:
+                    if not data.get('class_name'):
+                        student_errors.append({
+                            'row': data.get('row'),
+                            'admission_no': admission_no,
+                            'errors': ["Class name is required"]
+                        })
+                        continue
+                    new_students.add(admission_no)
+                    class_key = (data['class_name'], data.get('stream') or '')
+                    class_id = lookups['classes'].get(class_key)
+                    if class_id is None:
+                        new_classes.add(' '.join(filter(None, class_key)))
+                        class_id = class_key
+
+                for result in data['results']:
+                    result_count += 1
+                    if (result['subject'], class_id) not in lookups['subjects']:
+                        new_subjects.add((result['subject'], class_id))
+
+        row_errors = sorted(self.row_errors + student_errors, key=lambda error: error['row'] or 0)
+        if not students:
+            exam_errors.append("No valid student results found in the sheet")
+
+        self.validation_report = {
+            'valid': not exam_errors and not row_errors,
+            'exam': {
+                'name': str(exam_data.get('ExamName', '')),
+                'errors': exam_errors,
+                'existing_exam_id': existing_exam
+            },
+            'students': len(students),
+            'results': result_count,
+            'new_students': len(new_students),
+            'new_classes': sorted(new_classes),
+            'new_subjects': len(new_subjects),
+            'row_errors': row_errors,
+            'contact_errors': self.contact_errors
+        }
+        db.session.rollback()
+
+        if self.validation_report['valid']:
+            return True, (f"Validation passed: {len(students)} students and {result_count} results "
+                          f"are ready to upload")
+        return False, (f"Validation found {len(row_errors)} row errors"
+                       + (f" and exam errors: {'; '.join(exam_errors)}" if exam_errors else ""))
+
+    def _ingest_results(self, results, contacts_data):
+        """Write one batch of parsed student results; returns the number of students processed"""
+        with self.timer.stage('resolve_students') as stage:
+            processed_students = self._resolve_students(results, contacts_data)
+            stage['rows'] = processed_students
+
+        self._flush_pending_results()
+        self._report_progress()
+        return processed_students
+
+    def _resolve_students(self, results, contacts_data):
+        """Resolve or create each student and queue their results; returns the number processed"""
+        self._create_students(results, contacts_data)
+        processed_students = 0
+        for admission_no, data in results.items():
+            self._student_position += 1
+            if self._student_position <= self._resume_from:
+                # Already committed by the interrupted run
+                student = self._students.get(admission_no)
+                if student:
+                    self._protected_student_ids.add(student.id)
+                continue
+
+            try:
+                self._process_student_record(
+                    admission_no,
+                    data,
+                    contacts_data.get(admission_no, {})
+                )
+                processed_students += 1
+                self.students_processed += 1
+            except Exception as e:
+                logger.warning(f"Skipped student {admission_no}: {str(e)}")
+                # A student who failed keeps their stored marks rather than losing them as missing
+                student = self._students.get(admission_no)
+                if student:
+                    self._protected_student_ids.add(student.id)
+                continue
+
+            if self.students_processed % PROGRESS_INTERVAL == 0:
+                self._report_progress()
+
+            if (self.commit_every and self._student_position > self.commit_threshold
+                    and self._student_position % self.commit_every == 0):
+                self._commit_chunk()
+
+        return processed_students
+
+    def _report_progress(self):
+        """Notify the progress callback, if any, of the students ingested so far"""
+        if self.progress_callback:
+            self.progress_callback(self.students_processed, self.students_total)
+
+    def _load_lookups(self):
+        """Load the school's students, classes (by name and stream) and subjects into in-memory lookup maps"""
+        self._classes = {}
+        for class_ in AcademicClass.query.filter_by(school_id=self.school_id).order_by(AcademicClass.id):
+            self._classes.setdefault((class_.name, class_.stream or ''), class_)
+
+        self._students = {
+            student.admission_number: student
+            for student in Student.query.join(AcademicClass)
+            .filter(AcademicClass.school_id == self.school_id)
+            .options(selectinload(Student.contacts))
+        }
+
+        self._subjects = {}
+        subjects = Subject.query.join(AcademicClass).filter(
+            AcademicClass.school_id == self.school_id
+        ).order_by(Subject.id)
+        for subject in subjects:
+            self._subjects.setdefault((subject.name, subject.academic_class_id), subject)
+
+        logger.debug(
+            f"Loaded {len(self._students)} students, {len(self._classes)} classes and "
+            f"{len(self._subjects)} subjects for school ID: {self.school_id}"
+        )
+
+    def _validate_sheet_structure(self, workbook):
         """Validate the Excel file structure before processing"""
-        missing_sheets = [sheet for sheet in REQUIRED_SHEETS if sheet not in xls.sheet_names]
+        missing_sheets = [sheet for sheet in REQUIRED_SHEETS if sheet not in workbook.sheet_names]
         if missing_sheets:
             raise ValueError(f"Missing required sheets: {', '.join(missing_sheets)}")
 
-    def _parse_metadata_sheet(self, xls):
+    def _parse_metadata_sheet(self, workbook):
         """Parse the Exam Metadata sheet with validation"""
         try:
-            df = pd.read_excel(xls, sheet_name='Exam Metadata')
+            df = workbook.read_sheet('Exam Metadata')
             missing_cols = [col for col in REQUIRED_SHEETS['Exam Metadata'] if col not in df.columns]
             if missing_cols:
                 raise ValueError(f"Metadata sheet missing columns: {', '.join(missing_cols)}")
@@ -142,20 +583,10 @@ class ExamParser:
             logger.error(f"Error parsing metadata sheet: {str(e)}")
             raise ValueError(f"Invalid metadata sheet: {str(e)}")
 
-    def _parse_contacts_sheet(self, xls):
+    def _parse_contacts_sheet(self, workbook):
         """Parse the Student Contacts sheet with flexible column handling"""
         try:
-            df = pd.read_excel(xls, sheet_name='Student Contacts')
-
-            # Handle case-insensitive column names
-            column_map = {
-                'admissionno': 'AdmissionNo',
-                'parent1_email': 'Parent1_Email',
-                'parent2_email': 'Parent2_Email',
-                'school_email': 'School_Email',
-                'parent1_whatsapp': 'Parent1_WhatsApp',
-                'parent2_whatsapp': 'Parent2_WhatsApp'
-            }
+            df = workbook.read_sheet('Student Contacts')
 
             # Normalize column names
             df.columns = df.columns.str.strip().str.lower()
@@ -164,29 +595,61 @@ class ExamParser:
             if 'admissionno' not in df.columns:
                 raise ValueError("Contacts sheet must contain 'AdmissionNo' column")
 
-            contacts = {}
-            for _, row in df.iterrows():
-                admission_no = str(row['admissionno']).strip()
-                if not admission_no:
+            admission_numbers = df['admissionno'].astype(str).str.strip()
+            keep = admission_numbers != ''
+
+            # Validate each distinct value once per column, then map back onto the rows
+            validated = {}
+            for field in CONTACT_EMAIL_FIELDS + CONTACT_PHONE_FIELDS:
+                if field not in df.columns:
+                    validated[field] = [None] * int(keep.sum())
                     continue
+                validator = self._validate_email if field in CONTACT_EMAIL_FIELDS else self._validate_phone
+                validated[field] = self._validate_contact_column(df.loc[keep, field], validator)
+                self._record_contact_errors(field, df.loc[keep, field], validated[field], admission_numbers[keep])
 
-                contacts[admission_no] = {
-                    'parent1_email': self._validate_email(row.get('parent1_email')),
-                    'parent2_email': self._validate_email(row.get('parent2_email')),
-                    'school_email': self._validate_email(row.get('school_email')),
-                    'parent1_whatsapp': self._validate_phone(row.get('parent1_whatsapp')),
-                    'parent2_whatsapp': self._validate_phone(row.get('parent2_whatsapp'))
-                }
-            return contacts
+            fields = CONTACT_EMAIL_FIELDS + CONTACT_PHONE_FIELDS
+            return {
+                admission_no: dict(zip(fields, values))
+                for admission_no, *values in zip(admission_numbers[keep], *(validated[f] for f in fields))
+            }
 
         except Exception as e:
             logger.error(f"Error parsing contacts sheet: {str(e)}")
             raise ValueError(f"Invalid contacts sheet: {str(e)}")
 
-    def _parse_subjects_sheet(self, xls):
+    def _record_contact_errors(self, field, column, validated, admission_numbers):
+        """Note contact values that were supplied but failed validation"""
+        text = column.astype(str).str.strip().str.lower()
+        supplied = column.notna() & ~text.isin(['', '-', 'n/a', 'null', 'nan'])
+        rejected = supplied & pd.Series([value is None for value in validated], index=column.index)
+        for row_number in column.index[rejected]:
+            self.contact_errors.append({
+                'row': int(row_number) + 2,
+                'admission_no': admission_numbers[row_number],
+                'errors': [f"Invalid {field.replace('_', ' ')}: {column[row_number]}"]
+            })
+
+    def _validate_contact_column(self, column, validator):
+        """
+        Validate the distinct values of a contact column. Email columns are spread
+        across a thread pool when contact_workers is set, deliverability checks are
+        on and the column is large enough; otherwise validation is CPU-bound and
+        threads only add overhead. Returns a list aligned with the column.
+        """
+        distinct_values = column.dropna().unique().tolist()
+        if (self.contact_workers and validator == self._validate_email and email_validator.CHECK_DELIVERABILITY
+                and len(distinct_values) >= PARALLEL_VALIDATION_THRESHOLD):
+            with ThreadPoolExecutor(max_workers=self.contact_workers) as pool:
+                normalized = dict(zip(distinct_values, pool.map(validator, distinct_values)))
+        else:
+            normalized = {value: validator(value) for value in distinct_values}
+        return [normalized.get(value) for value in column]
+
+    def _parse_subjects_sheet(self, workbook):
         """Parse the Subject Configuration sheet"""
         try:
-            df = pd.read_excel(xls, sheet_name='Subject Configuration')
+            df = workbook.read_sheet('Subject Configuration')
             if 'SubjectCode' not in df.columns:
                 raise ValueError("Subjects sheet must contain 'SubjectCode' column")
 
@@ -195,44 +658,20 @@ class ExamParser:
             logger.error(f"Error parsing subjects sheet: {str(e)}")
             raise ValueError(f"Invalid subjects sheet: {str(e)}")
 
-    def _parse_results_sheet(self, xls, subjects_config):
+    def _parse_results_sheet(self, workbook, subjects_config):
         """Parse the Student Results sheet with validation"""
         try:
-            df = pd.read_excel(xls, sheet_name='Student Results')
+            with self.timer.stage('parse_results') as stage:
+                df = workbook.read_sheet('Student Results')
+                stage['rows'] = len(df)
 
-            # Check for required columns
-            missing_cols = [col for col in REQUIRED_SHEETS['Student Results'] if col not in df.columns]
-            if missing_cols:
-                raise ValueError(f"Results sheet missing columns: {', '.join(missing_cols)}")
-
-            results = {}
-            for _, row in df.iterrows():
-                try:
-                    admission_no = str(row['AdmissionNo']).strip()
-                    if not admission_no:
-                        continue
+                # Check for required columns
+                missing_cols = [col for col in REQUIRED_SHEETS['Student Results'] if col not in df.columns]
+                if missing_cols:
+                    raise ValueError(f"Results sheet missing columns: {', '.join(missing_cols)}")
 
-                    if admission_no not in results:
-                        results[admission_no] = {
-                            'student_name': str(row['StudentName']).strip(),
-                            'class_name': str(row['Class']).strip(),
-                            'stream': str(row.get('Stream', '')).strip(),
-                            'results': []
-                        }
-
-                    for col in row.index:
-                        if col not in ['AdmissionNo', 'StudentName', 'Class', 'Stream', 'CommRefID', 'Remarks']:
-                            if pd.notna(row[col]):
-                                subject_name, paper_num = self._parse_subject_column(col, subjects_config)
-                                results[admission_no]['results'].append({
-                                    'subject': subject_name,
-                                    'paper': paper_num,
-                                    'marks': float(row[col]),
-                                    'remarks': str(row.get('Remarks', '')).strip()
-                                })
-                except Exception as e:
-                    logger.warning(f"Error processing row for admission {row.get('AdmissionNo')}: {str(e)}")
-                    continue
+                long_df, students_df = self._melt_results_frame(df, subjects_config)
+                results = self._group_results(long_df, students_df)
 
             if not results:
                 raise ValueError("No valid student results found in the sheet")
@@ -244,24 +683,182 @@ class ExamParser:
             logger.error(f"Error parsing results sheet: {str(e)}")
             raise ValueError(f"Invalid results sheet: {str(e)}")
 
+    def _iter_results_chunks(self, workbook, subjects_config, chunk_size):
+        """Yield per-student results for successive row chunks of the Student Results sheet"""
+        parsed_students = 0
+        chunks = workbook.iter_sheet_chunks('Student Results', chunk_size)
+        while True:
+            # Reading a chunk counts towards parsing; ingesting it is timed by the consumer
+            with self.timer.stage('parse_results') as stage:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                df, first_row = chunk
+                stage['rows'] = len(df)
+
+                missing_cols = [col for col in REQUIRED_SHEETS['Student Results'] if col not in df.columns]
+                if missing_cols:
+                    raise ValueError(
+                        f"Invalid results sheet: Results sheet missing columns: {', '.join(missing_cols)}"
+                    )
+
+                long_df, students_df = self._melt_results_frame(df, subjects_config, first_row)
+                results = self._group_results(long_df, students_df)
+            parsed_students += len(results)
+            logger.debug(f"Parsed results chunk starting at row {first_row}: {len(results)} students")
+            yield results
+
+        logger.info(f"Parsed results for {parsed_students} students")
+
+    def _melt_results_frame(self, df, subjects_config, first_row=2):
+        """
+        Melt the wide results sheet into a long (admission, subject, paper, marks) frame.
+        Subject columns are resolved once per column; rows with unusable cells are
+        recorded in self.row_errors by their worksheet row number and dropped.
+        Returns (long_df, students_df).
+        """
+        df = df.reset_index(drop=True)
+        df.index = df.index + first_row
+        df = df.loc[~df.isna().all(axis=1)]
+
+        subject_cols = [col for col in df.columns if col not in RESULT_META_COLUMNS]
+        subject_names, papers, bad_columns = {}, {}, []
+        for col in subject_cols:
+            try:
+                subject_names[col], papers[col] = self._parse_subject_column(col, subjects_config)
+            except ValueError:
+                bad_columns.append(col)
+        valid_cols = [col for col in subject_cols if col in subject_names]
+
+        admission = df['AdmissionNo'].astype('string').str.strip()
+        missing_admission = admission.isna() | (admission == '')
+
+        cells = df[subject_cols]
+        marks = cells[valid_cols].apply(pd.to_numeric, errors='coerce')
+        invalid = cells.notna() & pd.concat([marks.isna(), cells[bad_columns].notna()], axis=1)[subject_cols]
+        bad_rows = missing_admission | invalid.any(axis=1)
+
+        if bad_rows.any():
+            self._record_row_errors(admission[bad_rows], missing_admission[bad_rows], invalid[bad_rows])
+
+        keep = ~bad_rows
+        long_df = (marks.loc[keep]
+                   .melt(var_name='column', value_name='marks', ignore_index=False)
+                   .dropna(subset=['marks'])
+                   .sort_index(kind='stable'))
+        long_df['admission_no'] = admission.loc[long_df.index]
+        long_df['subject'] = long_df['column'].map(subject_names)
+        long_df['paper'] = long_df['column'].map(papers).astype('Int64')
+        remarks = df['Remarks'] if 'Remarks' in df.columns else pd.Series('', index=df.index)
+        long_df['remarks'] = remarks.fillna('').astype(str).str.strip().loc[long_df.index]
+        long_df = long_df.rename_axis('row').reset_index()
+
+        stream = df['Stream'] if 'Stream' in df.columns else pd.Series('', index=df.index)
+        students_df = pd.DataFrame({
+            'admission_no': admission,
+            'student_name': df['StudentName'].astype(str).str.strip(),
+            'class_name': df['Class'].astype(str).str.strip(),
+            'stream': stream.fillna('').astype(str).str.strip()
+        }).loc[keep].drop_duplicates('admission_no')
+
+        return long_df, students_df
+
+    def _record_row_errors(self, admission, missing_admission, invalid):
+        """Add one error entry per rejected worksheet row"""
+        bad_cells = invalid.stack()
+        bad_cells = bad_cells[bad_cells]
+        columns_by_row = bad_cells.reset_index(level=1).iloc[:, 0].astype(str).groupby(level=0).agg(', '.join)
+
+        for row_number, admission_no in admission.items():
+            errors = []
+            if missing_admission[row_number]:
+                errors.append("Missing admission number")
+            if row_number in columns_by_row.index:
+                errors.append(f"Invalid marks in: {columns_by_row[row_number]}")
+            self.row_errors.append({
+                'row': int(row_number),
+                'admission_no': None if pd.isna(admission_no) else admission_no,
+                'errors': errors
+            })
+
+        logger.warning(
+            f"Skipped {len(admission)} invalid result rows: "
+            f"{', '.join(str(row) for row in admission.index[:20])}"
+        )
+
+    def _group_results(self, long_df, students_df):
+        """Group long-format marks into per-student result lists"""
+        results = {
+            admission_no: {
+                'row': int(row_number),
+                'student_name': student_name,
+                'class_name': class_name,
+                'stream': stream,
+                'results': []
+            }
+            for row_number, admission_no, student_name, class_name, stream in zip(
+                students_df.index, students_df['admission_no'], students_df['student_name'],
+                students_df['class_name'], students_df['stream']
+            )
+        }
+
+        papers = long_df['paper'].astype(object).where(long_df['paper'].notna(), None)
+        for admission_no, subject, paper, marks, remarks in zip(
+                long_df['admission_no'], long_df['subject'], papers,
+                long_df['marks'], long_df['remarks']):
+            results[admission_no]['results'].append({
+                'subject': subject,
+                'paper': paper,
+                'marks': marks,
+                'remarks': remarks
+            })
+        return results
+
     def _create_exam_record(self, exam_data):
         """Create the exam record in database with validation"""
         try:
-            required_fields = ['ExamName', 'ExamType', 'StartDate', 'Semester', 'AcademicYear']
-            missing_fields = [field for field in required_fields if field not in exam_data or not exam_data[field]]
-            if missing_fields:
-                raise ValueError(f"Missing required exam fields: {', '.join(missing_fields)}")
+            errors = self._validate_exam_data(exam_data)
+            if errors:
+                raise ValueError('; '.join(errors))
+
+            batch_exam_id = (self.batch_exams or {}).get(exam_identity(exam_data))
+            if batch_exam_id:
+                exam = db.session.get(Exam, batch_exam_id)
+                exam.upload_date = datetime.utcnow()
+                self._load_existing_results(exam)
+                logger.info(f"Appending to exam record: {exam.name} (ID: {exam.id}) for school ID: {self.school_id}")
+                return exam
+
+            self._discard_abandoned_exams(exam_data)
+
+            if self.upsert:
+                exam = Exam.query.filter_by(
+                    name=str(exam_data['ExamName']),
+                    academic_year=str(exam_data['AcademicYear']),
+                    semester=str(exam_data['Semester']),
+                    school_id=self.school_id,
+                    is_complete=True
+                ).order_by(Exam.id.desc()).first()
+                if exam:
+                    exam.exam_type = str(exam_data['ExamType'])
+                    exam.exam_date = pd.Timestamp(exam_data['StartDate']).to_pydatetime()
+                    exam.uploader_id = self.uploader_id
+                    exam.upload_date = datetime.utcnow()
+                    exam.upload_format = self.upload_format
+                    self._load_existing_results(exam)
+                    logger.info(f"Updating exam record: {exam.name} (ID: {exam.id}) for school ID: {self.school_id}")
+                    return exam
 
             exam = Exam(
                 name=str(exam_data['ExamName']),
                 exam_type=str(exam_data['ExamType']),
-                exam_date=exam_data['StartDate'],
+                exam_date=pd.Timestamp(exam_data['StartDate']).to_pydatetime(),
                 school_id=self.school_id,
                 uploader_id=self.uploader_id,
                 semester=str(exam_data['Semester']),
                 academic_year=str(exam_data['AcademicYear']),
                 template_version='2.1',
-                upload_format='excel'
+                upload_format=self.upload_format
             )
             db.session.add(exam)
             db.session.flush()
@@ -273,14 +870,89 @@ class ExamParser:
             logger.error(f"Error creating exam record: {str(e)}")
             raise ValueError(f"Failed to create exam record: {str(e)}")
 
+    def _discard_abandoned_exams(self, exam_data):
+        """
+        Delete incomplete copies of this exam whose chunked upload failed or has not
+        advanced for ABANDONED_UPLOAD_AGE seconds, e.g. before a corrected file is uploaded
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=ABANDONED_UPLOAD_AGE)
+        incomplete = Exam.query.filter_by(
+            name=str(exam_data['ExamName']),
+            academic_year=str(exam_data['AcademicYear']),
+            semester=str(exam_data['Semester']),
+            school_id=self.school_id,
+            is_complete=False
+        ).all()
+
+        abandoned = []
+        for exam in incomplete:
+            checkpoint = IngestCheckpoint.query.filter_by(exam_id=exam.id) \
+                .order_by(IngestCheckpoint.id.desc()).first()
+            last_activity = checkpoint.updated_at if checkpoint else exam.upload_date
+            if (checkpoint and checkpoint.status == 'failed') or not last_activity or last_activity < cutoff:
+                abandoned.append(exam.id)
+
+        if abandoned:
+            discard_exams(abandoned)
+            logger.info(f"Discarded abandoned partial uploads of exam IDs: {abandoned} in school ID: {self.school_id}")
+
+    def _validate_exam_data(self, exam_data):
+        """Return a list of problems with the Exam Metadata row"""
+        required_fields = ['ExamName', 'ExamType', 'StartDate', 'Semester', 'AcademicYear']
+        missing_fields = [field for field in required_fields if field not in exam_data or pd.isna(exam_data[field])
+                          or not exam_data[field]]
+        if missing_fields:
+            return [f"Missing required exam fields: {', '.join(missing_fields)}"]
+        try:
+            pd.Timestamp(exam_data['StartDate'])
+        except (ValueError, TypeError):
+            return [f"Invalid exam start date: {exam_data['StartDate']}"]
+        return []
+
+    def _load_existing_results(self, exam):
+        """Index the stored results of a re-uploaded exam by (student, subject, paper)"""
+        rows = db.session.query(
+            ExamResult.id,
+            ExamResult.student_id,
+            ExamResult.subject_id,
+            ExamResult.paper_number,
+            ExamResult.marks,
+            ExamResult.remark
+        ).filter(ExamResult.exam_id == exam.id)
+
+        self._existing_results = {
+            (row.student_id, row.subject_id, row.paper_number): (row.id, row.marks, row.remark)
+            for row in rows
+        }
+        self._pending_updates = []
+        logger.debug(f"Loaded {len(self._existing_results)} stored results for exam ID: {exam.id}")
+
+    def _delete_missing_results(self):
+        """Delete stored results that are absent from the re-uploaded workbook"""
+        # Students whose rows were rejected keep their stored marks
+        rejected = {error['admission_no'] for error in self.row_errors if error['admission_no']}
+        protected = {self._students[a].id for a in rejected if a in self._students}
+        protected |= self._protected_student_ids
+
+        stale_ids = [
+            result_id for (student_id, _, _), (result_id, _, _) in self._existing_results.items()
+            if student_id not in protected
+        ]
+        for start in range(0, len(stale_ids), BULK_INSERT_BATCH_SIZE):
+            ExamResult.query.filter(
+                ExamResult.id.in_(stale_ids[start:start + BULK_INSERT_BATCH_SIZE])
+            ).delete(synchronize_session=False)
+
+        self.change_summary['deleted'] += len(stale_ids)
+        self._existing_results = {}
+
+    def _format_change_summary(self):
+        return ', '.join(f"{count} {change}" for change, count in self.change_summary.items())
+
     def _process_student_record(self, admission_no, student_data, contact_data):
         """Process individual student record with error handling"""
         # First try to find existing student in the same school
-        student = Student.query.filter_by(
-            admission_number=admission_no
-        ).join(AcademicClass).filter(
-            AcademicClass.school_id == self.school_id
-        ).first()
+        student = self._students.get(admission_no)
 
         if not student:
             student = self._create_student(admission_no, student_data)
@@ -291,25 +963,51 @@ class ExamParser:
         for result in student_data['results']:
             self._create_exam_result(student, result)
 
+    def _create_students(self, results, contacts_data):
+        """
+        Create the batch's new students, and their contacts, with batched INSERTs.
+        Each new student's contacts relationship is set to the row just written, so
+        resolving the student issues no SELECT. Students without a class are left to
+        _create_student, which reports them as row errors.
+        """
+        rows = []
+        for position, (admission_no, student_data) in enumerate(results.items(), start=self._student_position + 1):
+            if (position <= self._resume_from or admission_no in self._students
+                    or not student_data.get('class_name')):
+                continue
+            rows.append({
+                'admission_number': admission_no,
+                'name': student_data['student_name'],
+                'academic_class_id': self._get_class(student_data).id,
+                'comm_ref_id': f"{self.school_id}_{admission_no}"
+            })
+        if not rows:
+            return
+
+        students = db.session.scalars(insert(Student).returning(Student), rows).all()
+        contact_rows = [
+            {'student_id': student.id, **contacts_data[student.admission_number]}
+            for student in students if contacts_data.get(student.admission_number)
+        ]
+        contacts = {}
+        if contact_rows:
+            contacts = {
+                contact.student_id: contact
+                for contact in db.session.scalars(insert(StudentContact).returning(StudentContact), contact_rows)
+            }
+
+        for student in students:
+            set_committed_value(student, 'contacts', contacts.get(student.id))
+            self._students[student.admission_number] = student
+        logger.info(f"Created {len(students)} new students in school ID: {self.school_id}")
+
     def _create_student(self, admission_no, student_data):
         """Create new student record with validation"""
         if not student_data.get('class_name'):
             raise ValueError("Class name is required")
 
-        # Find or create academic class within the same school
-        class_ = AcademicClass.query.filter_by(
-            name=student_data['class_name'],
-            school_id=self.school_id
-        ).first()
-
-        if not class_:
-            class_ = AcademicClass(
-                name=student_data['class_name'],
-                stream=student_data.get('stream', ''),
-                school_id=self.school_id
-            )
-            db.session.add(class_)
-            db.session.flush()
+        # Find or create the class's stream within the same school
+        class_ = self._get_class(student_data)
 
         student = Student(
             admission_number=admission_no,
@@ -319,9 +1017,26 @@ class ExamParser:
         )
         db.session.add(student)
         db.session.flush()
+        self._students[admission_no] = student
         logger.info(f"Created new student: {student.name} ({admission_no}) in school ID: {self.school_id}")
         return student
 
+    def _get_class(self, student_data):
+        """The class and stream of student_data within the school, created if new"""
+        class_key = (student_data['class_name'], student_data.get('stream') or '')
+        class_ = self._classes.get(class_key)
+
+        if not class_:
+            class_ = AcademicClass(
+                name=class_key[0],
+                stream=class_key[1],
+                school_id=self.school_id
+            )
+            db.session.add(class_)
+            db.session.flush()
+            self._classes[class_key] = class_
+        return class_
+
     def _update_contact_info(self, student, contact_data):
         """Update or create student contact information"""
         if not student.contacts:
@@ -336,10 +1051,8 @@ class ExamParser:
         if not result_data.get('subject'):
             raise ValueError("Subject name is required")
 
-        subject = Subject.query.filter_by(
-            name=result_data['subject'],
-            academic_class_id=student.academic_class_id
-        ).first()
+        subject_key = (result_data['subject'], student.academic_class_id)
+        subject = self._subjects.get(subject_key)
 
         if not subject:
             subject = Subject(
@@ -350,18 +1063,90 @@ class ExamParser:
             )
             db.session.add(subject)
             db.session.flush()
+            self._subjects[subject_key] = subject
 
-        exam_result = ExamResult(
-            exam_id=self.current_exam.id,
-            student_id=student.id,
-            subject_id=subject.id,
-            marks=float(result_data['marks']),
-            grade=calculate_grade(float(result_data['marks'])),
-            paper_number=result_data.get('paper'),
-            remark=result_data.get('remarks', ''),
-            position=0
-        )
-        db.session.add(exam_result)
+        row = {
+            'exam_id': self.current_exam.id,
+            'student_id': student.id,
+            'subject_id': subject.id,
+            'marks': float(result_data['marks']),
+            'grade': calculate_grade(float(result_data['marks'])),
+            'paper_number': result_data.get('paper'),
+            'remark': result_data.get('remarks', ''),
+            'position': 0
+        }
+
+        if self._existing_results is not None:
+            stored = self._existing_results.pop((student.id, subject.id, row['paper_number']), None)
+            if stored:
+                result_id, marks, remark = stored
+                if marks == row['marks'] and (remark or '') == (row['remark'] or ''):
+                    self.change_summary['unchanged'] += 1
+                else:
+                    self._pending_updates.append({
+                        'id': result_id,
+                        'marks': row['marks'],
+                        'grade': row['grade'],
+                        'remark': row['remark']
+                    })
+                return
+
+        self.change_summary['inserted'] += 1
+        if self.bulk_insert:
+            self._pending_results.append(row)
+        else:
+            db.session.add(ExamResult(**row))
+
+    def _flush_pending_results(self):
+        """Write queued exam results with set-based inserts (and updates in upsert mode)"""
+        with self.timer.stage('write_results') as stage:
+            stage['rows'] = len(self._pending_results) + len(self._pending_updates)
+            return self._write_pending_results()
+
+    def _write_pending_results(self):
+        if self._existing_results is not None and self._pending_updates:
+            updates, self._pending_updates = self._pending_updates, []
+            db.session.execute(update(ExamResult), updates)
+            self.change_summary['updated'] += len(updates)
+
+        rows, self._pending_results = self._pending_results, []
+        if not rows:
+            return 0
+
+        db.session.flush()
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql' and self._copy_results(connection, rows):
+            return len(rows)
+
+        insert = ExamResult.__table__.insert()
+        for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+            connection.execute(insert, rows[start:start + BULK_INSERT_BATCH_SIZE])
+        return len(rows)
+
+    def _copy_results(self, connection, rows):
+        """Stream rows into exam_results with COPY; returns False if the driver lacks COPY support"""
+        cursor = connection.connection.cursor()
+        if not hasattr(cursor, 'copy_expert'):
+            cursor.close()
+            return False
+
+        # In CSV format NULL is an unquoted empty field; text is always quoted, so an
+        # empty remark stays '' and no text value can be read back as NULL
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(_copy_field(row[col]) for col in RESULT_COLUMNS))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        try:
+            count_statement()
+            cursor.copy_expert(
+                f"COPY {ExamResult.__tablename__} ({', '.join(RESULT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+        return True
 
     # Helper methods remain the same...
     def _parse_subject_column(self, column_name, subjects_config):
@@ -379,25 +1164,146 @@ class ExamParser:
         """Validate and normalize email address"""
         if pd.isna(email) or not str(email).strip() or str(email).strip().lower() in ['-', 'n/a', 'null']:
             return None
-        try:
-            v = validate_email(str(email).strip())
-            return v.email
-        except EmailNotValidError as e:
-            logger.warning(f"Invalid email format: {email}")
-            return None
+        return _normalize_email(str(email).strip())
 
     def _validate_phone(self, phone):
         """Validate and normalize phone number"""
         if pd.isna(phone) or not str(phone).strip() or str(phone).strip().lower() in ['-', 'n/a', 'null']:
             return None
-        try:
-            parsed = phonenumbers.parse(str(phone).strip(), None)
-            if not phonenumbers.is_valid_number(parsed):
-                raise ValueError("Invalid phone number")
-            return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-        except Exception as e:
-            logger.warning(f"Invalid phone format: {phone}")
-            return None
+        return _normalize_phone(str(phone).strip())
+
+
+def _copy_field(value):
+    """One CSV field of a COPY row: None as an unquoted empty field, text quoted"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+@lru_cache(maxsize=CONTACT_CACHE_SIZE)
+def _normalize_email(email):
+    """Validated, normalized form of an email address, or None (memoized across uploads)"""
+    try:
+        v = validate_email(email)
+        return v.email
+    except EmailNotValidError as e:
+        logger.warning(f"Invalid email format: {email}")
+        return None
+
+
+@lru_cache(maxsize=CONTACT_CACHE_SIZE)
+def _normalize_phone(phone):
+    """E.164 form of a phone number, or None (memoized across uploads)"""
+    try:
+        parsed = phonenumbers.parse(phone, None)
+        if not phonenumbers.is_valid_number(parsed):
+            raise ValueError("Invalid phone number")
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+    except Exception as e:
+        logger.warning(f"Invalid phone format: {phone}")
+        return None
+
+
+_lookup_cache = {}
+_lookup_cache_lock = threading.Lock()
+
+
+def get_lookup_cache(school_id):
+    """
+    Lightweight per-school lookup maps for dry runs, cached for LOOKUP_CACHE_TTL seconds:
+    admission number -> class id, (class name, stream) -> class id, the set of (subject, class id)
+    and exam identity -> latest complete exam id. None, and nothing cached, for an unknown school.
+    """
+    with _lookup_cache_lock:
+        cached = _lookup_cache.get(school_id)
+        if cached and time.monotonic() - cached[0] < LOOKUP_CACHE_TTL:
+            return cached[1]
+
+    if db.session.query(School.id).filter(School.id == school_id).scalar() is None:
+        return None
+
+    classes = {}
+    class_rows = db.session.query(AcademicClass.id, AcademicClass.name, AcademicClass.stream).filter(
+        AcademicClass.school_id == school_id).order_by(AcademicClass.id)
+    for class_id, name, stream in class_rows:
+        classes.setdefault((name, stream or ''), class_id)
+
+    students = dict(
+        db.session.query(Student.admission_number, Student.academic_class_id)
+        .join(AcademicClass, Student.academic_class_id == AcademicClass.id)
+        .filter(AcademicClass.school_id == school_id)
+    )
+
+    subjects = set(
+        db.session.query(Subject.name, Subject.academic_class_id)
+        .join(AcademicClass, Subject.academic_class_id == AcademicClass.id)
+        .filter(AcademicClass.school_id == school_id)
+    )
+
+    exams = {}
+    exam_rows = db.session.query(Exam.id, Exam.name, Exam.academic_year, Exam.semester).filter(
+        Exam.school_id == school_id, Exam.is_complete.is_(True)).order_by(Exam.id)
+    for exam_id, name, academic_year, semester in exam_rows:
+        exams[(str(name), str(academic_year), str(semester))] = exam_id
+
+    lookups = {'students': students, 'classes': classes, 'subjects': {tuple(s) for s in subjects},
+               'exams': exams}
+    with _lookup_cache_lock:
+        _lookup_cache[school_id] = (time.monotonic(), lookups)
+    return lookups
+
+
+def clear_lookup_cache(school_id):
+    """Forget cached dry-run lookups after the school's data changes"""
+    with _lookup_cache_lock:
+        _lookup_cache.pop(school_id, None)
+
+
+def exam_identity(exam_data):
+    """The (name, academic year, semester) that identifies an exam within a school"""
+    return str(exam_data['ExamName']), str(exam_data['AcademicYear']), str(exam_data['Semester'])
+
+
+def finalize_exams(school_id, exam_ids):
+    """
+    Rank and aggregate exams written by a batch upload, refresh the school's trends,
+    mark the exams complete and commit. Returns the number of students ranked.
+    """
+    ranked = 0
+    for exam_id in exam_ids:
+        ranked += rank_exam(exam_id)
+        refresh_exam_aggregates(exam_id)
+    Exam.query.filter(Exam.id.in_(exam_ids)).update({Exam.is_complete: True})
+    refresh_school_trends(school_id)
+    bump_data_version(school_id)
+    db.session.commit()
+    clear_lookup_cache(school_id)
+    logger.info(f"Finalized exam IDs: {list(exam_ids)} ({ranked} students ranked) for school ID: {school_id}")
+    return ranked
+
+
+def discard_exams(exam_ids):
+    """Delete exams with their results, summaries, aggregates and checkpoints, in the caller's transaction"""
+    ExamResult.query.filter(ExamResult.exam_id.in_(exam_ids)).delete()
+    ExamStudentSummary.query.filter(ExamStudentSummary.exam_id.in_(exam_ids)).delete()
+    ResultAggregate.query.filter(ResultAggregate.exam_id.in_(exam_ids)).delete()
+    IngestCheckpoint.query.filter(IngestCheckpoint.exam_id.in_(exam_ids)).delete()
+    UploadJob.query.filter(UploadJob.exam_id.in_(exam_ids)).update({UploadJob.exam_id: None})
+    Exam.query.filter(Exam.id.in_(exam_ids)).delete()
+
+
+def file_digest(file_stream):
+    """SHA-256 of an uploaded file, leaving the stream at its start"""
+    if isinstance(file_stream, FrameWorkbook):
+        return file_stream.digest
+    file_stream.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file_stream.read(1024 * 1024), b''):
+        digest.update(block)
+    file_stream.seek(0)
+    return digest.hexdigest()
 
 
 def parse_excel(file_stream, exam_name=None, exam_date=None, school_id=None, uploader_id=None):
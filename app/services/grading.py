@@ -1,13 +1,12 @@
 # app/services/grading.py
+
+# Lowest mark of each grade, best grade first; anything below the last is an 'E'
+GRADE_BOUNDARIES = (('A', 80), ('B', 70), ('C', 60), ('D', 50))
+
+
 def calculate_grade(marks):
     """Standard grade calculation used across the application"""
-    if marks >= 80:
-        return 'A'
-    elif marks >= 70:
-        return 'B'
-    elif marks >= 60:
-        return 'C'
-    elif marks >= 50:
-        return 'D'
-    else:
-        return 'E'
\ No newline at end of file
+    for grade, lowest in GRADE_BOUNDARIES:
+        if marks >= lowest:
+            return grade
+    return 'E'
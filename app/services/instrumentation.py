@@ -0,0 +1,179 @@
+# app/services/instrumentation.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Upper bounds of the per-stage SQL statement histogram buckets
+STATEMENT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+_local = threading.local()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    count_statement()
+
+
+def count_statement(n=1):
+    """Count SQL statements issued by the current thread (raw driver calls such as COPY report themselves)"""
+    _local.statements = getattr(_local, 'statements', 0) + n
+
+
+def statement_count():
+    return getattr(_local, 'statements', 0)
+
+
+class StageTimer:
+    """
+    Records wall time, CPU time, rows handled and SQL statements per named stage.
+    Stages may nest; each stage reports its own time excluding nested stages, and
+    repeated stages (e.g. one per chunk) accumulate into a single entry.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time a block; the yielded dict accepts a 'rows' count set inside the block"""
+        frame = {'rows': rows, 'nested': [0.0, 0.0, 0]}
+        self._stack.append(frame)
+        wall, cpu, sql = time.perf_counter(), time.thread_time(), statement_count()
+        try:
+            yield frame
+        finally:
+            elapsed = [time.perf_counter() - wall, time.thread_time() - cpu, statement_count() - sql]
+            self._stack.pop()
+            if self._stack:
+                parent = self._stack[-1]['nested']
+                for i, value in enumerate(elapsed):
+                    parent[i] += value
+
+            entry = self.stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'sql': 0})
+            entry['calls'] += 1
+            entry['wall'] += elapsed[0] - frame['nested'][0]
+            entry['cpu'] += elapsed[1] - frame['nested'][1]
+            entry['sql'] += elapsed[2] - frame['nested'][2]
+            entry['rows'] += frame['rows'] or 0
+
+    def as_dict(self):
+        """Stage timings in milliseconds, in the order the stages first ran"""
+        stages = {
+            name: {
+                'calls': entry['calls'],
+                'wall_ms': round(entry['wall'] * 1000, 2),
+                'cpu_ms': round(entry['cpu'] * 1000, 2),
+                'rows': entry['rows'],
+                'sql_statements': entry['sql']
+            }
+            for name, entry in self.stages.items()
+        }
+        return {
+            'stages': stages,
+            'total_wall_ms': round(sum(entry['wall'] for entry in self.stages.values()) * 1000, 2),
+            'total_sql_statements': sum(entry['sql'] for entry in self.stages.values())
+        }
+
+    def observe(self, pipeline):
+        """Add this run's stage totals to the process-wide metrics registry"""
+        for name, entry in self.stages.items():
+            labels = (('pipeline', pipeline), ('stage', name))
+            registry.histogram('stage_seconds', 'Wall time per pipeline stage', DURATION_BUCKETS).observe(
+                labels, entry['wall'])
+            registry.histogram('stage_cpu_seconds', 'CPU time per pipeline stage', DURATION_BUCKETS).observe(
+                labels, entry['cpu'])
+            registry.histogram('stage_sql_statements', 'SQL statements per pipeline stage',
+                               STATEMENT_BUCKETS).observe(labels, entry['sql'])
+            registry.counter('stage_rows_total', 'Rows handled per pipeline stage').inc(labels, entry['rows'])
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram, one series per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.setdefault(labels, {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0})
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self, prefix):
+        lines = [f"# HELP {prefix}{self.name} {self.help}", f"# TYPE {prefix}{self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series['counts']):
+                    cumulative += count
+                    lines.append(f"{prefix}{self.name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{prefix}{self.name}_sum{_labels(labels)} {series['sum']}")
+                lines.append(f"{prefix}{self.name}_count{_labels(labels)} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, one series per label set"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self, prefix):
+        lines = [f"# HELP {prefix}{self.name} {self.help}", f"# TYPE {prefix}{self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._series.items()):
+                lines.append(f"{prefix}{self.name}{_labels(labels)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metric store rendered in the Prometheus text format"""
+
+    def __init__(self, prefix='exam_analysis_'):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=DURATION_BUCKETS):
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def counter(self, name, help_text):
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(self.prefix))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,76 @@
+# app/services/ranking.py
+import logging
+from sqlalchemy import func, select, update, delete, insert, or_
+from app.models import db, ExamResult, ExamStudentSummary, Student, Subject, AcademicClass
+
+logger = logging.getLogger(__name__)
+
+
+def rank_exam(exam_id):
+    """
+    Compute tie-aware positions for an exam with window functions, in three statements:
+    per-subject/paper positions on every ExamResult, and overall positions by total
+    marks in ExamStudentSummary. A class is every stream sharing an AcademicClass name;
+    a stream is a single AcademicClass. Only results whose position changed are
+    rewritten, so re-ranking an unchanged exam writes no result rows.
+    Runs in the caller's transaction.
+    Returns the number of ranked students.
+    """
+    marks_desc = ExamResult.marks.desc().nulls_last()
+    ranked_results = (
+        select(
+            ExamResult.id.label('result_id'),
+            func.rank().over(
+                partition_by=(AcademicClass.name, Subject.name, ExamResult.paper_number),
+                order_by=marks_desc
+            ).label('class_position'),
+            func.rank().over(
+                partition_by=(Student.academic_class_id, ExamResult.subject_id, ExamResult.paper_number),
+                order_by=marks_desc
+            ).label('stream_position')
+        )
+        .join(Student, Student.id == ExamResult.student_id)
+        .join(AcademicClass, AcademicClass.id == Student.academic_class_id)
+        .join(Subject, Subject.id == ExamResult.subject_id)
+        .where(ExamResult.exam_id == exam_id)
+        .subquery()
+    )
+    db.session.execute(
+        update(ExamResult)
+        .where(
+            ExamResult.id == ranked_results.c.result_id,
+            or_(ExamResult.position.is_distinct_from(ranked_results.c.class_position),
+                ExamResult.stream_position.is_distinct_from(ranked_results.c.stream_position))
+        )
+        .values(position=ranked_results.c.class_position, stream_position=ranked_results.c.stream_position)
+        .execution_options(synchronize_session=False)
+    )
+
+    total_marks = func.sum(ExamResult.marks)
+    totals = (
+        select(
+            ExamResult.exam_id,
+            ExamResult.student_id,
+            Student.academic_class_id,
+            total_marks,
+            func.count(ExamResult.marks),
+            func.avg(ExamResult.marks),
+            func.rank().over(partition_by=AcademicClass.name, order_by=total_marks.desc()),
+            func.rank().over(partition_by=Student.academic_class_id, order_by=total_marks.desc())
+        )
+        .join(Student, Student.id == ExamResult.student_id)
+        .join(AcademicClass, AcademicClass.id == Student.academic_class_id)
+        .where(ExamResult.exam_id == exam_id, ExamResult.marks.isnot(None))
+        .group_by(ExamResult.exam_id, ExamResult.student_id, Student.academic_class_id, AcademicClass.name)
+    )
+    db.session.execute(delete(ExamStudentSummary).where(ExamStudentSummary.exam_id == exam_id))
+    ranked_students = db.session.execute(
+        insert(ExamStudentSummary).from_select(
+            ['exam_id', 'student_id', 'academic_class_id', 'total_marks', 'result_count', 'mean_marks',
+             'class_position', 'stream_position'],
+            totals
+        )
+    ).rowcount
+
+    logger.info(f"Ranked {ranked_students} students for exam ID: {exam_id}")
+    return ranked_students
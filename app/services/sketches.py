@@ -0,0 +1,114 @@
+# app/services/sketches.py
+import json
+import math
+from sqlalchemy import case, cast, func, Integer
+from app.services.grading import GRADE_BOUNDARIES
+
+# One bin per whole mark over 0-99; the last bin holds 100 and anything above it
+HISTOGRAM_BINS = 101
+
+
+def histogram_bin(marks):
+    """SQL expression for the histogram bin of a mark column"""
+    return case(
+        (marks < 0, 0),
+        (marks >= HISTOGRAM_BINS - 1, HISTOGRAM_BINS - 1),
+        else_=cast(func.floor(marks), Integer)
+    )
+
+
+class MarkDistribution:
+    """
+    Mergeable summary of a set of marks: a fixed-bin histogram plus count, sum and
+    sum of squares. Summaries of disjoint groups (classes, exams, terms) add up to
+    the summary of their union, so spread statistics never need the raw marks.
+    Quantiles are interpolated within a one-mark bin.
+    """
+
+    def __init__(self, bins=None, count=0, total=0.0, total_sq=0.0, maximum=None):
+        self.bins = list(bins) if bins else [0] * HISTOGRAM_BINS
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.maximum = maximum
+
+    @classmethod
+    def from_aggregate(cls, aggregate):
+        """Build from a ResultAggregate row or any row with the same columns"""
+        return cls(
+            bins=json.loads(aggregate.mark_histogram) if aggregate.mark_histogram else None,
+            count=aggregate.result_count or 0,
+            total=aggregate.marks_sum or 0,
+            total_sq=aggregate.marks_sum_sq or 0,
+            maximum=aggregate.marks_max
+        )
+
+    def merge(self, other):
+        """Add another distribution into this one; returns self"""
+        self.bins = [a + b for a, b in zip(self.bins, other.bins)]
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if other.maximum is not None and (self.maximum is None or other.maximum > self.maximum):
+            self.maximum = other.maximum
+        return self
+
+    def __add__(self, other):
+        return MarkDistribution(self.bins, self.count, self.total, self.total_sq, self.maximum).merge(other)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def std(self):
+        """Population standard deviation"""
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0))
+
+    def quantile(self, q):
+        """Estimated mark below which a fraction q of the marks fall"""
+        histogram_total = sum(self.bins)
+        if not histogram_total:
+            return None
+
+        target = min(max(q, 0), 1) * histogram_total
+        seen = 0
+        for index, count in enumerate(self.bins):
+            if count and seen + count >= target:
+                if index == HISTOGRAM_BINS - 1:
+                    return float(index)
+                value = index + (target - seen) / count
+                return min(value, self.maximum) if self.maximum is not None else value
+            seen += count
+        return float(HISTOGRAM_BINS - 1)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    def share_below(self, mark):
+        """Percentage of marks below a whole mark, e.g. a grade boundary"""
+        histogram_total = sum(self.bins)
+        if not histogram_total:
+            return None
+        upto = min(max(int(mark), 0), HISTOGRAM_BINS)
+        return sum(self.bins[:upto]) * 100 / histogram_total
+
+    def summary(self):
+        """Serializable statistics for analytics responses"""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'lower_quartile': self.quantile(0.25),
+            'median': self.median,
+            'upper_quartile': self.quantile(0.75),
+            'maximum': self.maximum,
+            'grade_boundaries': {
+                grade: {'mark': lowest, 'percentile': self.share_below(lowest)}
+                for grade, lowest in GRADE_BOUNDARIES
+            }
+        }
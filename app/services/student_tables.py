@@ -0,0 +1,153 @@
+# app/services/student_tables.py
+import base64
+import json
+from collections import defaultdict
+from sqlalchemy import func, select, tuple_
+from app.models import db, AcademicClass, Exam, ExamResult, ExamStudentSummary, ResultAggregate, Student, Subject
+from app.services.cache import cached_analytics
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Sort value of students without a mark in the subject a table is sorted by
+NO_MARK = -1
+
+
+def encode_cursor(value, student_id):
+    """Opaque keyset cursor: the sort value and student id of a page's last row"""
+    return base64.urlsafe_b64encode(json.dumps([value, student_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, student_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(value), int(student_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page cursor")
+
+
+@cached_analytics('student_pages')
+def get_student_page(school_id, class_name, stream=None, exam_id=None, sort='total', order='desc',
+                     limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    One page of a class (or one of its streams) for an exam, defaulting to the
+    school's latest exam. Rows are ordered in SQL by 'total', 'average' or
+    'subject:<name>' and paginated by keyset on (sort value, student id), so every
+    page costs the same however deep it is. cursor is next_cursor of the previous page.
+    """
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"Unknown sort order: {order}")
+    limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+
+    exam = _resolve_exam(school_id, exam_id)
+    page = {
+        'exam': {'id': exam.id, 'name': exam.name} if exam else None,
+        'class': class_name,
+        'stream': stream,
+        'sort': sort,
+        'order': order,
+        'subjects': [],
+        'students': [],
+        'next_cursor': None
+    }
+    if exam is None:
+        return page
+
+    class_filter = [AcademicClass.school_id == school_id, AcademicClass.name == class_name]
+    if stream:
+        class_filter.append(AcademicClass.stream == stream)
+    class_ids = [class_id for class_id, in db.session.query(AcademicClass.id).filter(*class_filter)]
+    if not class_ids:
+        raise ValueError(f"Unknown class: {class_name} {stream or ''}".strip())
+
+    # Subjects come from the exam's aggregate rows rather than its results
+    exam_subjects = (db.session.query(ResultAggregate.subject_id, Subject.name)
+                     .join(Subject, ResultAggregate.subject_id == Subject.id)
+                     .filter(ResultAggregate.exam_id == exam.id, ResultAggregate.academic_class_id.in_(class_ids))
+                     .all())
+    page['subjects'] = sorted({name for _, name in exam_subjects})
+
+    query = (select(
+        ExamStudentSummary.student_id,
+        Student.name,
+        AcademicClass.stream,
+        ExamStudentSummary.total_marks,
+        ExamStudentSummary.mean_marks,
+        ExamStudentSummary.class_position,
+        ExamStudentSummary.stream_position
+    )
+             .join(Student, ExamStudentSummary.student_id == Student.id)
+             .join(AcademicClass, ExamStudentSummary.academic_class_id == AcademicClass.id)
+             .where(ExamStudentSummary.exam_id == exam.id, ExamStudentSummary.academic_class_id.in_(class_ids)))
+
+    if sort == 'total':
+        sort_value = ExamStudentSummary.total_marks
+    elif sort == 'average':
+        sort_value = ExamStudentSummary.mean_marks
+    elif sort.startswith('subject:'):
+        subject_name = sort.split(':', 1)[1]
+        subject_ids = [subject_id for subject_id, name in exam_subjects if name == subject_name]
+        if not subject_ids:
+            raise ValueError(f"Unknown subject: {subject_name}")
+        subject_marks = (select(ExamResult.student_id, func.sum(ExamResult.marks).label('marks'))
+                         .where(ExamResult.exam_id == exam.id, ExamResult.subject_id.in_(subject_ids))
+                         .group_by(ExamResult.student_id)
+                         .subquery())
+        query = query.outerjoin(subject_marks, subject_marks.c.student_id == ExamStudentSummary.student_id)
+        sort_value = func.coalesce(subject_marks.c.marks, NO_MARK)
+    else:
+        raise ValueError(f"Unknown sort: {sort}")
+
+    query = query.add_columns(sort_value.label('sort_value'))
+    key = tuple_(sort_value, ExamStudentSummary.student_id)
+    if cursor:
+        after = tuple_(*decode_cursor(cursor))
+        query = query.where(key < after if order == 'desc' else key > after)
+    if order == 'desc':
+        query = query.order_by(sort_value.desc(), ExamStudentSummary.student_id.desc())
+    else:
+        query = query.order_by(sort_value.asc(), ExamStudentSummary.student_id.asc())
+
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        page['next_cursor'] = encode_cursor(rows[-1].sort_value, rows[-1].student_id)
+
+    # Marks by subject for this page only, papers of a subject summed
+    scores = defaultdict(dict)
+    if rows:
+        marks = (db.session.query(ExamResult.student_id, Subject.name, func.sum(ExamResult.marks))
+                 .join(Subject, ExamResult.subject_id == Subject.id)
+                 .filter(ExamResult.exam_id == exam.id,
+                         ExamResult.student_id.in_([row.student_id for row in rows]),
+                         ExamResult.marks.isnot(None))
+                 .group_by(ExamResult.student_id, Subject.name))
+        for student_id, subject_name, total in marks:
+            scores[student_id][subject_name] = total
+
+    page['students'] = [{
+        'id': row.student_id,
+        'name': row.name,
+        'stream': row.stream,
+        'scores': scores[row.student_id],
+        'total_score': row.total_marks,
+        'avg_score': row.mean_marks,
+        'class_position': row.class_position,
+        'stream_position': row.stream_position
+    } for row in rows]
+    return page
+
+
+def _resolve_exam(school_id, exam_id):
+    """The requested exam of the school, or its latest ranked exam"""
+    if exam_id:
+        exam = Exam.query.filter_by(id=exam_id, school_id=school_id, is_complete=True).first()
+        if exam is None:
+            raise ValueError(f"Unknown exam: {exam_id}")
+        return exam
+
+    ranked = select(ExamStudentSummary.exam_id).distinct()
+    return (Exam.query
+            .filter(Exam.school_id == school_id, Exam.is_complete.is_(True), Exam.id.in_(ranked))
+            .order_by(Exam.exam_date.desc().nulls_last(), Exam.id.desc())
+            .first())
@@ -0,0 +1,119 @@
+# app/services/trends.py
+import logging
+from datetime import datetime
+from sqlalchemy import func, delete, insert, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from app.models import db, Exam, ResultAggregate, TrendRollup
+
+logger = logging.getLogger(__name__)
+
+PERIOD_TYPES = ('month', 'term')
+
+
+class month_bucket(FunctionElement):
+    """'YYYY-MM' label of a date column, compiled for the database in use"""
+    type = String()
+    name = 'month_bucket'
+    inherit_cache = True
+
+
+@compiles(month_bucket)
+def _month_bucket_default(element, compiler, **kw):
+    return f"strftime('%Y-%m', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(month_bucket, 'postgresql')
+def _month_bucket_postgresql(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, 'YYYY-MM')"
+
+
+@compiles(month_bucket, 'mysql')
+def _month_bucket_mysql(element, compiler, **kw):
+    return f"date_format({compiler.process(element.clauses, **kw)}, '%Y-%m')"
+
+
+def month_start(period):
+    """First instant of the month a 'YYYY-MM' label names"""
+    return datetime.strptime(period, '%Y-%m')
+
+
+def term_period(academic_year, semester):
+    """The label of a school term, or None when the exam does not name one"""
+    if not academic_year or semester in (None, ''):
+        return None
+    return f"{academic_year} Term {semester}"
+
+
+def period_totals(*columns, school_id):
+    """Result aggregate totals and exam counts of a school's exams, grouped by columns"""
+    return (db.session.query(
+        *columns,
+        func.count(func.distinct(Exam.id)),
+        func.sum(ResultAggregate.result_count),
+        func.sum(ResultAggregate.marks_sum),
+        func.sum(ResultAggregate.pass_count)
+    )
+            .select_from(ResultAggregate)
+            .join(Exam, ResultAggregate.exam_id == Exam.id)
+            .filter(ResultAggregate.school_id == school_id)
+            .group_by(*columns))
+
+
+def rollup_row(school_id, period_type, period, start, exam_count, result_count, marks_sum, pass_count):
+    return {
+        'school_id': school_id,
+        'period_type': period_type,
+        'period': period,
+        'period_start': start,
+        'exam_count': exam_count,
+        'result_count': result_count or 0,
+        'marks_sum': marks_sum or 0,
+        'pass_count': pass_count or 0
+    }
+
+
+def refresh_school_trends(school_id):
+    """
+    Rebuild a school's month and term rollups from its result aggregates, in the
+    caller's transaction. The database buckets and sums them, one row per period;
+    exam_results is never read. Returns the number of rollup rows written.
+    """
+    months = period_totals(month_bucket(Exam.exam_date), school_id=school_id).filter(Exam.exam_date.isnot(None)).all()
+    terms = (period_totals(Exam.academic_year, Exam.semester, school_id=school_id)
+             .add_columns(func.min(Exam.exam_date))
+             .all())
+
+    rollups = [rollup_row(school_id, 'month', period, month_start(period), *totals) for period, *totals in months]
+    for academic_year, semester, *totals, start in terms:
+        period = term_period(academic_year, semester)
+        if period:
+            rollups.append(rollup_row(school_id, 'term', period, start, *totals))
+
+    db.session.execute(delete(TrendRollup).where(TrendRollup.school_id == school_id))
+    if rollups:
+        db.session.execute(insert(TrendRollup), rollups)
+
+    logger.debug(f"Refreshed {len(rollups)} trend rollups for school ID: {school_id}")
+    return len(rollups)
+
+
+def trend_series(school_id, period_type='month', limit=6):
+    """The latest limit periods of a school's rollups, oldest first"""
+    if period_type not in PERIOD_TYPES:
+        raise ValueError(f"Unknown trend period: {period_type}")
+
+    rows = (TrendRollup.query
+            .filter(TrendRollup.school_id == school_id,
+                    TrendRollup.period_type == period_type,
+                    TrendRollup.result_count > 0)
+            .order_by(TrendRollup.period_start.desc(), TrendRollup.period.desc())
+            .limit(limit)
+            .all())
+    return [{
+        'period': row.period,
+        'mean': row.mean,
+        'pass_rate': row.pass_rate,
+        'result_count': row.result_count,
+        'exam_count': row.exam_count
+    } for row in reversed(rows)]
@@ -0,0 +1,263 @@
+# app/services/upload_jobs.py
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app.models import db, UploadJob
+from app.services.excel_parser import process_exam_upload, finalize_exams
+from app.services.analysis import update_school_performance
+from app.services.workbook import read_workbook_frames, prefers_streaming
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKBOOK_EXTENSIONS = ('.xlsx', '.xls')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide upload worker pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('UPLOAD_WORKERS', 2),
+                thread_name_prefix='upload-job'
+            )
+        return _executor
+
+
+def get_upload_folder():
+    """Directory where queued upload files wait for a worker"""
+    folder = current_app.config.get('UPLOAD_FOLDER') or os.path.join(current_app.instance_path, 'uploads')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def enqueue_upload(file_storage, school_id, uploader_id, **parser_options):
+    """
+    Save an uploaded file and queue it for background processing.
+    Returns the new UploadJob; its id is what clients poll.
+    """
+    return _enqueue(run_upload_job, file_storage, school_id, uploader_id, parser_options)
+
+
+def enqueue_batch_upload(file_storage, school_id, uploader_id, **parser_options):
+    """Save a ZIP archive of workbooks and queue it as a single batch job"""
+    return _enqueue(run_batch_job, file_storage, school_id, uploader_id, parser_options)
+
+
+def _enqueue(runner, file_storage, school_id, uploader_id, parser_options):
+    if not school_id:
+        raise ValueError("User is not associated with any school")
+
+    job_id = str(uuid.uuid4())
+    filename = secure_filename(file_storage.filename) or 'upload.xlsx'
+    file_path = os.path.join(get_upload_folder(), f"{job_id}_{filename}")
+    file_storage.save(file_path)
+
+    job = UploadJob(
+        id=job_id,
+        school_id=school_id,
+        uploader_id=uploader_id,
+        filename=filename,
+        file_path=file_path,
+        state='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    get_executor().submit(runner, app, job_id, parser_options)
+    logger.info(f"Queued upload job {job_id} for school ID: {school_id}")
+    return job
+
+
+def update_job(job_id, **values):
+    """Write job status in its own transaction so pollers see it while the upload is still uncommitted"""
+    with db.engine.begin() as connection:
+        connection.execute(
+            UploadJob.__table__.update().where(UploadJob.__table__.c.id == job_id).values(**values)
+        )
+
+
+def run_upload_job(app, job_id, parser_options=None):
+    """Worker entry point: parse the saved file and record the outcome on the job"""
+    with app.app_context():
+        job = db.session.get(UploadJob, job_id)
+        if job is None:
+            logger.error(f"Upload job {job_id} not found")
+            return
+
+        school_id, uploader_id, file_path = job.school_id, job.uploader_id, job.file_path
+        update_job(job_id, state='running', started_at=datetime.utcnow())
+
+        def on_progress(processed, total):
+            try:
+                update_job(job_id, students_processed=processed, students_total=total)
+            except Exception as e:
+                logger.debug(f"Could not record progress for upload job {job_id}: {str(e)}")
+
+        try:
+            # Large workbooks are read a chunk of rows at a time to bound memory
+            options = dict(parser_options or {})
+            options.setdefault('streaming', prefers_streaming(
+                file_path, app.config.get('INGEST_STREAMING_MIN_BYTES')))
+
+            with open(file_path, 'rb') as file_stream:
+                result = process_exam_upload(
+                    file_stream,
+                    school_id=school_id,
+                    uploader_id=uploader_id,
+                    progress_callback=on_progress,
+                    **options
+                )
+
+            if result['status'] == 'error':
+                update_job(job_id, state='failed', message=result['message'], finished_at=datetime.utcnow())
+                return
+
+            update_school_performance(school_id)
+            update_job(
+                job_id,
+                state='succeeded',
+                exam_id=result.get('exam_id'),
+                students_processed=result.get('students_processed'),
+                message=result['message'],
+                errors=json.dumps(result.get('row_errors') or []),
+                finished_at=datetime.utcnow()
+            )
+            logger.info(f"Upload job {job_id} finished: {result['message']}")
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Upload job {job_id} failed: {str(e)}", exc_info=True)
+            update_job(job_id, state='failed', message=f"Upload failed: {str(e)}", finished_at=datetime.utcnow())
+
+        finally:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+
+def extract_workbooks(archive_path, target_dir):
+    """Extract the Excel workbooks of a batch archive; returns [(name, path)]"""
+    workbooks = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for index, info in enumerate(archive.infolist()):
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith('.') or '__MACOSX' in info.filename:
+                continue
+            if not name.lower().endswith(BATCH_WORKBOOK_EXTENSIONS):
+                continue
+            path = os.path.join(target_dir, f"{index}_{secure_filename(name)}")
+            with archive.open(info) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            workbooks.append((name, path))
+    return workbooks
+
+
+def run_batch_job(app, job_id, parser_options=None):
+    """
+    Worker entry point for a ZIP of workbooks: sheets are decoded in parallel in a
+    process pool, while database writes run one workbook at a time in this thread.
+    Workbooks of the same exam (e.g. one per class or stream) are appended to a single
+    Exam, which is ranked and aggregated once after the last workbook.
+    """
+    with app.app_context():
+        job = db.session.get(UploadJob, job_id)
+        if job is None:
+            logger.error(f"Upload job {job_id} not found")
+            return
+
+        school_id, uploader_id, file_path = job.school_id, job.uploader_id, job.file_path
+        update_job(job_id, state='running', started_at=datetime.utcnow())
+        work_dir = tempfile.mkdtemp(dir=os.path.dirname(file_path))
+
+        try:
+            workbooks = extract_workbooks(file_path, work_dir)
+            if not workbooks:
+                raise ValueError("ZIP archive contains no Excel workbooks")
+
+            summary = {
+                'files_total': len(workbooks),
+                'files_done': 0,
+                'succeeded': 0,
+                'failed': 0,
+                'students': 0,
+                'workbooks': []
+            }
+            row_errors = []
+            batch_exams = {}
+            update_job(job_id, students_total=None, summary=json.dumps(summary))
+
+            # Spawned workers hold no copies of this process's database connections
+            processes = min(len(workbooks), app.config.get('BATCH_PARSE_PROCESSES') or os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = {pool.submit(read_workbook_frames, path): name for name, path in workbooks}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        result = process_exam_upload(
+                            future.result(),
+                            school_id=school_id,
+                            uploader_id=uploader_id,
+                            batch_exams=batch_exams,
+                            **(parser_options or {})
+                        )
+                    except Exception as e:
+                        db.session.rollback()
+                        result = {'status': 'error', 'message': f"Upload failed: {str(e)}"}
+
+                    succeeded = result['status'] == 'success'
+                    summary['files_done'] += 1
+                    summary['succeeded' if succeeded else 'failed'] += 1
+                    summary['students'] += result.get('students_processed') or 0
+                    summary['workbooks'].append({
+                        'file': name,
+                        'status': result['status'],
+                        'message': result['message'],
+                        'exam_id': result.get('exam_id'),
+                        'students': result.get('students_processed') or 0
+                    })
+                    row_errors.extend(dict(error, file=name) for error in result.get('row_errors') or [])
+                    update_job(job_id, students_processed=summary['students'], summary=json.dumps(summary))
+
+            if batch_exams:
+                finalize_exams(school_id, list(dict.fromkeys(batch_exams.values())))
+            if summary['succeeded']:
+                update_school_performance(school_id)
+
+            message = (f"Processed {summary['succeeded']} of {summary['files_total']} workbooks "
+                       f"({summary['students']} students)")
+            update_job(
+                job_id,
+                state='succeeded' if summary['succeeded'] else 'failed',
+                message=message,
+                errors=json.dumps(row_errors),
+                finished_at=datetime.utcnow()
+            )
+            logger.info(f"Batch upload job {job_id} finished: {message}")
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Batch upload job {job_id} failed: {str(e)}", exc_info=True)
+            update_job(job_id, state='failed', message=f"Batch upload failed: {str(e)}", finished_at=datetime.utcnow())
+
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
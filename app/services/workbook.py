@@ -0,0 +1,233 @@
+# app/services/workbook.py
+import hashlib
+import io
+import os
+import zipfile
+import pandas as pd
+from openpyxl import load_workbook
+
+# File formats accepted inside a multi-file upload bundle
+BUNDLE_FORMATS = ('csv', 'parquet')
+
+
+class ExcelWorkbook:
+    """Whole-sheet reader backed by pd.ExcelFile"""
+    format = 'excel'
+
+    def __init__(self, file_stream):
+        self._xls = pd.ExcelFile(file_stream)
+
+    @property
+    def sheet_names(self):
+        return self._xls.sheet_names
+
+    def read_sheet(self, sheet_name):
+        """Read a complete sheet into a DataFrame"""
+        return pd.read_excel(self._xls, sheet_name=sheet_name)
+
+    def close(self):
+        self._xls.close()
+
+
+class StreamingExcelWorkbook:
+    """
+    Row-streaming reader built on openpyxl's read-only mode.
+    Only the rows of the current chunk are held in memory.
+    """
+    format = 'excel'
+
+    def __init__(self, file_stream):
+        try:
+            self._wb = load_workbook(file_stream, read_only=True, data_only=True)
+        except Exception as e:
+            raise ValueError(f"Streaming mode requires an .xlsx workbook: {str(e)}")
+
+    @property
+    def sheet_names(self):
+        return self._wb.sheetnames
+
+    def read_sheet(self, sheet_name):
+        """Read a complete sheet into a DataFrame (use for small sheets only)"""
+        frames = [chunk for chunk, _ in self.iter_sheet_chunks(sheet_name, chunk_size=None)]
+        return frames[0] if frames else pd.DataFrame()
+
+    def iter_sheet_chunks(self, sheet_name, chunk_size):
+        """
+        Yield (DataFrame, first_row) pairs of at most chunk_size data rows.
+        first_row is the worksheet row number of the chunk's first data row.
+        """
+        rows = self._wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        keep = [i for i, name in enumerate(header) if name is not None]
+        columns = [header[i] for i in keep]
+
+        buffer = []
+        first_row = 2
+        for row in rows:
+            buffer.append([row[i] if i < len(row) else None for i in keep])
+            if chunk_size and len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns), first_row
+                first_row += len(buffer)
+                buffer = []
+
+        if buffer or first_row == 2:
+            yield pd.DataFrame(buffer, columns=columns), first_row
+
+    def close(self):
+        self._wb.close()
+
+
+class BundleWorkbook:
+    """
+    ZIP bundle holding one CSV or Parquet file per logical sheet, named after the
+    sheet (e.g. exam_metadata.csv, "Student Results.parquet").
+    Columns are read straight into typed arrays; no per-cell conversion happens here.
+    """
+
+    def __init__(self, file_stream):
+        self._zip = zipfile.ZipFile(file_stream)
+        self._members = {}
+        for info in self._zip.infolist():
+            if info.is_dir():
+                continue
+            base, ext = os.path.splitext(os.path.basename(info.filename))
+            ext = ext.lower().lstrip('.')
+            if ext in BUNDLE_FORMATS and not base.startswith('.'):
+                self._members[sheet_title(base)] = (info.filename, ext)
+
+        formats = {ext for _, ext in self._members.values()}
+        if not formats:
+            raise ValueError("Bundle contains no CSV or Parquet sheets")
+        self.format = formats.pop() if len(formats) == 1 else 'mixed'
+
+    @property
+    def sheet_names(self):
+        return list(self._members)
+
+    def read_sheet(self, sheet_name):
+        """Read a complete sheet into a DataFrame"""
+        member, ext = self._members[sheet_name]
+        with self._zip.open(member) as fh:
+            if ext == 'parquet':
+                return pd.read_parquet(io.BytesIO(fh.read()), engine=_require_pyarrow())
+            return pd.read_csv(fh, engine=_csv_engine())
+
+    def iter_sheet_chunks(self, sheet_name, chunk_size):
+        """Yield (DataFrame, first_row) pairs of at most chunk_size rows"""
+        member, ext = self._members[sheet_name]
+        first_row = 2
+        with self._zip.open(member) as fh:
+            if ext == 'parquet':
+                _require_pyarrow()
+                import pyarrow.parquet as pq
+                batches = (batch.to_pandas() for batch in pq.ParquetFile(fh).iter_batches(batch_size=chunk_size))
+            else:
+                batches = pd.read_csv(fh, chunksize=chunk_size)
+
+            for df in batches:
+                yield df, first_row
+                first_row += len(df)
+
+    def close(self):
+        self._zip.close()
+
+
+class FrameWorkbook:
+    """
+    Workbook whose sheets were already decoded into DataFrames, e.g. by a
+    worker process; picklable so it can cross process boundaries.
+    """
+
+    def __init__(self, frames, format='excel', digest=None):
+        self._frames = frames
+        self.format = format
+        self.digest = digest
+
+    @property
+    def sheet_names(self):
+        return list(self._frames)
+
+    def read_sheet(self, sheet_name):
+        return self._frames[sheet_name]
+
+    def iter_sheet_chunks(self, sheet_name, chunk_size):
+        df = self._frames[sheet_name]
+        for start in range(0, max(len(df), 1), chunk_size):
+            yield df.iloc[start:start + chunk_size], start + 2
+
+    def close(self):
+        pass
+
+
+def read_workbook_frames(file_path):
+    """Decode every sheet of a workbook file into a FrameWorkbook (process pool entry point)"""
+    with open(file_path, 'rb') as file_stream:
+        digest = hashlib.sha256(file_stream.read()).hexdigest()
+        file_stream.seek(0)
+        workbook = open_workbook(file_stream)
+        try:
+            return FrameWorkbook(
+                {name: workbook.read_sheet(name) for name in workbook.sheet_names},
+                format=workbook.format,
+                digest=digest
+            )
+        finally:
+            workbook.close()
+
+
+def sheet_title(file_stem):
+    """Map a bundle file name such as 'student_results' to its sheet title 'Student Results'"""
+    return ' '.join(file_stem.replace('_', ' ').replace('-', ' ').split()).title()
+
+
+def is_bundle(file_stream):
+    """True for a ZIP upload that is not itself an .xlsx package"""
+    try:
+        if not zipfile.is_zipfile(file_stream):
+            return False
+        file_stream.seek(0)
+        with zipfile.ZipFile(file_stream) as zf:
+            return '[Content_Types].xml' not in zf.namelist()
+    finally:
+        file_stream.seek(0)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ValueError("Parquet uploads require the pyarrow package")
+    return 'pyarrow'
+
+
+def _csv_engine():
+    """Use pyarrow's multithreaded typed CSV reader when it is installed"""
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
+
+
+def prefers_streaming(file_path, min_bytes):
+    """
+    True when a saved upload is large enough to be read in chunks and is a format
+    that can be: an .xlsx workbook or a CSV/Parquet bundle (both ZIP files), not .xls
+    """
+    if min_bytes is None or os.path.getsize(file_path) < min_bytes:
+        return False
+    return zipfile.is_zipfile(file_path)
+
+
+def open_workbook(file_stream, streaming=False):
+    """Open an uploaded workbook or bundle with the reader matching the requested mode"""
+    if isinstance(file_stream, FrameWorkbook):
+        return file_stream
+    if is_bundle(file_stream):
+        return BundleWorkbook(file_stream)
+    if streaming:
+        return StreamingExcelWorkbook(file_stream)
+    return ExcelWorkbook(file_stream)
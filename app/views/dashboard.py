@@ -1,7 +1,21 @@
-from flask import Blueprint, render_template, flash, redirect, url_for, make_response
+import time
+from flask import Blueprint, render_template, flash, redirect, url_for, make_response, jsonify, request
 from flask_login import login_required, current_user
-from app.services.analysis import get_school_performance, get_student_performance, update_school_performance
-from app.models import Exam, School, Payment, Subject, AcademicClass, User, ExamResult, teacher_subjects, Student
+from app.services.analysis import (
+    get_mark_distributions, get_school_performance, get_students_performance, get_teacher_performance,
+    update_school_performance
+)
+from app.models import (
+    Exam, School, Payment, Subject, AcademicClass, User, ExamResult, teacher_subjects, Student, ResultAggregate
+)
+from app.services.aggregates import (
+    aggregate_query, grade_distribution, mean_column, pass_rate_column,
+    student_count_query
+)
+from app.services.cache import cached_analytics, get_data_version
+from app.services.instrumentation import registry
+from app.services.trends import month_bucket, trend_series
+from app.services.student_tables import DEFAULT_PAGE_SIZE, get_student_page
 from app import db
 from datetime import datetime, timedelta, date
 from sqlalchemy import func, desc, case, and_
@@ -23,7 +37,7 @@ def get_teacher_subjects(teacher):
     for subject in subjects:
         subject.recent_results = ExamResult.query \
             .join(Exam, ExamResult.exam_id == Exam.id) \
-            .filter(ExamResult.subject_id == subject.id) \
+            .filter(ExamResult.subject_id == subject.id, Exam.is_complete.is_(True)) \
             .order_by(desc(Exam.exam_date)) \
             .limit(5) \
             .all()
@@ -41,7 +55,7 @@ def get_upcoming_exams(school_id, days=30):
 
 def get_recent_exams(school_id, limit=5):
     """Get recent exams with performance metrics"""
-    exams = Exam.query.filter_by(school_id=school_id) \
+    exams = Exam.query.filter_by(school_id=school_id, is_complete=True) \
         .order_by(Exam.exam_date.desc()) \
         .limit(limit) \
         .all()
@@ -73,6 +87,7 @@ def calculate_exam_trend(exam_id):
         .filter(
         Exam.school_id == current_exam.school_id,
         ExamResult.subject_id == current_subject.id,
+        Exam.is_complete.is_(True),
         Exam.id != current_exam.id,
         Exam.exam_date < current_exam.exam_date
     ) \
@@ -92,7 +107,7 @@ def calculate_exam_trend(exam_id):
 
 def get_recent_activity(school_id, limit=5):
     """Get recent system activity with performance impact"""
-    recent_exams = Exam.query.filter_by(school_id=school_id) \
+    recent_exams = Exam.query.filter_by(school_id=school_id, is_complete=True) \
         .order_by(Exam.exam_date.desc()) \
         .limit(limit).all()
 
@@ -120,6 +135,7 @@ def calculate_performance_change(exam_id):
     prev_exam = Exam.query.filter(
         Exam.school_id == current_exam.school_id,
         Exam.name == current_exam.name,
+        Exam.is_complete.is_(True),
         Exam.exam_date < current_exam.exam_date
     ).order_by(desc(Exam.exam_date)).first()
 
@@ -136,14 +152,12 @@ def calculate_performance_change(exam_id):
 
 def get_class_performance(school_id):
     """Get performance data by class"""
-    results = db.session.query(
+    results = aggregate_query(
         AcademicClass.name,
-        func.avg(ExamResult.marks).label('mean'),
-        (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate')
-    ).join(Exam, ExamResult.exam_id == Exam.id) \
-        .join(Subject) \
-        .join(AcademicClass) \
-        .filter(AcademicClass.school_id == school_id) \
+        mean_column(),
+        pass_rate_column(),
+        school_id=school_id
+    ).join(AcademicClass, ResultAggregate.academic_class_id == AcademicClass.id) \
         .group_by(AcademicClass.name) \
         .all()
 
@@ -152,14 +166,12 @@ def get_class_performance(school_id):
 
 def get_subject_performance(school_id):
     """Get performance data by subject"""
-    results = db.session.query(
+    results = aggregate_query(
         Subject.name,
-        func.avg(ExamResult.marks).label('mean'),
-        (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate')
-    ).join(ExamResult) \
-        .join(Exam) \
-        .join(AcademicClass) \
-        .filter(AcademicClass.school_id == school_id) \
+        mean_column(),
+        pass_rate_column(),
+        school_id=school_id
+    ).join(Subject, ResultAggregate.subject_id == Subject.id) \
         .group_by(Subject.name) \
         .all()
 
@@ -168,27 +180,19 @@ def get_subject_performance(school_id):
 
 def get_grade_distribution(school_id):
     """Get distribution of grades across all exams"""
-    grade_counts = db.session.query(
-        ExamResult.grade,
-        func.count(ExamResult.id)
-    ).join(Exam) \
-        .filter(Exam.school_id == school_id) \
-        .group_by(ExamResult.grade) \
-        .all()
-
-    return {grade: count for grade, count in grade_counts}
+    return grade_distribution(school_id)
 
 
 def get_teacher_performance_metrics(school_id):
     """Get performance metrics for all teachers in school"""
-    return db.session.query(
+    return aggregate_query(
         User.username.label('name'),
-        func.count(distinct(Subject.id)).label('subject_count'),
-        func.avg(ExamResult.marks).label('avg_score'),
-        (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate')
-    ).join(teacher_subjects, teacher_subjects.c.teacher_id == User.id) \
-        .join(Subject, teacher_subjects.c.subject_id == Subject.id) \
-        .join(ExamResult, ExamResult.subject_id == Subject.id) \
+        func.count(distinct(ResultAggregate.subject_id)).label('subject_count'),
+        mean_column().label('avg_score'),
+        pass_rate_column(),
+        school_id=school_id
+    ).join(teacher_subjects, teacher_subjects.c.subject_id == ResultAggregate.subject_id) \
+        .join(User, teacher_subjects.c.teacher_id == User.id) \
         .filter(User.school_id == school_id, User.role == 'teacher') \
         .group_by(User.id, User.username) \
         .all()
@@ -233,30 +237,12 @@ def calculate_trend_percentage(values):
 
 def get_performance_trend_data(school_id, months=6):
     """Get comprehensive performance trend data for charts and indicators"""
-    # Get mean scores trend
-    mean_trend = db.session.query(
-        func.to_char(Exam.exam_date, 'YYYY-MM').label('month'),
-        func.avg(ExamResult.marks).label('avg_marks')
-    ).join(ExamResult) \
-        .filter(Exam.school_id == school_id) \
-        .group_by(func.to_char(Exam.exam_date, 'YYYY-MM')) \
-        .order_by(func.to_char(Exam.exam_date, 'YYYY-MM').desc()) \
-        .limit(months).all()
-
-    # Get pass rates trend
-    pass_rate_trend = db.session.query(
-        func.to_char(Exam.exam_date, 'YYYY-MM').label('month'),
-        (func.avg(case((ExamResult.marks >= 50, 1), else_=0)) * 100).label('pass_rate')
-    ).join(ExamResult) \
-        .filter(Exam.school_id == school_id) \
-        .group_by(func.to_char(Exam.exam_date, 'YYYY-MM')) \
-        .order_by(func.to_char(Exam.exam_date, 'YYYY-MM').desc()) \
-        .limit(months).all()
-
-    # Prepare data
-    exam_periods = [t.month for t in mean_trend]
-    mean_scores = [float(t.avg_marks) for t in mean_trend]
-    pass_rates = [float(t.pass_rate) for t in pass_rate_trend]
+    trend = trend_series(school_id, period_type='month', limit=months)
+
+    # Prepare data, oldest period first
+    exam_periods = [t['period'] for t in trend]
+    mean_scores = [float(t['mean']) for t in trend]
+    pass_rates = [float(t['pass_rate']) for t in trend]
 
     # Calculate trend percentages
     mean_trend_pct = calculate_trend_percentage(mean_scores) if mean_scores else 0
@@ -330,9 +316,9 @@ def admin_dashboard():
 def get_revenue_trends():
     """Get revenue trends with monthly breakdown"""
     return db.session.query(
-        func.to_char(Payment.payment_date, 'YYYY-MM').label('month'),
+        month_bucket(Payment.payment_date).label('month'),
         func.sum(Payment.amount).label('amount')
-    ).group_by(func.to_char(Payment.payment_date, 'YYYY-MM')).all()
+    ).group_by(month_bucket(Payment.payment_date)).all()
 
 
 def get_system_performance_metrics():
@@ -371,84 +357,15 @@ def school_dashboard():
             school.subscription_expiry = datetime.combine(school.subscription_expiry, datetime.min.time())
             db.session.commit()
 
-        update_school_performance(school.id)
-
-        # Get comprehensive performance trend data with None check
-        trend_data = get_performance_trend_data(school.id) or {
-            'mean_trend_pct': 0,
-            'pass_rate_trend_pct': 0,
-            'exam_periods': [],
-            'mean_scores': [],
-            'pass_rates': []
-        }
-
-        # Get school performance with proper None handling
-        school_performance = get_school_performance(school.id) or {}
-
-        # Prepare the complete performance dictionary
-        performance = get_school_performance(school.id) or {
-            'overall': {
-                'mean': 0,
-                'pass_rate': 0,
-                'total_students': User.query.filter_by(
-                    school_id=school.id,
-                    role='student'
-                ).count(),
-                'active_students': User.query.filter_by(
-                    school_id=school.id,
-                    role='student',
-                    is_active=True
-                ).count(),
-                'total_subjects': Subject.query.join(AcademicClass) \
-                    .filter(AcademicClass.school_id == school.id) \
-                    .count(),
-                'core_subjects': Subject.query.join(AcademicClass) \
-                    .filter(
-                    AcademicClass.school_id == school.id,
-                    Subject.is_core == True
-                ).count(),
-                'total_results': ExamResult.query.join(Exam) \
-                    .filter(Exam.school_id == school.id).count()
-            },
-            'by_class': get_class_performance(school.id) or {},
-            'by_subject': get_subject_performance(school.id) or {},
-            'trends': {
-                'mean_trend': trend_data.get('mean_trend_pct', 0),
-                'pass_rate_trend': trend_data.get('pass_rate_trend_pct', 0),
-                'exam_periods': trend_data.get('exam_periods', []),
-                'mean_scores': trend_data.get('mean_scores', []),
-                'pass_rates': trend_data.get('pass_rates', [])
-            },
-            'grade_distribution': get_grade_distribution(school.id) or {},
-            'teacher_performance': get_teacher_performance_metrics(school.id) or [],
-            'top_students': get_top_students(school.id) or [],
-            'bottom_students': get_bottom_students(school.id) or []
-        }
-
-        # Get additional data with error handling
-        try:
-            exams = get_recent_exams(school.id)
-            stats = get_school_stats(school.id)
-        except Exception as e:
-            logger.warning(f"Error fetching additional dashboard data: {str(e)}")
-            exams = []
-            stats = {}
-
-        # Prepare data for template with consistent datetime types
+        # The page is a shell; each section is fetched from school_section as JSON
         current_date = datetime.now()  # Using datetime consistently
-        students = User.query.filter_by(school_id=school.id, role='student').all()
-
         data = {
-            'students': students if students else [],
             'school': school,
-            'performance': performance,
-            'exams': exams,
             'current_date': current_date,  # Now always datetime
             'current_date_date': current_date.date(),  # Also provide date version if needed
-            'stats': stats or {}
+            'section_urls': [[name, url_for('dashboard.school_section', name=name)] for name in SCHOOL_SECTIONS]
         }
 
-        logger.debug(f"Dashboard data prepared for school {school.id}")
         response = make_response(render_template('dashboard_school.html', **data))
         response.headers['Cache-Control'] = 'no-cache'
         return response
@@ -459,12 +376,215 @@ def school_dashboard():
         return redirect(url_for('dashboard.dashboard'))
 
 
+@dashboard_bp.route('/school/sections/<name>')
+@login_required
+def school_section(name):
+    """One section of the school dashboard as JSON"""
+    if current_user.role != 'school_admin' or not current_user.school_id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    build = SCHOOL_SECTIONS.get(name)
+    if build is None:
+        return jsonify({'error': f'Unknown dashboard section: {name}'}), 404
+
+    school_id = current_user.school_id
+    return versioned_json(name, school_id, lambda: build(school_id))
+
+
+@dashboard_bp.route('/school/students')
+@login_required
+def school_students():
+    """
+    One keyset-paginated page of a class or stream's student table as JSON. Query
+    parameters: class (required), stream, exam_id, sort ('total', 'average' or
+    'subject:<name>'), order ('desc' or 'asc'), limit and cursor.
+    """
+    if current_user.role != 'school_admin' or not current_user.school_id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    class_name = request.args.get('class')
+    if not class_name:
+        return jsonify({'error': 'A class is required'}), 400
+
+    school_id = current_user.school_id
+    options = {
+        'stream': request.args.get('stream') or None,
+        'exam_id': request.args.get('exam_id', type=int),
+        'sort': request.args.get('sort', 'total'),
+        'order': request.args.get('order', 'desc'),
+        'limit': request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        'cursor': request.args.get('cursor') or None
+    }
+    return versioned_json('student_page', school_id, lambda: get_student_page(school_id, class_name, **options))
+
+
+@dashboard_bp.route('/school/distributions')
+@login_required
+def school_distributions():
+    """
+    Mark distributions of the school as JSON: median, quartiles, standard deviation
+    and grade-boundary percentiles per group. Query parameters: by ('school',
+    'subject', 'class', 'exam' or 'term') and exam_id.
+    """
+    if current_user.role != 'school_admin' or not current_user.school_id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    school_id = current_user.school_id
+    by = request.args.get('by', 'subject')
+    exam_id = request.args.get('exam_id', type=int)
+    return versioned_json('distributions', school_id, lambda: get_mark_distributions(school_id, exam_id, by=by))
+
+
+def versioned_json(section, school_id, build):
+    """
+    JSON response for dashboard data of a school. The ETag embeds the school's data
+    version, so browsers revalidate instead of refetching, and Server-Timing reports
+    the time spent building it. ValueError from build is a bad request.
+    """
+    etag = f"{section}-{school_id}-v{get_data_version(school_id)}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        start = time.perf_counter()
+        try:
+            data = build()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Dashboard section {section} failed for school {school_id}: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Could not load this section'}), 500
+        elapsed = time.perf_counter() - start
+
+        _section_seconds.observe((('section', section),), elapsed)
+        response = jsonify(data)
+        response.headers['Server-Timing'] = f'section;desc="{section}";dur={elapsed * 1000:.1f}'
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@cached_analytics('dashboard_kpis')
+def get_school_kpis(school_id):
+    """Headline figures for the summary cards, from the aggregates and trend rollups"""
+    stats = aggregate_query(
+        mean_column(),
+        pass_rate_column(),
+        func.sum(ResultAggregate.result_count).label('total_results'),
+        func.count(distinct(Subject.name)).label('total_subjects'),
+        func.count(distinct(case((Subject.is_core == True, Subject.name)))).label('core_subjects'),
+        school_id=school_id
+    ).join(Subject, ResultAggregate.subject_id == Subject.id).first()
+    if stats is None or stats.mean is None:
+        return {'has_data': False}
+
+    students = student_count_query(school_id=school_id).scalar() or 0
+    trends = get_performance_trend_data(school_id)
+    return {
+        'has_data': True,
+        'mean': round(stats.mean, 1),
+        'pass_rate': round(stats.pass_rate, 1),
+        'mean_trend': trends['mean_trend_pct'],
+        'pass_rate_trend': trends['pass_rate_trend_pct'],
+        'total_students': students,
+        'active_students': students,
+        'total_subjects': stats.total_subjects,
+        'core_subjects': stats.core_subjects,
+        'total_results': stats.total_results
+    }
+
+
+@cached_analytics('dashboard_grades')
+def get_school_grades(school_id):
+    """Grade counts with the total they are a share of"""
+    distribution = get_grade_distribution(school_id)
+    return {'distribution': distribution, 'total_results': sum(distribution.values())}
+
+
+@cached_analytics('dashboard_teachers')
+def get_school_teachers(school_id):
+    """Rows of the teacher performance table"""
+    return [{
+        'name': t.name,
+        'subject_count': t.subject_count,
+        'avg_score': round(t.avg_score or 0, 1),
+        'pass_rate': round(t.pass_rate or 0, 1)
+    } for t in get_teacher_performance_metrics(school_id)]
+
+
+@cached_analytics('dashboard_exams')
+def get_school_recent_exams(school_id):
+    """Rows of the recent exams table"""
+    return [{
+        'name': exam.name,
+        'date': exam.exam_date.strftime('%Y-%m-%d') if exam.exam_date else None,
+        'mean_score': exam.mean_score,
+        'pass_rate': exam.pass_rate,
+        'student_count': exam.student_count,
+        'trend': exam.trend
+    } for exam in get_recent_exams(school_id)]
+
+
+def get_school_class_detail(school_id):
+    """
+    Class and stream summaries; read from the cached school performance. Student
+    rows are not embedded, the page loads them from school_students.
+    """
+    performance = get_school_performance(school_id) or {}
+    classes = {}
+    for class_name, detail in performance.get('by_class_detailed', {}).items():
+        classes[class_name] = {
+            'mean': detail['mean'],
+            'pass_rate': detail['pass_rate'],
+            'student_count': len(detail['students']),
+            'streams': {
+                stream: {
+                    'mean': stream_detail['mean'],
+                    'pass_rate': stream_detail['pass_rate'],
+                    'student_count': len(stream_detail['students'])
+                } for stream, stream_detail in (detail['streams'] or {}).items()
+            } or None
+        }
+    return {
+        'classes': classes,
+        'by_class': performance.get('by_class', {}),
+        'students_url': url_for('dashboard.school_students')
+    }
+
+
+def get_school_subjects(school_id):
+    """Subject chart and rankings; read from the cached school performance"""
+    return {'by_subject': (get_school_performance(school_id) or {}).get('by_subject', {})}
+
+
+def get_school_students(school_id):
+    """Top and bottom students; read from the cached school performance"""
+    performance = get_school_performance(school_id) or {}
+    return {'top': performance.get('top_students', []), 'bottom': performance.get('bottom_students', [])}
+
+
+# Lazily loaded sections of the school dashboard, in page order
+SCHOOL_SECTIONS = {
+    'kpis': get_school_kpis,
+    'trends': get_performance_trend_data,
+    'classes': get_school_class_detail,
+    'grades': get_school_grades,
+    'teachers': get_school_teachers,
+    'subjects': get_school_subjects,
+    'students': get_school_students,
+    'exams': get_school_recent_exams
+}
+
+_section_seconds = registry.histogram('dashboard_section_seconds', 'Time to build a school dashboard section')
+
+
 def get_school_stats(school_id):
     """Get school statistics with fresh queries"""
     return {
         'teacher_count': User.query.filter_by(school_id=school_id, role='teacher').count(),
         'student_count': User.query.filter_by(school_id=school_id, role='student').count(),
-        'active_exams': Exam.query.filter_by(school_id=school_id).count(),
+        'active_exams': Exam.query.filter_by(school_id=school_id, is_complete=True).count(),
         'pending_payments': Payment.query.filter_by(
             school_id=school_id,
             status='pending'
@@ -502,18 +622,6 @@ def teacher_dashboard():
         return redirect(url_for('dashboard.dashboard'))
 
 
-def get_teacher_performance(teacher_id):
-    """Get performance metrics for teacher's subjects"""
-    return db.session.query(
-        Subject.name,
-        func.avg(ExamResult.marks).label('average_score'),
-        func.count(ExamResult.id).label('results_count')
-    ).join(teacher_subjects, teacher_subjects.c.subject_id == Subject.id) \
-        .join(ExamResult, ExamResult.subject_id == Subject.id) \
-        .filter(teacher_subjects.c.teacher_id == teacher_id) \
-        .group_by(Subject.name).all()
-
-
 @dashboard_bp.route('/parent')
 @login_required
 def parent_dashboard():
@@ -529,10 +637,7 @@ def parent_dashboard():
                                    performances={},
                                    upcoming_exams=[])
 
-        performances = {
-            student.id: get_student_performance(student.id, force_refresh=True)
-            for student in current_user.students
-        }
+        performances = get_students_performance([student.id for student in current_user.students])
 
         data = {
             'students': current_user.students,
@@ -567,7 +672,7 @@ def get_student_trends(students):
             Exam.name,
             ExamResult.marks
         ).join(Exam) \
-            .filter(ExamResult.student_id == student.id) \
+            .filter(ExamResult.student_id == student.id, Exam.is_complete.is_(True)) \
             .order_by(Exam.exam_date.desc()) \
             .limit(5).all()
         for student in students
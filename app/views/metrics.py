@@ -0,0 +1,33 @@
+import hmac
+from flask import Blueprint, Response, request, current_app
+from flask_login import current_user
+from app.services.instrumentation import registry
+from app.services.cache import get_cache
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """
+    Expose in-process pipeline metrics in the Prometheus text format, to scrapers
+    presenting METRICS_TOKEN as a bearer token or to a signed-in admin
+    """
+    if not (scraper_authorized() or (current_user.is_authenticated and current_user.role == 'admin')):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+
+    lines = [registry.render()]
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        for name in ('entries', 'bytes'):
+            metric = f"{registry.prefix}analytics_cache_{name}"
+            lines.append(f"# TYPE {metric} gauge\n{metric}{{backend=\"{stats['backend']}\"}} {stats.get(name, 0)}\n")
+
+    return Response(''.join(lines), mimetype='text/plain; version=0.0.4')
+
+
+def scraper_authorized():
+    """True when METRICS_TOKEN is set and the request carries it; no token configured admits no scraper"""
+    token = current_app.config.get('METRICS_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
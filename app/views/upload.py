@@ -1,28 +1,33 @@
-from flask import Blueprint, request, flash, redirect, url_for, current_app, render_template
+from flask import Blueprint, request, flash, redirect, url_for, current_app, render_template, jsonify, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 import logging
 from datetime import datetime
 from app.services.excel_parser import process_exam_upload
-from app.services.analysis import update_school_performance
-from app.models import db
+from app.services.upload_jobs import enqueue_upload, enqueue_batch_upload
+from app.models import db, UploadJob
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
 upload_bp = Blueprint('upload', __name__, template_folder='templates')
 
-ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'zip'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_BATCH_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
 
 @upload_bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload():
-    """Handle exam file uploads with validation, processing, and dashboard redirection"""
+    """Handle exam file uploads with validation and queue them for background processing"""
     if request.method == 'GET':
-        return render_template('upload.html')
+        return render_template('upload.html', job_id=request.args.get('job'))
+
+    if not current_user.school_id:
+        flash('User is not associated with any school', 'error')
+        return redirect(url_for('upload.upload'))
 
     try:
         # Validate form inputs
@@ -45,29 +50,39 @@ def upload():
             return redirect(url_for('upload.upload'))
 
         if not allowed_file(file.filename):
-            flash('Only Excel files (.xlsx, .xls) are allowed', 'error')
+            flash('Only Excel files (.xlsx, .xls) or CSV/Parquet bundles (.zip) are allowed', 'error')
             return redirect(url_for('upload.upload'))
 
         if not allowed_file_size(file):
             flash('File size exceeds maximum limit (10MB)', 'error')
             return redirect(url_for('upload.upload'))
 
-        # Process the file using excel_parser service
-        result = process_exam_upload(file.stream)
-
-        if result['status'] == 'error':
-            flash(f"Processing failed: {result['message']}", 'error')
-            return redirect(url_for('upload.upload'))
-
-        # Create exam record (simplified - adjust according to your Exam model)
         exam_date = datetime.strptime(exam_date, '%Y-%m-%d').date()
 
-        # Update school performance metrics
-        update_school_performance(current_user.school_id)
-
-        logger.info(f"Exam results processed successfully by user {current_user.id}")
-        flash('Exam results processed successfully! Dashboard updated.', 'success')
-        return redirect(url_for('dashboard.school_dashboard'))
+        # Validation-only runs are quick and write nothing, so they stay in the request
+        if request.form.get('dry_run'):
+            result = process_exam_upload(file.stream, dry_run=True)
+            if wants_json():
+                return jsonify(result)
+            return render_template('upload.html', validation=result)
+
+        # Hand the file to the background upload workers
+        job = enqueue_upload(
+            file,
+            current_user.school_id,
+            current_user.id,
+            upsert=bool(request.form.get('upsert')),
+            commit_every=current_app.config.get('INGEST_COMMIT_EVERY'),
+            commit_threshold=current_app.config.get('INGEST_COMMIT_THRESHOLD'),
+            resume=True
+        )
+
+        logger.info(f"Upload job {job.id} queued by user {current_user.id}")
+        if wants_json():
+            return jsonify(job.to_dict()), 202, {'Location': url_for('upload.job_status', job_id=job.id)}
+
+        flash('Exam results queued for processing. This page will update when they are ready.', 'info')
+        return redirect(url_for('upload.upload', job=job.id))
 
     except ValueError as e:
         flash(f'Invalid date format: {str(e)}', 'error')
@@ -79,16 +94,68 @@ def upload():
     return redirect(url_for('upload.upload'))
 
 
+@upload_bp.route('/batch', methods=['POST'])
+@login_required
+def batch_upload():
+    """Queue a ZIP archive holding one workbook per class for parallel processing"""
+    if not current_user.school_id:
+        flash('User is not associated with any school', 'error')
+        return redirect(url_for('upload.upload'))
+
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        flash('No file uploaded', 'error')
+        return redirect(url_for('upload.upload'))
+
+    if not file.filename.lower().endswith('.zip'):
+        flash('Batch uploads must be a .zip archive of Excel workbooks', 'error')
+        return redirect(url_for('upload.upload'))
+
+    if not allowed_file_size(file, MAX_BATCH_FILE_SIZE):
+        flash('File size exceeds maximum limit (50MB)', 'error')
+        return redirect(url_for('upload.upload'))
+
+    try:
+        job = enqueue_batch_upload(file, current_user.school_id, current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Batch upload failed: {str(e)}", exc_info=True)
+        flash(f'An error occurred: {str(e)}', 'error')
+        return redirect(url_for('upload.upload'))
+
+    logger.info(f"Batch upload job {job.id} queued by user {current_user.id}")
+    if wants_json():
+        return jsonify(job.to_dict()), 202, {'Location': url_for('upload.job_status', job_id=job.id)}
+
+    flash('Workbooks queued for processing. This page will update when they are ready.', 'info')
+    return redirect(url_for('upload.upload', job=job.id))
+
+
+@upload_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Report state, progress counts and errors for a queued upload"""
+    job = db.session.get(UploadJob, job_id)
+    if job is None or job.school_id != current_user.school_id:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+def wants_json():
+    """True when the client asked for a JSON response instead of a redirect"""
+    return request.accept_mimetypes.best == 'application/json'
+
+
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def allowed_file_size(file):
+def allowed_file_size(file, max_size=MAX_FILE_SIZE):
     """Check if the file size is within limits"""
     start_pos = file.tell()
     file.seek(0, 2)
     size = file.tell()
     file.seek(start_pos)
-    return size <= MAX_FILE_SIZE
\ No newline at end of file
+    return size <= max_size
\ No newline at end of file
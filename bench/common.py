@@ -0,0 +1,57 @@
+# bench/common.py
+import argparse
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from app import create_app, db
+from app.models import School, User
+
+
+class BenchConfig:
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    ANALYTICS_CACHE_BACKEND = 'none'
+
+
+def parser(description):
+    """Argument parser with the options every benchmark takes"""
+    args = argparse.ArgumentParser(description=description)
+    args.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'),
+                      help='database to run against (default: a temporary SQLite file); it is emptied')
+    args.add_argument('--repeat', type=int, default=3, help='runs per measurement; the best is reported')
+    return args
+
+
+@contextmanager
+def fresh_app(database_url=None):
+    """An app context on an emptied database holding one school and its admin (both id 1)"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = type('Config', (BenchConfig,), {
+            'SQLALCHEMY_DATABASE_URI': database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+        })
+        app = create_app(config)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            school = School(name='Bench School', is_active=True)
+            db.session.add(school)
+            db.session.flush()
+            db.session.add(User(username='bench', email='bench@example.com', role='school_admin',
+                                school_id=school.id))
+            db.session.commit()
+            try:
+                yield app
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+
+def best_of(repeat, run):
+    """Best wall time in seconds of repeat calls to run, and the last call's result"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,51 @@
+# bench/contacts.py
+"""
+Contact-sheet stage time with the validation cache cold and warm, serially and on
+a thread pool. Deliverability (DNS) checks are off unless --deliverability is given,
+and without them the parser validates serially even when given workers.
+
+    python -m bench.contacts --students 5000 --distinct 2000 [--workers 8]
+"""
+import email_validator
+from app.services.excel_parser import ExamParser, _normalize_email, _normalize_phone
+from app.services.workbook import open_workbook
+from bench.common import parser, best_of
+from tests.factories import make_workbook
+
+
+def parse_contacts(workbook, contact_workers, cold):
+    if cold:
+        _normalize_email.cache_clear()
+        _normalize_phone.cache_clear()
+    workbook.seek(0)
+    sheets = open_workbook(workbook)
+    try:
+        return ExamParser(contact_workers=contact_workers)._parse_contacts_sheet(sheets)
+    finally:
+        sheets.close()
+
+
+def main():
+    args = parser(__doc__.strip().splitlines()[0])
+    args.add_argument('--students', type=int, default=5000)
+    args.add_argument('--distinct', type=int, default=2000, help='distinct parent contacts')
+    args.add_argument('--workers', type=int, default=8)
+    args.add_argument('--deliverability', action='store_true', help='include DNS deliverability checks')
+    options = args.parse_args()
+    email_validator.CHECK_DELIVERABILITY = options.deliverability
+
+    workbook = make_workbook(
+        options.students, subjects=['Math'],
+        emails=lambda i: f'parent{i % options.distinct}@example-mail.com',
+        phones=lambda i: f'+254 71{i % options.distinct:07d}'
+    )
+    print(f"{options.students} students, {options.distinct} distinct contacts, best of {options.repeat}")
+    for label, workers, cold in (('serial, cold cache', None, True),
+                                 (f'{options.workers} threads, cold cache', options.workers, True),
+                                 ('warm cache', None, False)):
+        seconds, _ = best_of(options.repeat, lambda: parse_contacts(workbook, workers, cold))
+        print(f"{label:>24}: {seconds:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# bench/engines.py
+"""
+get_school_performance on the SQL engine against the columnar (NumPy) engine, for a
+school holding several exams, with the analytics cache bypassed. Each size is the
+approximate number of stored results and runs on a freshly emptied database.
+
+    python -m bench.engines --sizes 1000 10000 100000 --exams 4 [--database-url URL]
+"""
+from app.services.analysis import get_school_performance_sql
+from app.services.columnar import get_school_performance_columnar
+from app.services.excel_parser import ExamParser
+from app.models import db, ExamResult
+from bench.common import parser, fresh_app, best_of
+from tests.factories import make_workbook
+
+ENGINES = {'sql': get_school_performance_sql, 'columnar': get_school_performance_columnar}
+
+
+def run_size(options, size):
+    """Load about size results into a fresh database and time each engine on them"""
+    subjects = [f'Subject{i}' for i in range(options.subjects)]
+    students = max(size // (options.subjects * options.exams), 1)
+    with fresh_app(options.database_url):
+        for exam in range(options.exams):
+            workbook = make_workbook(students, subjects=subjects, exam=f'Exam {exam}', seed=exam)
+            success, message = ExamParser().parse_excel(workbook, school_id=1, uploader_id=1)
+            if not success:
+                raise SystemExit(message)
+
+        results = db.session.query(ExamResult.id).count()
+        timings = {name: best_of(options.repeat, lambda: engine(1))[0] for name, engine in ENGINES.items()}
+    return students, results, timings
+
+
+def main():
+    args = parser(__doc__.strip().splitlines()[0])
+    args.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                      help='approximate result counts to measure')
+    args.add_argument('--subjects', type=int, default=8)
+    args.add_argument('--exams', type=int, default=4)
+    options = args.parse_args()
+
+    print(f"{options.exams} exams x {options.subjects} subjects, best of {options.repeat}")
+    print(f"{'results':>9} {'students':>9} " + ' '.join(f"{name:>10}" for name in ENGINES) + f" {'speedup':>8}")
+    for size in options.sizes:
+        students, results, timings = run_size(options, size)
+        speedup = timings['sql'] / timings['columnar']
+        print(f"{results:>9} {students:>9} " + ' '.join(f"{timings[name]:>9.3f}s" for name in ENGINES) +
+              f" {speedup:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
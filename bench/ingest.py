@@ -0,0 +1,44 @@
+# bench/ingest.py
+"""
+Rows per second of ExamParser's bulk result writes (executemany, or COPY on
+PostgreSQL) against the per-row ORM path, each run on a freshly emptied database.
+
+    python -m bench.ingest --students 2000 --subjects 12 [--database-url URL]
+"""
+import time
+from app.services.excel_parser import ExamParser
+from bench.common import parser, fresh_app
+from tests.factories import make_workbook
+
+MODES = {'bulk': True, 'orm': False}
+
+
+def run_ingest(database_url, workbook, bulk_insert):
+    """Ingest workbook once; returns (seconds, results written, SQL statements)"""
+    with fresh_app(database_url):
+        workbook.seek(0)
+        ingest = ExamParser(bulk_insert=bulk_insert)
+        start = time.perf_counter()
+        success, message = ingest.parse_excel(workbook, school_id=1, uploader_id=1)
+        elapsed = time.perf_counter() - start
+        if not success:
+            raise SystemExit(message)
+        return elapsed, ingest.change_summary['inserted'], ingest.timings['total_sql_statements']
+
+
+def main():
+    args = parser(__doc__.strip().splitlines()[0])
+    args.add_argument('--students', type=int, default=2000)
+    args.add_argument('--subjects', type=int, default=12)
+    options = args.parse_args()
+
+    workbook = make_workbook(options.students, subjects=[f'Subject{i}' for i in range(options.subjects)])
+    print(f"{options.students} students x {options.subjects} subjects, best of {options.repeat}")
+    for mode, bulk_insert in MODES.items():
+        runs = [run_ingest(options.database_url, workbook, bulk_insert) for _ in range(options.repeat)]
+        seconds, rows, statements = min(runs)
+        print(f"{mode:>5}: {seconds:8.3f}s  {rows / seconds:10.0f} rows/s  {statements} SQL statements")
+
+
+if __name__ == '__main__':
+    main()
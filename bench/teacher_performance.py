@@ -0,0 +1,78 @@
+# bench/teacher_performance.py
+"""
+get_teacher_performance (read from the result aggregates) against loading the
+teacher's results as ORM objects: best latency and peak Python allocation of each.
+
+    python -m bench.teacher_performance --students 2000 --exams 4 [--database-url URL]
+"""
+import gc
+import time
+import tracemalloc
+from app.services.analysis import get_teacher_performance
+from app.services.excel_parser import ExamParser
+from app.models import db, ExamResult, Subject, User, teacher_subjects
+from bench.common import parser, fresh_app
+from tests.factories import make_workbook
+
+
+def measure(repeat, run):
+    """Best wall time in seconds and best peak traced allocation in bytes of repeat runs"""
+    best_seconds = best_peak = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        best_seconds = elapsed if best_seconds is None else min(best_seconds, elapsed)
+        best_peak = peak if best_peak is None else min(best_peak, peak)
+    return best_seconds, best_peak
+
+
+def main():
+    args = parser(__doc__.strip().splitlines()[0])
+    args.add_argument('--students', type=int, default=2000)
+    args.add_argument('--subjects', type=int, default=8)
+    args.add_argument('--exams', type=int, default=4)
+    options = args.parse_args()
+
+    subjects = [f'Subject{i}' for i in range(options.subjects)]
+    with fresh_app(options.database_url):
+        for exam in range(options.exams):
+            workbook = make_workbook(options.students, subjects=subjects, exam=f'Exam {exam}', seed=exam)
+            success, message = ExamParser().parse_excel(workbook, school_id=1, uploader_id=1)
+            if not success:
+                raise SystemExit(message)
+
+        # The teacher takes the first half of the subjects in every class
+        teacher = User(username='teacher', email='teacher@example.com', role='teacher', school_id=1)
+        db.session.add(teacher)
+        db.session.flush()
+        taught = Subject.query.filter(Subject.name.in_(subjects[:max(len(subjects) // 2, 1)])).all()
+        db.session.execute(teacher_subjects.insert(), [
+            {'teacher_id': teacher.id, 'subject_id': subject.id} for subject in taught
+        ])
+        db.session.commit()
+        teacher_id = teacher.id
+
+        def load_rows():
+            return ExamResult.query.join(teacher_subjects, teacher_subjects.c.subject_id == ExamResult.subject_id) \
+                .filter(teacher_subjects.c.teacher_id == teacher_id) \
+                .options(db.joinedload(ExamResult.subject)) \
+                .all()
+
+        results = db.session.query(ExamResult.id) \
+            .join(teacher_subjects, teacher_subjects.c.subject_id == ExamResult.subject_id) \
+            .filter(teacher_subjects.c.teacher_id == teacher_id) \
+            .count()
+        print(f"{results} results in the teacher's subjects, best of {options.repeat}")
+        for name, run in (('aggregates', lambda: get_teacher_performance(teacher_id)), ('orm_rows', load_rows)):
+            seconds, peak = measure(options.repeat, run)
+            print(f"{name:>10}: {seconds:8.3f}s  {peak / 1024:10.0f} KiB peak")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# tests/conftest.py
+import os
+import email_validator
+import pytest
+from app import create_app, db
+from app.models import School, User
+from app.services import excel_parser
+
+
+class TestConfig:
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    ANALYTICS_CACHE_BACKEND = 'lru'
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    An app on a fresh database, with one school and its admin (both id 1), inside an
+    app context. TEST_DATABASE_URL selects the database; the default is a SQLite file.
+    """
+    config = type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL') or f"sqlite:///{tmp_path / 'test.db'}",
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads')
+    })
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        school = School(name='Test School', is_active=True)
+        db.session.add(school)
+        db.session.flush()
+        admin = User(username='admin', email='admin@example.com', role='school_admin', school_id=school.id)
+        admin.set_password('password')
+        db.session.add(admin)
+        db.session.commit()
+        excel_parser.clear_lookup_cache(school.id)
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture(autouse=True)
+def offline_email_validation(monkeypatch):
+    """Validate email syntax only; deliverability checks would make tests depend on DNS"""
+    monkeypatch.setattr(email_validator, 'CHECK_DELIVERABILITY', False)
+
+
+@pytest.fixture
+def dialect(app):
+    return db.engine.dialect.name
+
+
+@pytest.fixture
+def upload(app):
+    """Ingest a workbook into school 1 as its admin; returns process_exam_upload's result"""
+    def upload(workbook, **options):
+        return excel_parser.process_exam_upload(workbook, school_id=1, uploader_id=1, **options)
+    return upload
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Sign the test client in through the login form; users are created with password 'password'"""
+    def login(user):
+        response = client.post('/auth/login', data={'email': user.email, 'password': 'password'})
+        assert response.status_code == 302
+    return login
@@ -0,0 +1,72 @@
+# tests/factories.py
+import io
+import random
+import zipfile
+import pandas as pd
+
+DEFAULT_SUBJECTS = ('Math', 'English', 'Kiswahili_Paper1', 'Kiswahili_Paper2')
+
+
+def make_workbook(students=50, subjects=DEFAULT_SUBJECTS, exam='Mid Term', academic_year='2024', semester=1,
+                  start_date='2024-03-01', classes=('Form 1', 'Form 2'), streams=('East', 'West'), first_student=0, seed=1,
+                  emails=None, phones=None, marks=None):
+    """
+    An upload workbook with the four template sheets. Student i is in
+    classes[i % len(classes)] and streams[(i // len(classes)) % len(streams)];
+    marks are random unless marks(i, subject) is given. emails(i) and phones(i)
+    fill the parent contact columns.
+    """
+    rnd = random.Random(seed)
+    numbers = range(first_student, first_student + students)
+    metadata = pd.DataFrame([{
+        'ExamName': exam,
+        'ExamType': 'CAT',
+        'StartDate': pd.Timestamp(start_date),
+        'Semester': semester,
+        'AcademicYear': academic_year
+    }])
+    contacts = pd.DataFrame([{
+        'AdmissionNo': f'A{i}',
+        'Parent1_Email': emails(i) if emails else '-',
+        'Parent1_WhatsApp': phones(i) if phones else '-',
+        'Parent2_Email': 'n/a'
+    } for i in numbers])
+    subject_config = pd.DataFrame([{'SubjectCode': subject} for subject in subjects])
+
+    rows = []
+    for i in numbers:
+        row = {
+            'AdmissionNo': f'A{i}',
+            'StudentName': f'Student {i}',
+            'Class': classes[i % len(classes)],
+            'Stream': streams[(i // len(classes)) % len(streams)] if streams else '',
+            'Remarks': ''
+        }
+        for subject in subjects:
+            row[subject] = marks(i, subject) if marks else rnd.randint(20, 99)
+        rows.append(row)
+
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        metadata.to_excel(writer, sheet_name='Exam Metadata', index=False)
+        contacts.to_excel(writer, sheet_name='Student Contacts', index=False)
+        subject_config.to_excel(writer, sheet_name='Subject Configuration', index=False)
+        pd.DataFrame(rows).to_excel(writer, sheet_name='Student Results', index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def make_bundle(format='csv', **options):
+    """make_workbook's four sheets as a ZIP bundle of CSV or Parquet files, one per sheet"""
+    sheets = pd.read_excel(make_workbook(**options), sheet_name=None)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as bundle:
+        for sheet_name, df in sheets.items():
+            member = io.BytesIO()
+            if format == 'parquet':
+                df.to_parquet(member, index=False)
+            else:
+                df.to_csv(member, index=False)
+            bundle.writestr(f"{sheet_name.lower().replace(' ', '_')}.{format}", member.getvalue())
+    buffer.seek(0)
+    return buffer
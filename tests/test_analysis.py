@@ -0,0 +1,166 @@
+# tests/test_analysis.py
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from app.models import db, AcademicClass, Exam, ExamResult, School, Student, Subject, User, teacher_subjects
+from app.services import excel_parser
+from app.services.analysis import (
+    _grouping_sets_rollup, _student_rollup, build_student_scores, get_school_performance_sql,
+    get_student_performance, get_students_performance
+)
+from app.services.columnar import get_school_performance_columnar
+from tests.factories import make_workbook
+
+
+def results_query():
+    return (db.session.query(ExamResult, Student, Subject, Exam, AcademicClass)
+            .select_from(ExamResult)
+            .join(Exam, ExamResult.exam_id == Exam.id)
+            .join(Student, ExamResult.student_id == Student.id)
+            .join(Subject, ExamResult.subject_id == Subject.id)
+            .join(AcademicClass, Student.academic_class_id == AcademicClass.id)
+            .filter(Exam.school_id == 1))
+
+
+@contextmanager
+def counted_statements():
+    """Collect the SQL statements the engine sends to the database"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_student_scores_take_the_same_queries_for_any_number_of_students(upload):
+    upload(make_workbook(10))
+    with counted_statements() as few:
+        few_students = build_student_scores(results_query())
+
+    upload(make_workbook(30, first_student=10))
+    with counted_statements() as many:
+        many_students = build_student_scores(results_query())
+
+    assert (len(few_students), len(many_students)) == (10, 40)
+    assert len(many) == len(few) == 1
+
+
+@pytest.mark.parametrize('engine', [get_school_performance_sql, get_school_performance_columnar])
+def test_student_rows_cover_only_the_latest_exam(upload, engine):
+    upload(make_workbook(30, exam='Opener'))
+    upload(make_workbook(10, exam='Mid Term'))
+    latest = Exam.query.filter_by(name='Mid Term').one()
+
+    performance = engine(1)
+
+    assert performance['students_exam_id'] == latest.id
+    assert len(performance['all_students']) == 10
+    assert sum(len(c['students']) for c in performance['by_class_detailed'].values()) == 10
+    assert performance['overall']['total_results'] == 40 * 4
+
+
+def flatten_rollup(rollup):
+    stats = {('school',): rollup['school']}
+    stats.update({('class', name): value for name, value in rollup['classes'].items()})
+    stats.update({('stream', name, stream): value
+                  for name, streams in rollup['streams'].items() for stream, value in streams.items()})
+    return stats
+
+
+def test_grouping_sets_rollup_matches_the_python_rollup(upload, dialect):
+    if dialect != 'postgresql':
+        pytest.skip('GROUPING SETS rollup runs on PostgreSQL only')
+    upload(make_workbook(40, seed=1))
+    upload(make_workbook(40, seed=2, marks=lambda i, subject: 50 if i % 5 == 0 else (i * 7) % 100))
+    upload(make_workbook(10, first_student=40, streams=()))
+
+    query = results_query()
+    expected = flatten_rollup(_student_rollup(build_student_scores(query)))
+    actual = flatten_rollup(_grouping_sets_rollup(query))
+
+    assert actual.keys() == expected.keys()
+    for key, stats in expected.items():
+        assert actual[key] == pytest.approx(stats), key
+
+
+def add_teacher(username, school_id, subject_name, class_name):
+    teacher = User(username=username, email=f'{username}@example.com', role='teacher', school_id=school_id)
+    db.session.add(teacher)
+    db.session.flush()
+    subjects = (Subject.query.join(AcademicClass)
+                .filter(AcademicClass.school_id == school_id, AcademicClass.name == class_name,
+                        Subject.name == subject_name)
+                .all())
+    db.session.execute(teacher_subjects.insert(), [
+        {'teacher_id': teacher.id, 'subject_id': subject.id} for subject in subjects
+    ])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('exam', ['latest', 'all'])
+def test_columnar_engine_matches_the_sql_engine_exactly(upload, exam):
+    # 80 results per class and subject make pass rates such as 51/80 = 63.75 land on a rounding tie
+    upload(make_workbook(160, seed=1, exam='Opener'))
+    upload(make_workbook(160, seed=2, exam='Mid Term'))
+    upload(make_workbook(120, seed=3, exam='End Term', marks=lambda i, subject: (i * 37 + len(subject)) % 101))
+    other = School(name='Other School', is_active=True)
+    db.session.add(other)
+    db.session.commit()
+    excel_parser.process_exam_upload(make_workbook(40, seed=4, first_student=1000), school_id=other.id,
+                                     uploader_id=1)
+    add_teacher('math', 1, 'Math', 'Form 1')
+    add_teacher('english', 1, 'English', 'Form 2')
+    add_teacher('elsewhere', other.id, 'Math', 'Form 1')
+
+    exam_id = Exam.query.filter_by(school_id=1, name='Mid Term').one().id if exam == 'latest' else None
+    sql = get_school_performance_sql(1, exam_id)
+    columnar = get_school_performance_columnar(1, exam_id)
+
+    assert [t['name'] for t in sql['teacher_performance']] == ['math', 'english']
+    for key in sql:
+        assert columnar[key] == sql[key], key
+
+
+def test_batched_student_performance_matches_the_per_student_function(app, upload):
+    upload(make_workbook(12, exam='Opener', seed=1))
+    upload(make_workbook(12, exam='Mid Term', seed=2))
+    student_ids = [student_id for student_id, in db.session.query(Student.id).order_by(Student.id)]
+    missing_id = max(student_ids) + 1
+
+    batch = get_students_performance(student_ids + [missing_id], limit=6)
+
+    assert batch[missing_id] is None
+    for student_id in student_ids:
+        single = get_student_performance(1, student_id, limit=6)
+        assert single is not None and single == batch[student_id]
+        assert single['overall']['exam_count'] == 2
+
+
+def test_batched_student_performance_takes_two_queries_for_any_batch(upload):
+    upload(make_workbook(40, exam='Opener', seed=1))
+    upload(make_workbook(40, exam='Mid Term', seed=2))
+    student_ids = [student_id for student_id, in db.session.query(Student.id).order_by(Student.id)]
+
+    with counted_statements() as few:
+        get_students_performance(student_ids[:3])
+    with counted_statements() as many:
+        get_students_performance(student_ids)
+
+    assert len(few) == len(many) == 2
+
+
+def test_cached_student_performance_needs_no_query_for_the_students_school(app, upload):
+    upload(make_workbook(5))
+    student_id = db.session.query(Student.id).first()[0]
+
+    with app.test_request_context():
+        get_student_performance(1, student_id)
+        with counted_statements() as statements:
+            get_student_performance(1, student_id)
+
+    assert statements == []
@@ -0,0 +1,153 @@
+# tests/test_cache.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.models import db
+from app.services import analysis
+from app.services.cache import (AnalyticsCache, LRUCacheBackend, SQLiteCacheBackend, bump_data_version,
+                                get_data_version)
+from app.views.dashboard import get_school_class_detail, get_school_students, get_school_subjects
+from tests.factories import make_workbook
+from tests.test_analysis import counted_statements
+
+
+def run_together(app, calls):
+    """Run each call on its own thread, inside its own request context, all released at once"""
+    barrier = threading.Barrier(len(calls))
+
+    def run(call):
+        with app.test_request_context():
+            barrier.wait()
+            return call()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+
+def test_dashboard_sections_share_one_school_performance_computation(app, upload, monkeypatch):
+    upload(make_workbook(20))
+    computations = []
+    compute = analysis.get_school_performance_sql
+
+    def slow_compute(school_id, exam_id=None):
+        computations.append(school_id)
+        time.sleep(0.2)
+        return compute(school_id, exam_id)
+
+    monkeypatch.setattr(analysis, 'get_school_performance_sql', slow_compute)
+    sections = [lambda: get_school_class_detail(1), lambda: get_school_subjects(1), lambda: get_school_students(1)]
+
+    classes, subjects, students = run_together(app, sections)
+
+    assert computations == [1]
+    assert classes['classes'] and subjects['by_subject'] and students['top']
+
+
+@pytest.fixture
+def computations(monkeypatch):
+    """Record each time school performance is actually computed rather than read from the cache"""
+    computed = []
+    compute = analysis.get_school_performance_sql
+
+    def counted_compute(school_id, exam_id=None):
+        computed.append(school_id)
+        return compute(school_id, exam_id)
+
+    monkeypatch.setattr(analysis, 'get_school_performance_sql', counted_compute)
+    return computed
+
+
+@pytest.fixture(params=['lru', 'sqlite'])
+def backend(request, app, tmp_path):
+    """Install an analytics cache on each backend in turn"""
+    if request.param == 'sqlite':
+        store = SQLiteCacheBackend(str(tmp_path / 'cache' / 'analytics.db'))
+    else:
+        store = LRUCacheBackend()
+    app.extensions['analytics_cache'] = AnalyticsCache(store)
+    return store
+
+
+def test_an_upload_bumps_the_data_version(app, upload, computations):
+    upload(make_workbook(10))
+    version = get_data_version(1)
+    first = analysis.get_school_performance(1)
+    assert analysis.get_school_performance(1) == first
+
+    upload(make_workbook(10, first_student=10, exam='End Term'))
+
+    assert get_data_version(1) > version
+    assert analysis.get_school_performance(1)['overall']['total_results'] > first['overall']['total_results']
+    assert computations == [1, 1]
+
+
+def test_force_refresh_recomputes_and_overwrites_the_cached_value(app, upload, computations):
+    upload(make_workbook(10))
+    analysis.get_school_performance(1)
+    refreshed = analysis.get_school_performance(1, force_refresh=True)
+
+    assert analysis.get_school_performance(1) == refreshed
+    assert computations == [1, 1]
+
+
+def test_no_stale_read_after_a_version_bump(app, upload, backend, computations):
+    upload(make_workbook(10))
+    with app.test_request_context():
+        first = analysis.get_school_performance(1)
+
+    upload(make_workbook(10, first_student=10, exam='End Term'))
+    with app.test_request_context():
+        second = analysis.get_school_performance(1)
+        assert second['overall']['total_results'] > first['overall']['total_results']
+
+        # A bump inside the request is seen by the request's next lookup
+        bump_data_version(1)
+        db.session.commit()
+        assert analysis.get_school_performance(1) == second
+
+    assert computations == [1, 1, 1]
+
+
+def test_cache_hits_share_one_data_version_query_per_request(app, upload):
+    upload(make_workbook(10))
+    analysis.get_school_performance(1)
+
+    with app.test_request_context(), counted_statements() as statements:
+        get_school_class_detail(1)
+        get_school_subjects(1)
+        get_school_students(1)
+
+    assert len([statement for statement in statements if 'data_version' in statement]) == 1
+
+
+def store_values(store, count, size=100):
+    """Store count values of roughly size pickled bytes under keys 0..count-1; returns the evictions"""
+    evictions = []
+    for key in range(count):
+        evictions.append(store.set(str(key), b'x' * size))
+        time.sleep(0.01)  # distinct access times for the SQLite store
+    return evictions
+
+
+@pytest.mark.parametrize('make_store', [
+    lambda tmp_path: LRUCacheBackend(max_bytes=500),
+    lambda tmp_path: SQLiteCacheBackend(str(tmp_path / 'analytics.db'), max_bytes=500)
+], ids=['lru', 'sqlite'])
+def test_backends_evict_least_recently_read_entries_beyond_max_bytes(tmp_path, make_store):
+    store = make_store(tmp_path)
+    assert store_values(store, 4) == [0, 0, 0, 0]
+    assert store.get('0') == b'x' * 100
+
+    # The fifth value overflows the limit: '1', read least recently, goes first
+    assert store.set('4', b'x' * 100) == 1
+    assert store.get('1') != b'x' * 100 and store.get('0') == b'x' * 100
+    stats = store.stats()
+    assert stats['entries'] == 4 and stats['bytes'] <= stats['max_bytes'] == 500
+
+    # Values larger than the whole store are not kept, and displace nothing
+    assert store.set('huge', b'x' * 1000) == 0
+    assert store.stats()['entries'] == 4
+
+    store.clear()
+    assert store.stats()['entries'] == 0
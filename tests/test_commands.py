@@ -0,0 +1,39 @@
+# tests/test_commands.py
+from app.models import db, Exam, ExamStudentSummary, ResultAggregate, TrendRollup
+from app.services.analysis import get_school_performance_sql
+from tests.factories import make_workbook
+from tests.test_analysis import counted_statements
+
+
+def forget_aggregates():
+    """Leave the uploaded exams as if they predate the aggregate tables"""
+    for model in (ResultAggregate, ExamStudentSummary, TrendRollup):
+        model.query.delete()
+    db.session.commit()
+
+
+def test_backfill_command_builds_missing_aggregates(app, upload):
+    upload(make_workbook(20))
+    expected = get_school_performance_sql(1)
+    forget_aggregates()
+
+    result = app.test_cli_runner().invoke(args=['backfill-aggregates'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Backfilled aggregates for 1 school(s)' in result.output
+    exam = Exam.query.one()
+    assert ResultAggregate.query.filter_by(exam_id=exam.id).count() > 0
+    assert ExamStudentSummary.query.filter_by(exam_id=exam.id).count() == 20
+    assert TrendRollup.query.count() > 0
+    assert get_school_performance_sql(1) == expected
+
+
+def test_reads_do_not_write_missing_aggregates(upload):
+    upload(make_workbook(20))
+    forget_aggregates()
+
+    with counted_statements() as statements:
+        assert get_school_performance_sql(1) is None
+
+    assert not any(statement.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')) for statement in statements)
+    assert ResultAggregate.query.count() == 0
@@ -0,0 +1,99 @@
+# tests/test_contacts.py
+import threading
+import email_validator
+import pytest
+from app.services import excel_parser
+from app.services.excel_parser import (
+    ExamParser, PARALLEL_VALIDATION_THRESHOLD, _normalize_email, _normalize_phone
+)
+from app.services.workbook import open_workbook
+from tests.factories import make_workbook
+
+# Parents with several children share contacts; every tenth address is malformed
+DISTINCT_CONTACTS = PARALLEL_VALIDATION_THRESHOLD + 10
+
+
+def contact_email(i):
+    n = i % DISTINCT_CONTACTS
+    return f'parent{n}@example-mail.com' if n % 10 else f'parent{n}@@broken'
+
+
+def contact_phone(i):
+    n = i % DISTINCT_CONTACTS
+    return f'+254 7123456{n:02d}' if n % 10 else f'12{n}'
+
+
+def parse_contacts(contact_workers):
+    parser = ExamParser(contact_workers=contact_workers)
+    workbook = open_workbook(make_workbook(3 * DISTINCT_CONTACTS, emails=contact_email, phones=contact_phone))
+    try:
+        return parser._parse_contacts_sheet(workbook), parser.contact_errors
+    finally:
+        workbook.close()
+
+
+@pytest.fixture
+def deliverability(monkeypatch):
+    """
+    Turn deliverability checks on, but answer them offline; yields the names of the
+    threads that validated each email
+    """
+    threads = []
+
+    def validate_email(email):
+        threads.append(threading.current_thread().name)
+        return email_validator.validate_email(email, check_deliverability=False)
+
+    monkeypatch.setattr(email_validator, 'CHECK_DELIVERABILITY', True)
+    monkeypatch.setattr(excel_parser, 'validate_email', validate_email)
+    _normalize_email.cache_clear()
+    yield threads
+    _normalize_email.cache_clear()
+
+
+def test_thread_pool_validation_matches_serial_validation(deliverability):
+    serial = parse_contacts(contact_workers=None)
+    assert set(deliverability) == {threading.current_thread().name}
+    _normalize_email.cache_clear()
+    deliverability.clear()
+
+    parallel = parse_contacts(contact_workers=8)
+    assert threading.current_thread().name not in deliverability
+
+    contacts, errors = serial
+    assert parallel == serial
+    assert contacts['A1'] == {
+        'parent1_email': 'parent1@example-mail.com',
+        'parent2_email': None,
+        'school_email': None,
+        'parent1_whatsapp': '+254712345601',
+        'parent2_whatsapp': None
+    }
+    assert contacts['A0']['parent1_email'] is None
+    assert len(errors) == 2 * 3 * (DISTINCT_CONTACTS // 10)
+
+
+def test_each_distinct_contact_is_validated_once():
+    _normalize_email.cache_clear()
+    _normalize_phone.cache_clear()
+
+    parse_contacts(contact_workers=None)
+    first = _normalize_email.cache_info(), _normalize_phone.cache_info()
+    parse_contacts(contact_workers=8)
+    second = _normalize_email.cache_info(), _normalize_phone.cache_info()
+
+    # Distinct values are validated once per upload, and repeat uploads only hit the cache
+    for before, after in zip(first, second):
+        assert before.misses == DISTINCT_CONTACTS
+        assert after.misses == before.misses
+        assert after.hits - before.hits == DISTINCT_CONTACTS
+
+
+def test_contacts_validate_serially_without_deliverability_checks(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError('validation should not start a thread pool')
+
+    monkeypatch.setattr(excel_parser, 'ThreadPoolExecutor', no_pool)
+
+    contacts, _ = parse_contacts(contact_workers=8)
+    assert contacts['A1']['parent1_email'] == 'parent1@example-mail.com'
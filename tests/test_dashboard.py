@@ -0,0 +1,107 @@
+# tests/test_dashboard.py
+import pytest
+from sqlalchemy import distinct, event, func
+from app.models import db, AcademicClass, Exam, ExamResult, Subject, User, teacher_subjects
+from app.services import analysis
+from app.views import dashboard
+from tests.factories import make_workbook
+
+
+def add_teacher(subject_name, class_name):
+    """A teacher of school 1 who takes subject_name in every stream of class_name"""
+    teacher = User(username='teacher', email='teacher@example.com', role='teacher', school_id=1)
+    teacher.set_password('password')
+    db.session.add(teacher)
+    db.session.flush()
+    subjects = Subject.query.join(AcademicClass).filter(Subject.name == subject_name,
+                                                         AcademicClass.name == class_name).all()
+    db.session.execute(teacher_subjects.insert(), [
+        {'teacher_id': teacher.id, 'subject_id': subject.id} for subject in subjects
+    ])
+    db.session.commit()
+    return teacher
+
+
+def test_teacher_dashboard_reads_the_aggregate_service(client, login, upload, monkeypatch):
+    upload(make_workbook(20))
+    teacher = add_teacher('Math', 'Form 1')
+    calls = []
+
+    def get_teacher_performance(teacher_id):
+        calls.append(teacher_id)
+        return analysis.get_teacher_performance(teacher_id)
+
+    monkeypatch.setattr(dashboard, 'get_teacher_performance', get_teacher_performance)
+    login(teacher)
+
+    assert client.get('/teacher').status_code == 200
+    assert calls == [teacher.id]
+
+
+def test_teacher_student_count_comes_from_the_summaries(upload):
+    upload(make_workbook(20))
+    teacher = add_teacher('Math', 'Form 1')
+
+    taught = db.session.query(func.count(distinct(ExamResult.student_id))) \
+        .join(teacher_subjects, teacher_subjects.c.subject_id == ExamResult.subject_id) \
+        .filter(teacher_subjects.c.teacher_id == teacher.id) \
+        .scalar()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lower())
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        performance = analysis.get_teacher_performance(teacher.id)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert not any('exam_results' in statement for statement in statements)
+    assert taught == 10
+    assert performance['overall']['total_students'] == taught
+    assert set(performance['by_subject']) == {'Math'}
+
+
+def test_school_distributions_route(client, login, upload):
+    upload(make_workbook(20, marks=lambda i, subject: 40 + i))
+    login(db.session.get(User, 1))
+
+    by_subject = client.get('/school/distributions?by=subject').get_json()
+    assert by_subject['Math']['count'] == 20
+    assert by_subject['Math']['mean'] == pytest.approx(49.5)
+    assert by_subject['Math']['maximum'] == 59
+
+    by_class = client.get('/school/distributions?by=class').get_json()
+    assert set(by_class) == {'Form 1 East', 'Form 1 West', 'Form 2 East', 'Form 2 West'}
+    assert sum(group['count'] for group in by_class.values()) == 20 * 4
+
+    exam_id = Exam.query.one().id
+    assert client.get(f'/school/distributions?by=school&exam_id={exam_id}').get_json()['School']['count'] == 20 * 4
+    assert client.get('/school/distributions?by=school&exam_id=999').get_json() == {}
+
+    response = client.get('/school/distributions?by=parent')
+    assert response.status_code == 400
+    assert 'Unknown distribution grouping' in response.get_json()['error']
+
+
+def test_school_distributions_are_for_school_admins(client, login, upload):
+    upload(make_workbook(20))
+    login(add_teacher('Math', 'Form 1'))
+
+    assert client.get('/school/distributions').status_code == 403
+
+
+def test_kpis_section(client, login, upload):
+    login(db.session.get(User, 1))
+    assert client.get('/school/sections/kpis').get_json() == {'has_data': False}
+
+    upload(make_workbook(20, marks=lambda i, subject: 40 + i))
+    kpis = client.get('/school/sections/kpis').get_json()
+
+    assert kpis['has_data']
+    assert kpis['mean'] == pytest.approx(49.5)
+    assert kpis['total_students'] == kpis['active_students'] == 20
+    assert kpis['total_results'] == 20 * 4
+    assert kpis['total_subjects'] == 3
@@ -0,0 +1,190 @@
+# tests/test_ingest.py
+import io
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import event
+from app.models import (db, AcademicClass, Exam, ExamResult, IngestCheckpoint, School, Student, StudentContact,
+                        Subject)
+from app.services import excel_parser
+from app.services.aggregates import backfill_school_aggregates
+from app.services.student_tables import get_student_page
+from app.views.dashboard import get_recent_exams
+from tests.factories import make_workbook
+from tests.test_analysis import counted_statements
+
+
+@pytest.fixture
+def failing_ranking(monkeypatch):
+    """Make uploads fail after all their results are written, just before the final commit"""
+    def rank_exam(exam_id):
+        raise RuntimeError('ranking failed')
+
+    monkeypatch.setattr(excel_parser, 'rank_exam', rank_exam)
+    return monkeypatch
+
+
+def test_uploads_below_the_threshold_commit_once(upload, failing_ranking):
+    result = upload(make_workbook(20), commit_every=5, commit_threshold=100, resume=True)
+
+    assert result['status'] == 'error'
+    assert Exam.query.count() == 0
+    assert IngestCheckpoint.query.count() == 0
+
+
+def test_failed_chunked_upload_stays_out_of_analytics(upload, failing_ranking):
+    result = upload(make_workbook(30), commit_every=5, commit_threshold=10, resume=True)
+
+    assert result['status'] == 'error'
+    exam = Exam.query.one()
+    assert not exam.is_complete
+    assert ExamResult.query.count() > 0
+    assert IngestCheckpoint.query.one().status == 'failed'
+
+    backfill_school_aggregates(1)
+    assert not exam.student_summaries and not exam.result_aggregates
+    assert get_recent_exams(1) == []
+    assert get_student_page(1, 'Form 1')['exam'] is None
+
+
+def test_resume_completes_a_failed_upload_of_the_same_file(upload, failing_ranking):
+    workbook = make_workbook(30)
+    upload(workbook, commit_every=5, commit_threshold=10, resume=True)
+    failing_ranking.undo()
+
+    result = upload(workbook, commit_every=5, commit_threshold=10, resume=True)
+
+    assert result['status'] == 'success'
+    exam = Exam.query.one()
+    assert exam.is_complete and exam.id == result['exam_id']
+    assert IngestCheckpoint.query.one().status == 'complete'
+    assert ExamResult.query.filter_by(exam_id=exam.id).count() == 30 * 4
+
+
+def test_corrected_upload_discards_the_failed_partial_exam(upload, failing_ranking):
+    upload(make_workbook(30), commit_every=5, commit_threshold=10, resume=True)
+    failing_ranking.undo()
+
+    result = upload(make_workbook(30, seed=2), commit_every=5, commit_threshold=10, resume=True)
+
+    assert result['status'] == 'success'
+    exam = Exam.query.one()
+    assert exam.id == result['exam_id'] and exam.is_complete
+    assert [c.status for c in IngestCheckpoint.query] == ['complete']
+    assert ExamResult.query.filter(ExamResult.exam_id != exam.id).count() == 0
+    assert [e.id for e in get_recent_exams(1)] == [exam.id]
+
+
+def test_upsert_writes_only_the_differences(upload, monkeypatch):
+    upload(make_workbook(10, marks=lambda i, subject: 40 + i))
+
+    # A1's Math mark is edited, A9 is removed and A10 is new
+    workbook = load_workbook(make_workbook(11, marks=lambda i, subject: 40 + i))
+    results = workbook['Student Results']
+    header = [cell.value for cell in results[1]]
+    for row in results.iter_rows(min_row=2):
+        if row[0].value == 'A1':
+            row[header.index('Math')].value = 99
+    results.delete_rows(next(row[0].row for row in results.iter_rows(min_row=2) if row[0].value == 'A9'))
+    edited = io.BytesIO()
+    workbook.save(edited)
+    edited.seek(0)
+
+    process_student_record = excel_parser.ExamParser._process_student_record
+
+    def failing_for_a2(parser, admission_no, student_data, contact_data):
+        if admission_no == 'A2':
+            raise RuntimeError('lookup timed out')
+        return process_student_record(parser, admission_no, student_data, contact_data)
+
+    monkeypatch.setattr(excel_parser.ExamParser, '_process_student_record', failing_for_a2)
+    result = upload(edited, upsert=True)
+
+    assert result['status'] == 'success'
+    assert result['changes'] == {'inserted': 4, 'updated': 1, 'deleted': 4, 'unchanged': 31}
+    marks = {
+        (admission_no, subject, paper): mark for admission_no, subject, paper, mark in db.session.query(
+            Student.admission_number, Subject.name, ExamResult.paper_number, ExamResult.marks
+        ).join(ExamResult, ExamResult.student_id == Student.id).join(Subject, ExamResult.subject_id == Subject.id)
+    }
+    assert len(marks) == 10 * 4
+    assert marks[('A1', 'Math', None)] == 99
+    assert marks[('A2', 'Kiswahili', 2)] == 42
+    assert marks[('A10', 'Math', None)] == 50
+    assert not any(admission_no == 'A9' for admission_no, _, _ in marks)
+
+
+def test_new_students_and_contacts_are_inserted_in_batches(upload):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(' '.join(statement.split()).upper())
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        result = upload(make_workbook(60, emails=lambda i: f'parent{i}@example.com'))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert result['status'] == 'success'
+    assert sum(statement.startswith('INSERT INTO STUDENTS ') for statement in statements) == 1
+    assert sum(statement.startswith('INSERT INTO STUDENT_CONTACTS ') for statement in statements) == 1
+    assert not any(statement.startswith('SELECT') and 'FROM STUDENT_CONTACTS' in statement for statement in statements)
+    contacts = {contact.student.admission_number: contact for contact in StudentContact.query}
+    assert len(contacts) == 60
+    assert contacts['A7'].parent1_email == 'parent7@example.com'
+
+
+def test_remarks_are_stored_verbatim(upload):
+    # COPY must not read the text \N back as NULL, nor an empty remark as NULL
+    remarks = ['\\N', '', 'Good, "steady" work', 'Two\nlines']
+    workbook = load_workbook(make_workbook(len(remarks)))
+    results = workbook['Student Results']
+    column = [cell.value for cell in results[1]].index('Remarks') + 1
+    for row, remark in enumerate(remarks, start=2):
+        results.cell(row=row, column=column, value=remark)
+    edited = io.BytesIO()
+    workbook.save(edited)
+    edited.seek(0)
+
+    assert upload(edited)['status'] == 'success'
+
+    stored = set(db.session.query(Student.admission_number, ExamResult.remark)
+                 .join(ExamResult, ExamResult.student_id == Student.id))
+    assert stored == {(f'A{i}', remark) for i, remark in enumerate(remarks)}
+
+
+def table_counts():
+    return {model.__tablename__: model.query.count()
+            for model in (Exam, ExamResult, Student, StudentContact, Subject, AcademicClass)}
+
+
+def test_dry_run_reports_problems_and_new_records_without_writing(upload):
+    upload(make_workbook(10))
+    exam_id = Exam.query.one().id
+    before = table_counts(), db.session.get(School, 1).data_version
+
+    # Students 10-13 are new; 11 joins a new class and 12's row is dropped for its unreadable Math mark
+    workbook = make_workbook(6, first_student=8, subjects=('Math', 'English', 'Chemistry'),
+                             classes=('Form 1', 'Form 2', 'Form 3'),
+                             marks=lambda i, subject: 'abc' if (i, subject) == (12, 'Math') else 50)
+    result = upload(workbook, dry_run=True)
+
+    report = result['report']
+    assert result['status'] == 'error' and not report['valid']
+    assert report['exam']['existing_exam_id'] == exam_id
+    assert [(error['row'], error['admission_no']) for error in report['row_errors']] == [(6, 'A12')]
+    assert report['students'] == 5 and report['new_students'] == 3
+    assert report['new_classes'] == ['Form 3 West']
+    assert report['new_subjects'] == 6  # Chemistry for three existing classes, every subject for Form 3
+    assert (table_counts(), db.session.get(School, 1).data_version) == before
+
+
+def test_repeated_dry_runs_are_served_from_the_lookup_cache(upload):
+    upload(make_workbook(10))
+    assert upload(make_workbook(10), dry_run=True)['status'] == 'success'
+
+    with counted_statements() as statements:
+        result = upload(make_workbook(10), dry_run=True)
+
+    assert result['report']['exam']['existing_exam_id'] == Exam.query.one().id
+    assert statements == []
@@ -0,0 +1,94 @@
+# tests/test_instrumentation.py
+import logging
+import re
+import pytest
+from app.models import db, User
+from app.services import excel_parser
+from tests.factories import make_workbook
+
+STAGES = ('open_workbook', 'parse_metadata', 'parse_contacts', 'parse_subjects', 'parse_results',
+          'resolve_students', 'create_exam', 'write_results', 'rank_positions', 'refresh_aggregates',
+          'refresh_trends', 'commit')
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def parser_log():
+    handler = Records()
+    logger = logging.getLogger(excel_parser.__name__)
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler.records
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+
+
+def metric_value(text, line):
+    match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_upload_result_reports_stage_timings(upload):
+    timings = upload(make_workbook(10))['timings']
+
+    stages = timings['stages']
+    assert set(STAGES) <= set(stages)
+    assert stages['parse_results']['rows'] == 10
+    assert stages['resolve_students']['rows'] == 10
+    assert stages['write_results']['rows'] == 10 * 4
+    assert stages['write_results']['sql_statements'] > 0
+    assert all(stage['calls'] >= 1 and stage['wall_ms'] >= 0 for stage in stages.values())
+    assert timings['total_sql_statements'] == sum(stage['sql_statements'] for stage in stages.values())
+
+
+def test_stage_timings_are_logged_as_a_structured_record(upload, parser_log):
+    result = upload(make_workbook(10))
+
+    [record] = [record for record in parser_log if hasattr(record, 'timings')]
+    assert record.pipeline == 'ingest'
+    assert record.school_id == 1
+    assert record.timings == result['timings']
+
+
+def test_metrics_count_each_upload_stage(client, login, app, upload):
+    series = 'exam_analysis_stage_seconds_count{pipeline="ingest",stage="write_results"}'
+    app.config['METRICS_TOKEN'] = 'secret'
+    scrape = lambda: client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    before = metric_value(scrape().get_data(as_text=True), series)
+
+    upload(make_workbook(10))
+
+    response = scrape()
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert metric_value(text, series) == before + 1
+    assert 'exam_analysis_analytics_cache_entries{backend="lru"}' in text
+
+
+def test_metrics_require_the_token_or_an_admin(client, login, app):
+    app.config['METRICS_TOKEN'] = None
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 403
+
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+    login(db.session.get(User, 1))
+    assert client.get('/metrics').status_code == 403
+
+    admin = User(username='root', email='root@example.com', role='admin')
+    admin.set_password('password')
+    db.session.add(admin)
+    db.session.commit()
+    client.get('/auth/logout')
+    login(admin)
+    assert client.get('/metrics').status_code == 200
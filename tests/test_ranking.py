@@ -0,0 +1,41 @@
+# tests/test_ranking.py
+from sqlalchemy import event
+from app.models import db, AcademicClass, ExamStudentSummary, Student
+from tests.factories import make_workbook
+
+
+def test_streams_of_a_class_are_ranked_separately(upload):
+    # Student i scores i in every subject and sits in East when i is even, West when odd
+    result = upload(make_workbook(20, classes=('Form 1',), streams=('East', 'West'), marks=lambda i, subject: i))
+    assert result['status'] == 'success'
+
+    assert sorted(stream for stream, in db.session.query(AcademicClass.stream)) == ['East', 'West']
+    positions = {
+        admission_no: (class_position, stream_position)
+        for admission_no, class_position, stream_position in db.session.query(
+            Student.admission_number, ExamStudentSummary.class_position, ExamStudentSummary.stream_position
+        ).join(ExamStudentSummary, ExamStudentSummary.student_id == Student.id)
+    }
+    assert positions['A19'] == (1, 1)
+    assert positions['A18'] == (2, 1)
+    assert positions['A0'] == (20, 10)
+
+
+def test_reranking_an_unchanged_exam_rewrites_no_results(upload):
+    workbook = make_workbook(20)
+    upload(workbook)
+    written = []
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('UPDATE EXAM_RESULTS'):
+            written.append(cursor.rowcount)
+
+    event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+    try:
+        workbook.seek(0)
+        result = upload(workbook, upsert=True)
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', after_cursor_execute)
+
+    assert result['changes']['unchanged'] == 20 * 4
+    assert sum(written) == 0
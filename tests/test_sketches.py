@@ -0,0 +1,30 @@
+# tests/test_sketches.py
+import pytest
+from sqlalchemy import Float, literal, select
+from app.models import db, ResultAggregate
+from app.services.grading import GRADE_BOUNDARIES, calculate_grade
+from app.services.sketches import MarkDistribution, histogram_bin
+from tests.factories import make_workbook
+
+BOUNDARY_MARKS = [0.4, 49.4, 49.5, 49.6, 49.99, 50.0, 50.5, 69.5, 79.4, 79.5, 79.99, 80.0, 99.9, 100.0]
+
+
+@pytest.mark.parametrize('mark, expected', [
+    (49.5, 49), (49.6, 49), (49.99, 49), (50.0, 50), (79.5, 79), (79.99, 79), (80.0, 80), (-1.0, 0), (104.0, 100)
+])
+def test_marks_fall_in_the_bin_of_their_whole_mark(app, mark, expected):
+    assert db.session.execute(select(histogram_bin(literal(mark, Float)))).scalar() == expected
+
+
+def test_share_below_a_boundary_agrees_with_grading(upload):
+    result = upload(make_workbook(len(BOUNDARY_MARKS), subjects=['Math'], classes=('Form 1',), streams=('East',),
+                                  marks=lambda i, subject: BOUNDARY_MARKS[i]))
+    assert result['status'] == 'success'
+
+    distribution = MarkDistribution.from_aggregate(ResultAggregate.query.one())
+    grades = [calculate_grade(mark) for mark in BOUNDARY_MARKS]
+    for grade, lowest in GRADE_BOUNDARIES:
+        below = sum(1 for mark in BOUNDARY_MARKS if mark < lowest)
+        assert distribution.share_below(lowest) == pytest.approx(below * 100 / len(BOUNDARY_MARKS)), grade
+        # Letter grades sort best first, so worse grades compare greater
+        assert below == sum(1 for g in grades if g > grade), grade
@@ -0,0 +1,78 @@
+# tests/test_student_tables.py
+import base64
+import json
+import pytest
+from app.models import db, User
+from app.services.student_tables import encode_cursor, get_student_page
+from tests.factories import make_workbook
+
+
+def walk_pages(limit, **options):
+    """Follow next_cursor from the first page to the last; returns each page's student ids"""
+    pages, cursor = [], None
+    while True:
+        page = get_student_page(1, 'Form 1', limit=limit, cursor=cursor, **options)
+        pages.append([student['id'] for student in page['students']])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.fixture
+def tied_totals(upload):
+    """Eleven Form 1 students whose totals tie in threes and fours"""
+    upload(make_workbook(11, classes=('Form 1',), marks=lambda i, subject: 50 + i % 3))
+
+
+@pytest.mark.parametrize('order', ['desc', 'asc'])
+def test_cursors_walk_tied_totals_without_gaps_or_repeats(tied_totals, order):
+    everyone = get_student_page(1, 'Form 1', order=order, limit=100)['students']
+    expected = sorted(everyone, key=lambda student: (student['total_score'], student['id']),
+                      reverse=order == 'desc')
+
+    pages = walk_pages(3, order=order)
+
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert [student_id for page in pages for student_id in page] == [student['id'] for student in expected]
+
+
+def test_subject_sort_places_students_without_the_mark_last(upload):
+    # Students 2, 5 and 8 sat no Math paper; the rest score 40 + i
+    upload(make_workbook(10, classes=('Form 1',),
+                         marks=lambda i, subject: None if subject == 'Math' and i % 3 == 2 else 40 + i))
+    everyone = get_student_page(1, 'Form 1', sort='subject:Math', limit=100)['students']
+    ids = {student['name']: student['id'] for student in everyone}
+    without_math = sorted((ids[f'Student {i}'] for i in (2, 5, 8)), reverse=True)
+
+    pages = walk_pages(2, sort='subject:Math')
+    walked = [student_id for page in pages for student_id in page]
+
+    assert walked[-3:] == without_math
+    assert walked[:7] == [ids[f'Student {i}'] for i in (9, 7, 6, 4, 3, 1, 0)]
+    assert all('Math' not in student['scores'] for student in everyone if student['id'] in without_math)
+
+    ascending = [student_id for page in walk_pages(2, sort='subject:Math', order='asc') for student_id in page]
+    assert ascending == list(reversed(walked))
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    base64.urlsafe_b64encode(b'{"value": 1}').decode(),
+    base64.urlsafe_b64encode(json.dumps(['high', 1]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps([None, 1]).encode()).decode(),
+    encode_cursor(100, 1)[:-4]
+])
+def test_tampered_cursors_are_rejected(tied_totals, cursor):
+    with pytest.raises(ValueError, match='Invalid page cursor'):
+        get_student_page(1, 'Form 1', cursor=cursor)
+
+
+def test_student_page_endpoint_answers_a_tampered_cursor_with_bad_request(tied_totals, client, login):
+    login(db.session.get(User, 1))
+
+    first = client.get('/school/students?class=Form 1&limit=5').get_json()
+    assert len(first['students']) == 5 and first['next_cursor']
+
+    response = client.get('/school/students?class=Form 1&cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid page cursor'}
@@ -0,0 +1,61 @@
+# tests/test_trends.py
+from datetime import datetime
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import db, Exam, TrendRollup
+from app.services.trends import month_bucket, refresh_school_trends, trend_series
+from tests.factories import make_workbook
+from tests.test_analysis import counted_statements
+
+
+@pytest.mark.parametrize('dialect, expected', [
+    (sqlite.dialect(), "strftime('%Y-%m', exams.exam_date)"),
+    (postgresql.dialect(), "to_char(exams.exam_date, 'YYYY-MM')")
+], ids=['sqlite', 'postgresql'])
+def test_month_bucket_compiles_for_each_database(dialect, expected):
+    assert expected in str(select(month_bucket(Exam.exam_date)).compile(dialect=dialect))
+
+
+def test_month_bucket_labels_dates_on_the_test_database(app):
+    db.session.add(Exam(name='Opener', school_id=1, exam_date=datetime(2024, 3, 31, 23, 59)))
+    db.session.flush()
+
+    assert db.session.query(month_bucket(Exam.exam_date)).scalar() == '2024-03'
+
+
+@pytest.fixture
+def three_exams(upload):
+    """Two first-term exams in January (marks 40 and 60) and a second-term exam in March (marks 80)"""
+    for exam, start_date, semester, mark in (('Opener', '2024-01-15', 1, 40), ('Mid Term', '2024-01-30', 1, 60),
+                                             ('End Term', '2024-03-20', 2, 80)):
+        upload(make_workbook(10, exam=exam, start_date=start_date, semester=semester,
+                             marks=lambda i, subject: mark))
+
+
+def series(period_type, **options):
+    return [(row['period'], row['mean'], row['exam_count']) for row in trend_series(1, period_type, **options)]
+
+
+def test_rollups_bucket_exams_by_month_and_term(three_exams):
+    assert series('month') == [('2024-01', 50, 2), ('2024-03', 80, 1)]
+    assert series('term') == [('2024 Term 1', 50, 2), ('2024 Term 2', 80, 1)]
+    assert series('month', limit=1) == [('2024-03', 80, 1)]
+
+    term = TrendRollup.query.filter_by(period_type='term', period='2024 Term 1').one()
+    assert term.period_start == datetime(2024, 1, 15)
+    assert TrendRollup.query.filter_by(period_type='month', period='2024-01').one().period_start == datetime(2024, 1, 1)
+
+    with pytest.raises(ValueError):
+        trend_series(1, 'week')
+
+
+def test_refresh_rebuilds_rollups_from_aggregates_alone(three_exams):
+    before = series('month'), series('term')
+    db.session.query(TrendRollup).delete()
+
+    with counted_statements() as statements:
+        assert refresh_school_trends(1) == 4
+
+    assert (series('month'), series('term')) == before
+    assert not [statement for statement in statements if 'exam_results' in statement]
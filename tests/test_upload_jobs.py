@@ -0,0 +1,133 @@
+# tests/test_upload_jobs.py
+import io
+import json
+import threading
+import zipfile
+import pytest
+from app.models import db, Exam, ExamStudentSummary, School, UploadJob, User
+from app.services import upload_jobs
+from tests.factories import make_workbook
+
+
+def test_batch_of_workbooks_builds_one_exam_ranked_once(app, tmp_path):
+    archive = tmp_path / 'batch.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('east.xlsx', make_workbook(10, classes=('Form 1',), streams=('East',)).getvalue())
+        zf.writestr('west.xlsx', make_workbook(10, classes=('Form 1',), streams=('West',), first_student=10,
+                                               marks=lambda i, subject: i).getvalue())
+    job = UploadJob(id='batch', school_id=1, uploader_id=1, filename=archive.name, file_path=str(archive),
+                    state='queued')
+    db.session.add(job)
+    db.session.commit()
+    app.config['BATCH_PARSE_PROCESSES'] = 1
+
+    upload_jobs.run_batch_job(app, job.id)
+
+    db.session.refresh(job)
+    assert job.state == 'succeeded'
+    exam = Exam.query.one()
+    assert exam.is_complete
+    assert {workbook['exam_id'] for workbook in json.loads(job.summary)['workbooks']} == {exam.id}
+    positions = sorted(position for position, in db.session.query(ExamStudentSummary.class_position)
+                       .filter_by(exam_id=exam.id))
+    assert positions == list(range(1, 21))
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Hold submitted jobs instead of running them; each entry is (runner, app, job_id, options)"""
+    submitted = []
+
+    class Executor:
+        def submit(self, *call):
+            submitted.append(call)
+
+    monkeypatch.setattr(upload_jobs, 'get_executor', Executor)
+    return submitted
+
+
+def add_user(email, school_id):
+    user = User(username=email.split('@')[0], email=email, role='school_admin', school_id=school_id)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def post_upload(client, workbook):
+    return client.post('/upload/upload', data={
+        'exam_name': 'Mid Term',
+        'exam_date': '2024-03-01',
+        'file': (workbook, 'results.xlsx')
+    }, headers={'Accept': 'application/json'})
+
+
+def test_job_status_follows_the_job_through_its_states(client, login, queued, monkeypatch):
+    login(db.session.get(User, 1))
+    response = post_upload(client, make_workbook(10))
+    assert response.status_code == 202
+    status_url = response.headers['Location']
+    assert client.get(status_url).get_json()['state'] == 'queued'
+
+    seen = []
+    process_exam_upload = upload_jobs.process_exam_upload
+
+    def polling_upload(*args, **kwargs):
+        # Poll from another thread, as a browser request would, so it gets its own session
+        poll = threading.Thread(target=lambda: seen.append(client.get(status_url).get_json()['state']))
+        poll.start()
+        poll.join()
+        return process_exam_upload(*args, **kwargs)
+
+    monkeypatch.setattr(upload_jobs, 'process_exam_upload', polling_upload)
+    runner, app, job_id, options = queued.pop()
+    runner(app, job_id, options)
+
+    status = client.get(status_url).get_json()
+    assert seen == ['running']
+    assert status['state'] == 'succeeded'
+    assert status['exam_id'] == Exam.query.one().id
+    assert status['progress']['students_processed'] == 10
+    assert status['started_at'] and status['finished_at']
+
+
+def test_job_status_reports_a_failed_upload(client, login, queued):
+    login(db.session.get(User, 1))
+    status_url = post_upload(client, io.BytesIO(b'not a workbook')).headers['Location']
+
+    runner, app, job_id, options = queued.pop()
+    runner(app, job_id, options)
+
+    status = client.get(status_url).get_json()
+    assert status['state'] == 'failed'
+    assert status['message'] and status['finished_at']
+    assert Exam.query.count() == 0
+
+
+def test_job_status_is_scoped_to_the_users_school(client, login, queued):
+    login(db.session.get(User, 1))
+    status_url = post_upload(client, make_workbook(10)).headers['Location']
+    client.get('/auth/logout')
+
+    other = School(name='Other School', is_active=True)
+    db.session.add(other)
+    db.session.commit()
+    login(add_user('other@example.com', other.id))
+
+    assert client.get(status_url).status_code == 404
+    assert client.get('/upload/jobs/no-such-job').status_code == 404
+
+
+def test_users_without_a_school_cannot_queue_uploads(client, login, queued):
+    login(add_user('nobody@example.com', None))
+
+    response = post_upload(client, make_workbook(10))
+    assert response.status_code == 302
+    batch = client.post('/upload/batch', data={'file': (io.BytesIO(b''), 'batch.zip')},
+                        headers={'Accept': 'application/json'})
+    assert batch.status_code == 302
+
+    with client.session_transaction() as session:
+        assert [message for _, message in session['_flashes']] == ['User is not associated with any school'] * 2
+    assert queued == []
+    assert UploadJob.query.count() == 0
@@ -0,0 +1,147 @@
+# tests/test_workbook.py
+import gc
+from datetime import date
+import tracemalloc
+import pytest
+from openpyxl import Workbook
+from app.services import upload_jobs
+from app.services.excel_parser import ExamParser
+from app.services.workbook import BundleWorkbook, StreamingExcelWorkbook, ExcelWorkbook, prefers_streaming
+from app.models import db, Exam, ExamResult, Student, Subject, UploadJob
+from tests.factories import make_bundle, make_workbook
+
+
+def write_results_sheet(path, rows, subjects=20):
+    """An .xlsx file holding a Student Results sheet of rows students"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Student Results')
+    sheet.append(['AdmissionNo', 'StudentName', 'Class', 'Stream'] + [f'Subject{j}' for j in range(subjects)])
+    for i in range(rows):
+        marks = [(i * 7 + j) % 100 for j in range(subjects)]
+        sheet.append([f'A{i}', f'Student {i}', f'Form {i % 4 + 1}', 'East'] + marks)
+    workbook.save(path)
+
+
+def peak_bytes(read):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        read()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def read_streaming(path):
+    with open(path, 'rb') as file_stream:
+        workbook = StreamingExcelWorkbook(file_stream)
+        for chunk, _ in workbook.iter_sheet_chunks('Student Results', 100):
+            pass
+        workbook.close()
+
+
+def read_whole(path):
+    with open(path, 'rb') as file_stream:
+        workbook = ExcelWorkbook(file_stream)
+        workbook.read_sheet('Student Results')
+        workbook.close()
+
+
+def test_streaming_memory_grows_far_slower_than_whole_sheet_reads(tmp_path):
+    # Peak Python allocations rather than RSS, which the allocator never gives back.
+    # Only the workbook's shared strings grow with the row count when streaming.
+    small, large = tmp_path / 'small.xlsx', tmp_path / 'large.xlsx'
+    write_results_sheet(small, 250)
+    write_results_sheet(large, 2000)
+    read_streaming(small)
+
+    streaming_growth = peak_bytes(lambda: read_streaming(large)) - peak_bytes(lambda: read_streaming(small))
+    whole_growth = peak_bytes(lambda: read_whole(large)) - peak_bytes(lambda: read_whole(small))
+
+    assert streaming_growth * 3 < whole_growth
+
+
+def test_prefers_streaming_for_large_zip_based_uploads(tmp_path):
+    workbook = tmp_path / 'results.xlsx'
+    workbook.write_bytes(make_workbook(10).getvalue())
+    legacy = tmp_path / 'results.xls'
+    legacy.write_bytes(b'\xd0\xcf\x11\xe0' + b'\0' * 4096)
+
+    assert prefers_streaming(workbook, 0)
+    assert not prefers_streaming(workbook, workbook.stat().st_size + 1)
+    assert not prefers_streaming(workbook, None)
+    assert not prefers_streaming(legacy, 0)
+
+
+def test_upload_job_streams_files_above_the_threshold(app, tmp_path, monkeypatch):
+    calls = []
+
+    def process_exam_upload(file_stream, **options):
+        calls.append(options)
+        return {'status': 'error', 'message': 'stopped'}
+
+    monkeypatch.setattr(upload_jobs, 'process_exam_upload', process_exam_upload)
+    for min_bytes in (0, 100 * 1024 * 1024):
+        path = tmp_path / f'{min_bytes}.xlsx'
+        path.write_bytes(make_workbook(10).getvalue())
+        job = UploadJob(id=str(min_bytes), school_id=1, uploader_id=1, filename=path.name, file_path=str(path),
+                        state='queued')
+        db.session.add(job)
+        db.session.commit()
+        app.config['INGEST_STREAMING_MIN_BYTES'] = min_bytes
+        upload_jobs.run_upload_job(app, job.id)
+
+    assert [options['streaming'] for options in calls] == [True, False]
+
+
+def bundle_marks(i, subject):
+    return (i * 7 + len(subject)) % 80 + 20
+
+
+def stored_results():
+    return (db.session.query(Student.admission_number, Subject.name, ExamResult.paper_number, ExamResult.marks)
+            .join(ExamResult.student)
+            .join(ExamResult.subject)
+            .order_by(Student.admission_number, Subject.name, ExamResult.paper_number)
+            .all())
+
+
+@pytest.mark.parametrize('format', ['csv', 'parquet'])
+def test_bundles_ingest_the_same_results_as_the_workbook(app, format):
+    parser = ExamParser()
+    success, message = parser.parse_excel(make_bundle(format, students=12, marks=bundle_marks), 1, 1)
+    assert success, message
+    exam = Exam.query.one()
+    assert (exam.name, exam.exam_date.date(), exam.academic_year) == ('Mid Term', date(2024, 3, 1), '2024')
+    assert format in exam.upload_format
+    results = stored_results()
+    assert len(results) == 48
+    assert ('A3', 'Math', None, bundle_marks(3, 'Math')) in results
+    assert ('A3', 'Kiswahili', 2, bundle_marks(3, 'Kiswahili_Paper2')) in results
+
+    # The same sheets as a workbook change nothing
+    parser = ExamParser()
+    success, message = parser.parse_excel(make_workbook(12, marks=bundle_marks), 1, 1, upsert=True)
+    assert success, message
+    assert parser.change_summary == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 48}
+    assert stored_results() == results
+
+
+def test_parquet_bundles_stream_in_chunks(app, monkeypatch):
+    chunks = []
+    iter_sheet_chunks = BundleWorkbook.iter_sheet_chunks
+
+    def recorded_chunks(self, sheet_name, chunk_size):
+        for df, first_row in iter_sheet_chunks(self, sheet_name, chunk_size):
+            chunks.append((len(df), first_row))
+            yield df, first_row
+
+    monkeypatch.setattr(BundleWorkbook, 'iter_sheet_chunks', recorded_chunks)
+    parser = ExamParser()
+    success, message = parser.parse_excel(make_bundle('parquet', students=12, marks=bundle_marks), 1, 1,
+                                          streaming=True, chunk_size=5)
+
+    assert success, message
+    assert chunks == [(5, 2), (5, 7), (2, 12)]
+    assert parser.students_processed == 12
+    assert len(stored_results()) == 48